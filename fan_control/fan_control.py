@@ -3,94 +3,170 @@
 # Each node has 4 too small fans with max speed of 21000 RPM)
 
 # We use IPMI services to set fan speed based of temmperatures coming from various sensors
-# This script runs endlessly and sets the 4 fan speeds every 30 seconds based on maximum temperature reading.
+# This script runs endlessly and sets the 4 fan speeds based on maximum temperature reading, every 2 seconds
+# when the temperatures move fast and up to every 2 minutes when they are flat.
 
 # The sript is made the most verbose possible, each IPMI command sent to the system is displayed.
 
 # usage (need root access) : sudo python fan_control.py
 
-# This table has been filled manually based on the noise level observed when running some cpu-intensive tasks (pyaf benchmarks).
-# interpretation : When the max temperature is between 35C and 45C, set the fan speed to 20% of max speed.
+# The sensors, actuators and controllers are in the fan_control_*.py modules next to this script,
+# fan_control_simulator.py runs the controllers on a recorded trace or on a thermal model.
 
-CPU_TEMPERATURE_FAN_SPEED_MAPPING = {35 : 18, 45 : 22 , 55 : 25, 60 : 30, 65 : 35 , 75 : 40, 80 : 45 , 90 : 50}
+from fan_control_sensors import SERVER_NAME, check_server_name, IPMISessionError, cBMCNode, LOCAL_BMC_NODE, FAKE_BMC_HOST
+from fan_control_sensors import CONTROL_SENSOR_KINDS, read_sensor_snapshot, get_temperatures
+from fan_control_actuators import set_fan_duties
+from fan_control_controllers import FAN_SPEED_CONTROLLERS, PID_SETPOINT, create_zones, compute_zone_duties, get_duty_ceiling, cPollScheduler
+from fan_control_history import HISTORY_CAPACITY, HISTORY_DUMP_SECONDS, METRICS_PORT, cSampleHistory, start_metrics_server
+from fan_control_history import THERMAL_STATUS_FILE, publish_thermal_status
 
 def set_fan_zone_level():
     return
 
-def get_values(label, cmd):
-    print("EXECUTING" , label, cmd)
-    import subprocess
-    ls = subprocess.call(cmd + " > /tmp/fan_control_command_output.txt", shell=True)
-    output = []
-    with open("/tmp/fan_control_command_output.txt") as f:
-        output = f.readlines()[0][:-1]
-    print("OUTPUT" , label, output)
-    return output
-
-def set_fan_speed(percentage_of_max):
-    print("SET_FAN_SPEED_PERCENTAGE" , percentage_of_max)
-    # values are from 0 to 64, 0 is smart Fan (bios control), 1 is the minimum speed, and 64 is full speed
-    ipmi_value = int(64 * percentage_of_max / 100)
-    # avoid too extermal values
-    ipmi_value = max(12 , ipmi_value)
-    ipmi_value = min(60 , ipmi_value)
-    ipmi_value = str(ipmi_value)
-    cmd = "/usr/sbin/ipmi-raw 00 3a 01 "
-    cmd = cmd + " " + ipmi_value + " " + ipmi_value + " " + ipmi_value + " " + ipmi_value 
-    cmd = cmd + " " + ipmi_value + " " + ipmi_value + " " + ipmi_value + " " + ipmi_value 
-    l_exec_status = get_values("SET_FAN_SPEED", cmd) 
-    print(l_exec_status)
-
-def get_fan_speeds():
-    l_fan_speed_cmd = "/usr/sbin/ipmi-sensors   | grep Fan | grep -v 'N/A'  | cut -f 4 -d '|' | xargs"
-    l_fan_speeds = get_values("READ_FAN_SPEED", l_fan_speed_cmd).split(" ")
-    l_fan_speeds = [float(x) for x in l_fan_speeds]
-    print("READ_FAN_SPEED", l_fan_speeds)
-    return l_fan_speeds
-
-def get_temperatures():
-    l_temperature_cmd = "/usr/sbin/ipmi-sensors   | grep Temperature | grep -v 'N/A'  | cut -f 4 -d '|' | xargs"
-    l_temperatures = get_values("TEMPERATURE", l_temperature_cmd).split(" ")
-    l_temperatures = [float(x) for x in l_temperatures]
-    print("TEMPERATURE", l_temperatures)
-    return l_temperatures
-
-def check_server_name():
-    l_prod_cmd = "cat /sys/class/dmi/id/board_vendor  /sys/class/dmi/id/product_name /sys/class/dmi/id/board_name | xargs"
-    l_prod_name = get_values("CHECK_SERVER_MODEL", l_prod_cmd)
-    return(l_prod_name)
-
-def get_interpolated_percentage(max_temp):
-    max_temp_boundary_high = min([x for x in CPU_TEMPERATURE_FAN_SPEED_MAPPING.keys() if max_temp <= x] + [90])
-    max_temp_boundary_low = max([35] + [x for x in CPU_TEMPERATURE_FAN_SPEED_MAPPING.keys() if x <= max_temp ])
-    percentage_of_max_high = CPU_TEMPERATURE_FAN_SPEED_MAPPING.get(max_temp_boundary_high)
-    percentage_of_max_low = CPU_TEMPERATURE_FAN_SPEED_MAPPING.get(max_temp_boundary_low)
-    percentage_of_max = percentage_of_max_high
-    if(percentage_of_max_high > percentage_of_max_low):
-        percentage_of_max = percentage_of_max_low + (max_temp - max_temp_boundary_low) / (max_temp_boundary_high - max_temp_boundary_low) * (percentage_of_max_high - percentage_of_max_low)
-    print("INTERPOLATED_DATA" , (max_temp_boundary_low, max_temp_boundary_high, percentage_of_max_low, percentage_of_max_high), max_temp , percentage_of_max)
-    return percentage_of_max
-
-def run():
+def run(zones, history = None, status_file = None):
     server_name = check_server_name()
-    if(server_name != "ASRockRack 2U4N-F/X200 X200D6HM"):
+    if(server_name != SERVER_NAME):
         print("THIS_SCRIPT_IS_ONLY_TO_BE_USED_ON_A" +  "2U4N-F/X200" + " SERVER !!!!!")
         return
     import time
+    l_scheduler = cPollScheduler()
     while(0 == 0):
         print("Start : %s" % time.ctime())
-        get_fan_speeds()
-        l_temps = get_temperatures()
-        max_temp = max(l_temps)
-        print("MAX_TEMP" , max_temp)
-        percentage_of_max = get_interpolated_percentage(max_temp)
-        set_fan_speed(percentage_of_max + 5)
-        # wait for fans to stabilize !!!
-        time.sleep( 1 )
-        get_fan_speeds()
-        lSeconds = 10
+        try:
+            # one SDR walk per cycle, the fan speeds resulting from this cycle are read by the next one.
+            l_snapshot = read_sensor_snapshot(CONTROL_SENSOR_KINDS)
+            l_scheduler.add_sample(l_snapshot.mTimestamp, l_snapshot.get_named_values("Temperature"))
+            l_temps = get_temperatures(l_snapshot)
+            print("MAX_TEMP" , max(l_temps))
+            l_duties = compute_zone_duties(zones, [l_snapshot], l_snapshot.mTimestamp)
+            l_written = set_fan_duties(l_duties)
+            if(history is not None):
+                history.add_sample(l_snapshot.mTimestamp, l_snapshot.get_named_values("Temperature"),
+                                   l_snapshot.get_named_values("Fan"), LOCAL_BMC_NODE.mLastDuties)
+            if(status_file is not None):
+                publish_thermal_status(status_file, l_snapshot.mTimestamp, l_snapshot.get_named_values("Temperature"),
+                                       LOCAL_BMC_NODE.mLastDuties, get_duty_ceiling(zones))
+            if(l_written):
+                # wait for fans to stabilize !!!
+                time.sleep( 1 )
+        except (IPMISessionError, ValueError) as e:
+            # keep the last fan setting and retry at the next cycle
+            print("IPMI_ERROR", str(e))
+        lSeconds = l_scheduler.get_next_interval()
         print("SLEEPING_FOR" , lSeconds , "seconds.")
         time.sleep( lSeconds )
 
+# Cluster mode : the 4 nodes of a 2U4N chassis share the same airflow. One process polls all the BMCs
+# over IPMI over LAN at the same time, computes one fan speed from the temperatures of all the nodes
+# and sets it on every node. A BMC that does not answer within CLUSTER_POLL_TIMEOUT seconds is skipped for this cycle.
+#
+# usage : python fan_control.py --cluster nodes.txt
+# nodes.txt has one node per line : name host user password (use the host "fake" for a simulated BMC)
+CLUSTER_POLL_TIMEOUT = 20.0
+
+def read_cluster_nodes(nodes_file):
+    l_nodes = []
+    with open(nodes_file) as f:
+        for l_line in f:
+            l_fields = l_line.split("#")[0].split()
+            if(len(l_fields) == 0):
+                continue
+            if(len(l_fields) == 2 and l_fields[1] == FAKE_BMC_HOST):
+                l_fields = l_fields + ["", ""]
+            if(len(l_fields) != 4):
+                raise ValueError("INVALID_NODE_LINE " + l_line.strip())
+            l_nodes.append(cBMCNode(l_fields[0], l_fields[1], l_fields[2], l_fields[3]))
+    return l_nodes
+
+def run_on_nodes(pool, nodes, label, function, pending):
+    # runs function(node) on all the nodes at the same time, returns {node name : result} for the nodes that answered.
+    # pending keeps the calls that are still running, a node is not called again before its previous call ends.
+    import concurrent.futures
+    l_futures = {}
+    for l_node in nodes:
+        l_previous = pending.get(l_node.mName)
+        if(l_previous is not None and not l_previous.done()):
+            print("NODE_STILL_BUSY", label, l_node.mName)
+            continue
+        l_futures[l_node.mName] = pool.submit(function, l_node)
+        pending[l_node.mName] = l_futures[l_node.mName]
+    concurrent.futures.wait(list(l_futures.values()), timeout = CLUSTER_POLL_TIMEOUT)
+    l_results = {}
+    for (l_name, l_future) in l_futures.items():
+        if(not l_future.done()):
+            print("NODE_TIMEOUT", label, l_name)
+        elif(l_future.exception() is not None):
+            print("NODE_ERROR", label, l_name, str(l_future.exception()))
+        else:
+            l_results[l_name] = l_future.result()
+    return l_results
+
+def run_cluster(nodes_file, zones, history = None, status_file = None):
+    import concurrent.futures, time
+    l_nodes = read_cluster_nodes(nodes_file)
+    print("CLUSTER_NODES", [(x.mName, x.mHost) for x in l_nodes])
+    if(history is not None):
+        # the history has the columns of all the nodes, even of the ones missing the first cycle
+        history.set_nodes([x.mName for x in l_nodes])
+    l_pool = concurrent.futures.ThreadPoolExecutor(max_workers = len(l_nodes))
+    l_pending = {}
+    l_scheduler = cPollScheduler()
+    while(0 == 0):
+        print("Start : %s" % time.ctime())
+        l_snapshots = run_on_nodes(l_pool, l_nodes, "READ_SENSORS",
+                                   lambda node : read_sensor_snapshot(CONTROL_SENSOR_KINDS, node), l_pending)
+        l_temps = []
+        for (l_name, l_snapshot) in l_snapshots.items():
+            l_temps = l_temps + get_temperatures(l_snapshot)
+            l_scheduler.add_sample(l_snapshot.mTimestamp, l_snapshot.get_named_values("Temperature", l_name + ":"))
+        if(len(l_temps) > 0):
+            max_temp = max(l_temps)
+            print("CHASSIS_MAX_TEMP" , max_temp, "NODES", sorted(l_snapshots.keys()))
+            l_timestamp = min([x.mTimestamp for x in l_snapshots.values()])
+            l_duties = compute_zone_duties(zones, list(l_snapshots.values()), l_timestamp)
+            l_written = run_on_nodes(l_pool, l_nodes, "SET_FAN_SPEED",
+                                     lambda node : set_fan_duties(l_duties, node), l_pending)
+            (l_temperatures, l_fans) = ({}, {})
+            for (l_name, l_snapshot) in l_snapshots.items():
+                l_temperatures.update(l_snapshot.get_named_values("Temperature", l_name + ":"))
+                l_fans.update(l_snapshot.get_named_values("Fan", l_name + ":"))
+            if(history is not None):
+                history.add_sample(l_timestamp, l_temperatures, l_fans, l_duties)
+            if(status_file is not None):
+                publish_thermal_status(status_file, l_timestamp, l_temperatures, l_duties, get_duty_ceiling(zones))
+            if(any(l_written.values())):
+                # wait for fans to stabilize !!!
+                time.sleep( 1 )
+        else:
+            print("NO_TEMPERATURE_READ_ON_ANY_NODE")
+        lSeconds = l_scheduler.get_next_interval()
+        print("SLEEPING_FOR" , lSeconds , "seconds.")
+        time.sleep( lSeconds )
+
+def main():
+    import argparse
+    l_parser = argparse.ArgumentParser(description = "fan control for Asrock 2U4N-F/X200 server nodes")
+    l_parser.add_argument("--cluster", metavar = "NODES_FILE", help = "control all the nodes listed in NODES_FILE over IPMI over LAN")
+    l_parser.add_argument("--controller", default = "table", choices = sorted(FAN_SPEED_CONTROLLERS.keys()),
+                          help = "fan speed control law (default : table)")
+    l_parser.add_argument("--setpoint", type = float, default = None, help = "target temperature of the pid controller (default : " + str(PID_SETPOINT) + ")")
+    l_parser.add_argument("--zones", action = "store_true", help = "one controller per fan zone (see FAN_ZONES) instead of the max of all the temperatures")
+    l_parser.add_argument("--metrics-port", type = int, default = None, help = "export the last sample in the prometheus text format on this local port (for example " + str(METRICS_PORT) + ")")
+    l_parser.add_argument("--dump-directory", default = None, help = "write the sample history to this directory every " + str(int(HISTORY_DUMP_SECONDS)) + " seconds")
+    l_parser.add_argument("--status-file", default = THERMAL_STATUS_FILE, help = "publish the thermal headroom in this file for micprun, empty to disable (default : " + THERMAL_STATUS_FILE + ")")
+    l_args = l_parser.parse_args()
+    l_status_file = l_args.status_file if l_args.status_file != "" else None
+    l_zones = create_zones(l_args.controller, l_args.setpoint, l_args.zones)
+    l_history = None
+    if(l_args.metrics_port is not None or l_args.dump_directory is not None):
+        l_history = cSampleHistory(HISTORY_CAPACITY, l_args.dump_directory)
+        if(l_args.metrics_port is not None):
+            start_metrics_server(l_history, l_args.metrics_port)
+    if(l_args.cluster is not None):
+        run_cluster(l_args.cluster, l_zones, l_history, l_status_file)
+    else:
+        run(l_zones, l_history, l_status_file)
+
 
-run()
+if __name__ == "__main__":
+    main()
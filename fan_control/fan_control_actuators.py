@@ -0,0 +1,42 @@
+# Actuator layer of fan_control : converts fan speed percentages to the duties of the raw 0x3a 0x01 command
+# of the X200D6HM BMC and writes them through the IPMI backend of the node.
+
+from fan_control_sensors import LOCAL_BMC_NODE, get_ipmi_backend
+
+# The fan duties are only written when one of them moves by more than DUTY_DEADBAND (in 1/64 units) from the
+# last written value. They are written again every DUTY_REFRESH_SECONDS in case the BMC went back to its own fan control.
+FAN_SLOTS = 8
+# avoid too extermal values
+DUTY_MIN = 12
+DUTY_MAX = 60
+DUTY_DEADBAND = 1
+DUTY_REFRESH_SECONDS = 600
+
+def get_ipmi_duty(percentage_of_max):
+    # values are from 0 to 64, 0 is smart Fan (bios control), 1 is the minimum speed, and 64 is full speed
+    ipmi_value = int(64 * percentage_of_max / 100)
+    ipmi_value = max(DUTY_MIN , ipmi_value)
+    ipmi_value = min(DUTY_MAX , ipmi_value)
+    return ipmi_value
+
+def set_fan_duties(duties, node = LOCAL_BMC_NODE, timestamp = None):
+    # returns True when the duties have been written
+    import time
+    l_now = timestamp
+    if(l_now is None):
+        l_now = time.time()
+    if(node.mLastDuties is not None):
+        l_change = max([abs(x - y) for (x, y) in zip(duties, node.mLastDuties)])
+        l_age = l_now - node.mLastDutiesTimestamp
+        if(l_change <= DUTY_DEADBAND and l_age < DUTY_REFRESH_SECONDS):
+            print("FAN_DUTIES_UNCHANGED", node.mName, node.mLastDuties, duties)
+            return False
+    l_exec_status = get_ipmi_backend(node).raw(node.mName + ":SET_FAN_SPEED", "3a", "01", duties)
+    print(l_exec_status)
+    node.mLastDuties = list(duties)
+    node.mLastDutiesTimestamp = l_now
+    return True
+
+def set_fan_speed(percentage_of_max, node = LOCAL_BMC_NODE):
+    print("SET_FAN_SPEED_PERCENTAGE" , node.mName, percentage_of_max)
+    return set_fan_duties([get_ipmi_duty(percentage_of_max)] * FAN_SLOTS, node)
@@ -0,0 +1,248 @@
+# Controller layer of fan_control : the control laws (table, PID), the fan zones and the polling scheduler.
+# The controllers only see sensor snapshots and timestamps given by the caller, they can be driven
+# by the real BMC or by the simulator (see fan_control_simulator.py) faster than real time.
+
+from fan_control_actuators import FAN_SLOTS, get_ipmi_duty
+
+# This table has been filled manually based on the noise level observed when running some cpu-intensive tasks (pyaf benchmarks).
+# interpretation : When the max temperature is between 35C and 45C, set the fan speed to 20% of max speed.
+
+CPU_TEMPERATURE_FAN_SPEED_MAPPING = {35 : 18, 45 : 22 , 55 : 25, 60 : 30, 65 : 35 , 75 : 40, 80 : 45 , 90 : 50}
+
+def get_interpolated_percentage(max_temp, mapping = CPU_TEMPERATURE_FAN_SPEED_MAPPING):
+    max_temp_boundary_high = min([x for x in mapping.keys() if max_temp <= x] + [max(mapping.keys())])
+    max_temp_boundary_low = max([min(mapping.keys())] + [x for x in mapping.keys() if x <= max_temp ])
+    percentage_of_max_high = mapping.get(max_temp_boundary_high)
+    percentage_of_max_low = mapping.get(max_temp_boundary_low)
+    percentage_of_max = percentage_of_max_high
+    if(percentage_of_max_high > percentage_of_max_low):
+        percentage_of_max = percentage_of_max_low + (max_temp - max_temp_boundary_low) / (max_temp_boundary_high - max_temp_boundary_low) * (percentage_of_max_high - percentage_of_max_low)
+    print("INTERPOLATED_DATA" , (max_temp_boundary_low, max_temp_boundary_high, percentage_of_max_low, percentage_of_max_high), max_temp , percentage_of_max)
+    return percentage_of_max
+
+# Controllers : a controller gives the fan speed percentage for a temperature.
+# compute_percentage is the control law of each controller. get_fan_percentage adds, for all the controllers,
+# a rate limit (the fan speed cannot change faster than RATE_LIMIT_UP/RATE_LIMIT_DOWN percent per second)
+# and an hysteresis (the fan speed only goes down when the temperature is HYSTERESIS_DEGREES below
+# the temperature of the last change).
+RATE_LIMIT_UP = 5.0
+RATE_LIMIT_DOWN = 0.5
+HYSTERESIS_DEGREES = 2.0
+
+# the table controller is the original behavior of this script, 5% above the table.
+TABLE_CONTROLLER_OFFSET = 5
+
+# the PID controller keeps the max temperature around PID_SETPOINT.
+PID_SETPOINT = 65.0
+PID_KP = 2.0
+PID_KI = 0.05
+PID_KD = 0.0
+PID_BIAS = 30.0
+
+class cFanSpeedController:
+    def __init__(self):
+        self.mName = None
+        self.mLastTimestamp = None
+        self.mLastPercentage = None
+        self.mLastChangeTemperature = None
+
+    def compute_percentage(self, max_temp, timestamp):
+        raise NotImplementedError("CONTROLLER_WITHOUT_CONTROL_LAW")
+
+    def get_max_percentage(self):
+        # the highest output of the control law, the fans cannot be driven faster by this controller
+        return 100.0
+
+    def get_fan_percentage(self, max_temp, timestamp):
+        l_percentage = self.compute_percentage(max_temp, timestamp)
+        if(self.mLastPercentage is not None):
+            if(l_percentage < self.mLastPercentage and max_temp > self.mLastChangeTemperature - HYSTERESIS_DEGREES):
+                print("CONTROLLER_HYSTERESIS", self.mName, max_temp, self.mLastChangeTemperature, l_percentage)
+                l_percentage = self.mLastPercentage
+            l_elapsed = max(0.0, timestamp - self.mLastTimestamp)
+            l_max_percentage = self.mLastPercentage + RATE_LIMIT_UP * l_elapsed
+            l_min_percentage = self.mLastPercentage - RATE_LIMIT_DOWN * l_elapsed
+            if(l_percentage > l_max_percentage or l_percentage < l_min_percentage):
+                print("CONTROLLER_RATE_LIMIT", self.mName, l_percentage, (l_min_percentage, l_max_percentage))
+                l_percentage = min(l_max_percentage, max(l_min_percentage, l_percentage))
+        if(self.mLastPercentage is None or l_percentage != self.mLastPercentage):
+            self.mLastChangeTemperature = max_temp
+        self.mLastTimestamp = timestamp
+        self.mLastPercentage = l_percentage
+        print("CONTROLLER_OUTPUT", self.mName, max_temp, l_percentage)
+        return l_percentage
+
+class cTableController(cFanSpeedController):
+    def __init__(self, mapping = CPU_TEMPERATURE_FAN_SPEED_MAPPING):
+        cFanSpeedController.__init__(self)
+        self.mName = "table"
+        self.mMapping = mapping
+
+    def compute_percentage(self, max_temp, timestamp):
+        return get_interpolated_percentage(max_temp, self.mMapping) + TABLE_CONTROLLER_OFFSET
+
+    def get_max_percentage(self):
+        return max(self.mMapping.values()) + TABLE_CONTROLLER_OFFSET
+
+class cPIDController(cFanSpeedController):
+    def __init__(self, setpoint = PID_SETPOINT):
+        cFanSpeedController.__init__(self)
+        self.mName = "pid"
+        self.mSetpoint = setpoint
+        self.mIntegral = 0.0
+        self.mPreviousTemperature = None
+        self.mPreviousTimestamp = None
+
+    def compute_percentage(self, max_temp, timestamp):
+        l_error = max_temp - self.mSetpoint
+        l_derivative = 0.0
+        l_elapsed = 0.0
+        if(self.mPreviousTimestamp is not None):
+            l_elapsed = max(0.0, timestamp - self.mPreviousTimestamp)
+            if(l_elapsed > 0):
+                l_derivative = (max_temp - self.mPreviousTemperature) / l_elapsed
+        l_integral = self.mIntegral + l_error * l_elapsed
+        l_percentage = PID_BIAS + PID_KP * l_error + PID_KI * l_integral + PID_KD * l_derivative
+        # anti windup : the integral term does not grow when the output is saturated
+        if(0.0 <= l_percentage <= 100.0):
+            self.mIntegral = l_integral
+        l_percentage = min(100.0, max(0.0, l_percentage))
+        self.mPreviousTemperature = max_temp
+        self.mPreviousTimestamp = timestamp
+        print("PID_DATA", (self.mSetpoint, l_error, self.mIntegral, l_derivative), max_temp, l_percentage)
+        return l_percentage
+
+FAN_SPEED_CONTROLLERS = {"table" : cTableController, "pid" : cPIDController}
+
+def create_controller(name, setpoint = None, mapping = None):
+    if(name not in FAN_SPEED_CONTROLLERS):
+        raise ValueError("UNKNOWN_CONTROLLER " + name + " " + str(sorted(FAN_SPEED_CONTROLLERS.keys())))
+    if(name == "pid" and setpoint is not None):
+        return cPIDController(setpoint)
+    if(name == "table" and mapping is not None):
+        return cTableController(mapping)
+    return FAN_SPEED_CONTROLLERS[name]()
+
+# Zones : a zone is a group of temperature sensors (shell patterns on the sensor names) cooled by some of the
+# fan slots of the raw 0x3a 0x01 command, with its own curve (table controller) or setpoint (pid controller).
+# Each zone has its own controller and each slot gets the max of the zones that use it, the fans near a hot DIMM
+# speed up while the others stay quiet. The slots used by no zone (the 4 last ones, no fan is connected there on a
+# X200D6HM node) and the slots of a zone without any reading get the max of all the zones.
+# The CPU_Temp sensor is the temperature of the package, MCDRAM included. The X200D6HM BMC has no VR sensor.
+# Sensors matching no zone (the PSU temperatures, the PSUs have their own fans) are not used.
+#
+# usage : python fan_control.py --zones
+DDR_TEMPERATURE_FAN_SPEED_MAPPING = {40 : 18, 55 : 22, 65 : 28, 75 : 38, 85 : 50}
+BOARD_TEMPERATURE_FAN_SPEED_MAPPING = {30 : 18, 40 : 22, 50 : 30, 60 : 40, 70 : 50}
+
+# name, sensor patterns, fan slots, table controller mapping, pid controller setpoint
+FAN_ZONES = [("cpu", ["CPU_Temp"], [0, 1], CPU_TEMPERATURE_FAN_SPEED_MAPPING, PID_SETPOINT),
+             ("memory", ["DDR4_*_Temp"], [2, 3], DDR_TEMPERATURE_FAN_SPEED_MAPPING, 70.0),
+             ("board", ["MB_Temp", "Card_Side_Temp", "Mezz_Temp", "PCH_Thermal"], [0, 1, 2, 3], BOARD_TEMPERATURE_FAN_SPEED_MAPPING, 50.0)]
+
+class cFanZone:
+    def __init__(self, name, sensor_patterns, slots, controller):
+        self.mName = name
+        self.mSensorPatterns = sensor_patterns
+        self.mSlots = slots
+        self.mController = controller
+
+    def get_temperatures(self, snapshots):
+        import fnmatch
+        l_temps = []
+        for l_snapshot in snapshots:
+            for l_record in l_snapshot.get_records("Temperature"):
+                if(l_record.mReading is None):
+                    continue
+                if(any([fnmatch.fnmatchcase(l_record.mName, x) for x in self.mSensorPatterns])):
+                    l_temps.append(l_record.mReading)
+        return l_temps
+
+def create_zones(controller_name, setpoint = None, per_zone = False):
+    if(not per_zone):
+        # the original behavior : the max of all the temperatures drives all the slots
+        return [cFanZone("all", ["*"], list(range(FAN_SLOTS)), create_controller(controller_name, setpoint))]
+    l_zones = []
+    for (l_name, l_patterns, l_slots, l_mapping, l_setpoint) in FAN_ZONES:
+        if(setpoint is not None):
+            l_setpoint = setpoint
+        l_zones.append(cFanZone(l_name, l_patterns, l_slots, create_controller(controller_name, l_setpoint, l_mapping)))
+    return l_zones
+
+def compute_zone_duties(zones, snapshots, timestamp):
+    l_slot_percentages = [None] * FAN_SLOTS
+    l_zone_percentages = []
+    l_missing_slots = []
+    for l_zone in zones:
+        l_temps = l_zone.get_temperatures(snapshots)
+        if(len(l_temps) == 0):
+            print("NO_TEMPERATURE_FOR_ZONE", l_zone.mName)
+            l_missing_slots = l_missing_slots + l_zone.mSlots
+            continue
+        max_temp = max(l_temps)
+        l_percentage = l_zone.mController.get_fan_percentage(max_temp, timestamp)
+        print("ZONE_OUTPUT", l_zone.mName, max_temp, l_percentage, l_zone.mSlots)
+        l_zone_percentages.append(l_percentage)
+        for l_slot in l_zone.mSlots:
+            if(l_slot_percentages[l_slot] is None or l_slot_percentages[l_slot] < l_percentage):
+                l_slot_percentages[l_slot] = l_percentage
+    if(len(l_zone_percentages) == 0):
+        raise ValueError("NO_TEMPERATURE_FOR_ANY_ZONE")
+    # a missing sensor does not slow any fan down
+    for l_slot in l_missing_slots:
+        l_slot_percentages[l_slot] = max(l_zone_percentages)
+    l_slot_percentages = [max(l_zone_percentages) if x is None else x for x in l_slot_percentages]
+    print("SLOT_PERCENTAGES", l_slot_percentages)
+    return [get_ipmi_duty(x) for x in l_slot_percentages]
+
+def get_duty_ceiling(zones):
+    # the highest duty the zones can write : the fans are at their ceiling when they reach it, even below DUTY_MAX
+    return get_ipmi_duty(max([x.mController.get_max_percentage() for x in zones]))
+
+# Polling interval : the temperatures are read again after the time needed by the fastest sensor to move by
+# POLL_TEMPERATURE_STEP degrees at its current rate (dT/dt over the last POLL_HISTORY_LENGTH readings).
+# A ramp (the start of a linpack run) gives POLL_INTERVAL_MIN at once, a flat temperature makes the
+# interval grow by at most POLL_BACKOFF_FACTOR per cycle up to POLL_INTERVAL_MAX.
+POLL_INTERVAL_MIN = 2.0
+POLL_INTERVAL_MAX = 120.0
+POLL_INTERVAL_START = 10.0
+POLL_TEMPERATURE_STEP = 1.0
+POLL_HISTORY_LENGTH = 4
+POLL_BACKOFF_FACTOR = 1.5
+
+class cPollScheduler:
+    def __init__(self):
+        self.mHistory = {}
+        self.mInterval = POLL_INTERVAL_START
+
+    def add_sample(self, timestamp, temperatures):
+        import collections
+        for (l_name, l_temp) in temperatures.items():
+            if(l_name not in self.mHistory):
+                self.mHistory[l_name] = collections.deque(maxlen = POLL_HISTORY_LENGTH)
+            self.mHistory[l_name].append((timestamp, l_temp))
+
+    def get_max_slope(self):
+        # degrees per second, the fastest sensor, rising or falling
+        l_max_slope = 0.0
+        l_fastest = None
+        for (l_name, l_samples) in self.mHistory.items():
+            (l_first_time, l_first_temp) = l_samples[0]
+            (l_last_time, l_last_temp) = l_samples[-1]
+            if(l_last_time <= l_first_time):
+                continue
+            l_slope = abs(l_last_temp - l_first_temp) / (l_last_time - l_first_time)
+            if(l_slope > l_max_slope):
+                (l_max_slope, l_fastest) = (l_slope, l_name)
+        return (l_max_slope, l_fastest)
+
+    def get_next_interval(self):
+        (l_slope, l_fastest) = self.get_max_slope()
+        l_interval = POLL_INTERVAL_MAX
+        if(l_slope > 0.0):
+            l_interval = POLL_TEMPERATURE_STEP / l_slope
+        # react at once to a ramp, back off slowly
+        l_interval = min(l_interval, self.mInterval * POLL_BACKOFF_FACTOR)
+        self.mInterval = min(POLL_INTERVAL_MAX, max(POLL_INTERVAL_MIN, l_interval))
+        print("POLL_INTERVAL", l_fastest, l_slope, self.mInterval)
+        return self.mInterval
@@ -0,0 +1,187 @@
+# Sample history of fan_control : the ring buffer of the control cycles and its export (Prometheus metrics, dumps).
+
+from fan_control_actuators import FAN_SLOTS, DUTY_MAX
+
+# Sample history : every control cycle stores (timestamp, temperatures, fan speeds, duties) in a fixed size ring buffer
+# (one array of doubles, no allocation per sample, NaN for a missing reading). The sensors are the ones of the first sample,
+# in cluster mode every configured node gets the sensors read on any node by the first cycle ("node:sensor" columns),
+# a node that misses the first cycle is recorded with NaN until it answers.
+# The last sample is exported in the Prometheus text format on http://localhost:METRICS_PORT/metrics (--metrics-port)
+# and the whole history is written every HISTORY_DUMP_SECONDS to fan_control_samples.csv and fan_control_samples.bin
+# (raw native doubles, the columns are in fan_control_samples.json) in the --dump-directory.
+HISTORY_CAPACITY = 8640
+HISTORY_DUMP_SECONDS = 300.0
+METRICS_PORT = 9753
+
+class cSampleHistory:
+    def __init__(self, capacity = HISTORY_CAPACITY, dump_directory = None):
+        import threading
+        self.mCapacity = capacity
+        self.mDumpDirectory = dump_directory
+        self.mLastDumpTime = None
+        self.mNodeNames = None
+        self.mTemperatureNames = None
+        self.mFanNames = None
+        self.mColumns = None
+        self.mData = None
+        self.mCount = 0
+        self.mLock = threading.Lock()
+
+    def set_nodes(self, node_names):
+        # cluster mode : the names of the samples are prefixed by the node name, see run_cluster
+        self.mNodeNames = list(node_names)
+
+    def get_column_names(self, names):
+        if(self.mNodeNames is None):
+            return sorted(names)
+        l_sensors = sorted(set([x.split(":", 1)[1] for x in names]))
+        return [x + ":" + y for x in self.mNodeNames for y in l_sensors]
+
+    def init_columns(self, temperatures, fans):
+        import array
+        self.mTemperatureNames = self.get_column_names(temperatures.keys())
+        self.mFanNames = self.get_column_names(fans.keys())
+        self.mColumns = (["timestamp"] + ["temperature:" + x for x in self.mTemperatureNames] +
+                         ["fan:" + x for x in self.mFanNames] + ["duty:" + str(x) for x in range(FAN_SLOTS)])
+        self.mData = array.array("d", [0.0]) * (self.mCapacity * len(self.mColumns))
+
+    def add_sample(self, timestamp, temperatures, fans, duties):
+        with self.mLock:
+            if(self.mData is None):
+                self.init_columns(temperatures, fans)
+            l_width = len(self.mColumns)
+            l_pos = (self.mCount % self.mCapacity) * l_width
+            self.mData[l_pos] = timestamp
+            l_pos = l_pos + 1
+            for l_name in self.mTemperatureNames:
+                self.mData[l_pos] = temperatures.get(l_name, float("nan"))
+                l_pos = l_pos + 1
+            for l_name in self.mFanNames:
+                self.mData[l_pos] = fans.get(l_name, float("nan"))
+                l_pos = l_pos + 1
+            for l_slot in range(FAN_SLOTS):
+                self.mData[l_pos] = duties[l_slot] if duties is not None else float("nan")
+                l_pos = l_pos + 1
+            self.mCount = self.mCount + 1
+        if(self.mDumpDirectory is not None):
+            if(self.mLastDumpTime is None or timestamp - self.mLastDumpTime >= HISTORY_DUMP_SECONDS):
+                self.dump(self.mDumpDirectory)
+                self.mLastDumpTime = timestamp
+
+    def get_rows(self):
+        # the samples in chronological order, one array of doubles per sample
+        with self.mLock:
+            if(self.mData is None):
+                return []
+            l_width = len(self.mColumns)
+            l_first = max(0, self.mCount - self.mCapacity)
+            l_rows = []
+            for l_index in range(l_first, self.mCount):
+                l_pos = (l_index % self.mCapacity) * l_width
+                l_rows.append(self.mData[l_pos : l_pos + l_width])
+            return l_rows
+
+    def get_metrics(self):
+        l_rows = self.get_rows()
+        l_lines = ["# TYPE fan_control_samples_total counter", "fan_control_samples_total " + str(self.mCount)]
+        if(len(l_rows) == 0):
+            return "\n".join(l_lines) + "\n"
+        l_last = l_rows[-1]
+        l_metrics = {"timestamp" : ("fan_control_last_sample_timestamp_seconds", None),
+                     "temperature" : ("fan_control_temperature_celsius", "sensor"),
+                     "fan" : ("fan_control_fan_speed_rpm", "sensor"),
+                     "duty" : ("fan_control_fan_duty", "slot")}
+        l_types = {}
+        for (l_column, l_value) in zip(self.mColumns, l_last):
+            if(l_value != l_value):
+                # NaN : no reading
+                continue
+            l_fields = l_column.split(":", 1)
+            (l_metric, l_label) = l_metrics[l_fields[0]]
+            if(l_metric not in l_types):
+                l_types[l_metric] = True
+                l_lines.append("# TYPE " + l_metric + " gauge")
+            if(l_label is None):
+                l_lines.append(l_metric + " " + repr(l_value))
+            else:
+                l_lines.append(l_metric + "{" + l_label + "=\"" + l_fields[1] + "\"} " + repr(l_value))
+        return "\n".join(l_lines) + "\n"
+
+    def dump(self, directory):
+        import csv, json, os
+        l_rows = self.get_rows()
+        if(len(l_rows) == 0):
+            return
+        l_prefix = os.path.join(directory, "fan_control_samples")
+        try:
+            with open(l_prefix + ".csv.tmp", "w", newline = "") as f:
+                l_writer = csv.writer(f)
+                l_writer.writerow(self.mColumns)
+                for l_row in l_rows:
+                    l_writer.writerow(["" if x != x else x for x in l_row])
+            with open(l_prefix + ".bin.tmp", "wb") as f:
+                for l_row in l_rows:
+                    l_row.tofile(f)
+            with open(l_prefix + ".json.tmp", "w") as f:
+                json.dump({"columns" : self.mColumns, "rows" : len(l_rows), "typecode" : "d"}, f)
+            for l_ext in [".csv", ".bin", ".json"]:
+                os.replace(l_prefix + l_ext + ".tmp", l_prefix + l_ext)
+            print("HISTORY_DUMPED", l_prefix, len(l_rows))
+        except OSError as e:
+            print("HISTORY_DUMP_FAILED", l_prefix, str(e))
+
+# Thermal status : after each control cycle, the thermal headroom (THERMAL_LIMIT minus the max temperature) and whether
+# the fans are at their ceiling (the highest duty of the controllers, see get_duty_ceiling, at most DUTY_MAX) are
+# written to THERMAL_STATUS_FILE (--status-file). When the fans cannot do more,
+# the only thing left is the throttling of the cores : micprun reads this file before each kernel and waits for the
+# node to cool down or marks its results as thermally throttled. A status older than a few control cycles means
+# that the controller is not running. In cluster mode the file of the controller host has the status of all the nodes.
+THERMAL_STATUS_FILE = "/run/fan_control/thermal_status.json"
+THERMAL_LIMIT = 85.0
+
+def publish_thermal_status(path, timestamp, temperatures, duties, duty_ceiling = DUTY_MAX):
+    import json, os
+    if(len(temperatures) == 0):
+        return
+    l_hottest = max(temperatures.keys(), key = lambda x : temperatures[x])
+    l_max_duty = max(duties) if duties is not None else None
+    l_status = {"timestamp" : timestamp,
+                "max_temperature" : temperatures[l_hottest],
+                "hottest_sensor" : l_hottest,
+                "limit" : THERMAL_LIMIT,
+                "headroom" : THERMAL_LIMIT - temperatures[l_hottest],
+                "max_duty" : l_max_duty,
+                "duty_ceiling" : min(duty_ceiling, DUTY_MAX),
+                "fans_at_ceiling" : l_max_duty is not None and l_max_duty >= min(duty_ceiling, DUTY_MAX)}
+    try:
+        l_directory = os.path.dirname(path)
+        if(l_directory != "" and not os.path.isdir(l_directory)):
+            os.makedirs(l_directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(l_status, f)
+        os.replace(path + ".tmp", path)
+        print("THERMAL_STATUS", l_status["headroom"], l_status["fans_at_ceiling"])
+    except OSError as e:
+        print("THERMAL_STATUS_FAILED", path, str(e))
+
+def start_metrics_server(history, port = METRICS_PORT):
+    import http.server, threading
+    class cMetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if(self.path != "/metrics"):
+                self.send_error(404)
+                return
+            l_body = history.get_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(l_body)))
+            self.end_headers()
+            self.wfile.write(l_body)
+
+        def log_message(self, format, *args):
+            return
+    l_server = http.server.ThreadingHTTPServer(("127.0.0.1", port), cMetricsHandler)
+    l_thread = threading.Thread(target = l_server.serve_forever, name = "metrics", daemon = True)
+    l_thread.start()
+    print("METRICS_SERVER", "http://127.0.0.1:" + str(port) + "/metrics")
+    return l_server
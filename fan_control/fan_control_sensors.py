@@ -0,0 +1,638 @@
+# Sensor layer of fan_control : the IPMI backends (FreeIPMI commands, ipmitool shell, fake BMC), the BMC nodes,
+# the SDR cache and the sensor snapshots read at each control cycle.
+#
+# This module only reads and writes the BMC, it does not know anything about the control laws.
+
+# Every external command is run through execute_command : the output is captured through pipes
+# (no temporary file, several controllers can run at the same time), all the lines are kept
+# and the command is killed if it does not answer after COMMAND_TIMEOUT seconds.
+COMMAND_TIMEOUT = 30.0
+
+class cCommandResult:
+    def __init__(self, label, cmd):
+        self.mLabel = label
+        self.mCommand = cmd
+        self.mReturnCode = None
+        self.mLines = []
+        self.mErrorLines = []
+        self.mTimedOut = False
+        self.mDuration = None
+
+    def is_ok(self):
+        return (not self.mTimedOut) and (self.mReturnCode == 0)
+
+    def joined_output(self):
+        return " ".join([x.strip() for x in self.mLines])
+
+    def __str__(self):
+        return self.mLabel + " " + " ".join(self.mCommand) + " RETURN_CODE=" + str(self.mReturnCode) + " TIMED_OUT=" + str(self.mTimedOut)
+
+def split_output_lines(output):
+    if(output is None):
+        return []
+    if(isinstance(output, bytes)):
+        output = output.decode(errors = "replace")
+    return [x.rstrip() for x in output.splitlines() if x.strip() != ""]
+
+def execute_command(label, cmd, timeout = COMMAND_TIMEOUT):
+    import subprocess, time
+    print("EXECUTING" , label, " ".join(cmd))
+    l_result = cCommandResult(label, cmd)
+    l_start = time.time()
+    try:
+        l_process = subprocess.run(cmd, stdout = subprocess.PIPE, stderr = subprocess.PIPE, timeout = timeout)
+        l_result.mReturnCode = l_process.returncode
+        l_result.mLines = split_output_lines(l_process.stdout)
+        l_result.mErrorLines = split_output_lines(l_process.stderr)
+    except subprocess.TimeoutExpired as e:
+        l_result.mTimedOut = True
+        l_result.mLines = split_output_lines(e.stdout)
+        l_result.mErrorLines = split_output_lines(e.stderr)
+    except OSError as e:
+        l_result.mErrorLines = [str(e)]
+    l_result.mDuration = time.time() - l_start
+    print("OUTPUT" , label, l_result.joined_output())
+    if(not l_result.is_ok()):
+        print("COMMAND_FAILED", str(l_result), " ".join(l_result.mErrorLines))
+    return l_result
+
+SERVER_NAME = "ASRockRack 2U4N-F/X200 X200D6HM"
+
+def check_server_name():
+    l_prod_cmd = ["cat", "/sys/class/dmi/id/board_vendor", "/sys/class/dmi/id/product_name", "/sys/class/dmi/id/board_name"]
+    l_prod_name = execute_command("CHECK_SERVER_MODEL", l_prod_cmd).joined_output()
+    return(l_prod_name)
+
+# IPMI backends : all the IPMI traffic of this script goes through one of these objects.
+# cFreeIPMIBackend is the original behavior (one ipmi-sensors/ipmi-raw process per command).
+# cIpmitoolShellBackend keeps one 'ipmitool shell' process alive for the whole life of the script,
+# the IPMI session (and the SDR repository) are opened once and each command is just a line sent to the shell.
+
+# "auto" uses ipmitool when it is installed, "freeipmi" otherwise.
+IPMI_BACKEND_NAME = "auto"
+FREEIPMI_SENSORS_PATH = "/usr/sbin/ipmi-sensors"
+FREEIPMI_RAW_PATH = "/usr/sbin/ipmi-raw"
+FREEIPMI_BMC_INFO_PATH = "/usr/sbin/bmc-info"
+IPMITOOL_PATH = "/usr/bin/ipmitool"
+IPMITOOL_SHELL_PROMPT = b"ipmitool> "
+IPMITOOL_SHELL_TIMEOUT = 10.0
+# the ipmitool shell does not give the exit status of its commands, a command failed when its output has one of
+# these error lines e.g. "Unable to send RAW command (channel=0x0 netfn=0x3a lun=0x0 cmd=0x1 rsp=0xc1): Invalid command"
+IPMITOOL_SHELL_ERROR_PREFIXES = ("Unable to", "Error", "Invalid", "Could not", "Insufficient privilege")
+
+class IPMISessionError(Exception):
+    pass
+
+# A BMC node is the BMC of one server node. The local node is reached through the in-band interface,
+# the other ones through IPMI over LAN (lanplus).
+class cBMCNode:
+    def __init__(self, name, host = None, user = None, password = None):
+        self.mName = name
+        self.mHost = host
+        self.mUser = user
+        self.mPassword = password
+        self.mBackend = None
+        # last fan duties written to the BMC (one per slot of the 0x3a 0x01 command) and when
+        self.mLastDuties = None
+        self.mLastDutiesTimestamp = None
+
+    def is_local(self):
+        return self.mHost is None
+
+LOCAL_BMC_NODE = cBMCNode("local")
+
+# A sensor snapshot is the result of one single walk of the SDR repository : all the sensors
+# (fans, temperatures, voltages, power) are read at the same instant and the control loop works on this snapshot.
+# The kind of a sensor is deduced from its units, FreeIPMI and ipmitool do not use the same unit names.
+SENSOR_UNITS_KINDS = {"RPM" : "Fan",
+                      "C" : "Temperature", "degrees C" : "Temperature",
+                      "V" : "Voltage", "Volts" : "Voltage",
+                      "W" : "Power", "Watts" : "Power"}
+
+class cSensorRecord:
+    def __init__(self, sensor_id, name, sensor_type, reading, units, event):
+        self.mID = sensor_id
+        self.mName = name
+        self.mType = sensor_type
+        # None when the sensor has no reading ('N/A', 'no reading', 'disabled' ...)
+        self.mReading = reading
+        self.mUnits = units
+        self.mEvent = event
+        self.mKind = SENSOR_UNITS_KINDS.get(units, sensor_type)
+
+    def __str__(self):
+        return str(self.mID) + " " + self.mName + " " + self.mKind + " " + str(self.mReading) + " " + self.mUnits
+
+def parse_reading(reading):
+    try:
+        return float(reading)
+    except ValueError:
+        return None
+
+class cSensorSnapshot:
+    def __init__(self, timestamp, records):
+        self.mTimestamp = timestamp
+        # records keyed by sensor ID, in SDR order
+        self.mRecords = {}
+        for l_record in records:
+            self.mRecords[l_record.mID] = l_record
+
+    def get_records(self, kind):
+        return [x for x in self.mRecords.values() if x.mKind == kind]
+
+    def get_values(self, kind):
+        return [x.mReading for x in self.get_records(kind) if x.mReading is not None]
+
+    def get_record_by_name(self, name):
+        for l_record in self.mRecords.values():
+            if(l_record.mName == name):
+                return l_record
+        return None
+
+    def get_named_values(self, kind, prefix = ""):
+        l_values = {}
+        for l_record in self.get_records(kind):
+            if(l_record.mReading is not None):
+                l_values[prefix + l_record.mName] = l_record.mReading
+        return l_values
+
+    def get_fan_speeds(self):
+        return self.get_values("Fan")
+
+    def get_temperatures(self):
+        return self.get_values("Temperature")
+
+    def get_voltages(self):
+        return self.get_values("Voltage")
+
+    def get_power(self):
+        return self.get_values("Power")
+
+# SDR cache : the SDR repository of the BMC (the list of sensors, their IDs, types and units) never changes
+# for a given board and BMC firmware. It is read once, saved in SDR_CACHE_DIRECTORY and the control loop
+# then only reads the sensors it needs, by ID. The cache file name contains the backend name (the sensor IDs are
+# record IDs for FreeIPMI and sensor numbers for ipmitool), the board name and the BMC firmware revision,
+# a firmware upgrade gives a new file name and the old cache files of the same node are removed.
+SDR_CACHE_DIRECTORY = "/var/cache/fan_control"
+BMC_SYSFS_FIRMWARE_REVISION = "/sys/devices/platform/ipmi_bmc.*/firmware_revision"
+
+class cSDRCache:
+    def __init__(self, backend_name, node_name, board_name, firmware_revision):
+        import os, re
+        self.mPrefix = re.sub(r'[^\w.-]', '-', backend_name + "_" + node_name)
+        self.mKey = self.mPrefix + "_" + re.sub(r'[^\w.-]', '-', board_name + "_" + firmware_revision)
+        self.mFile = os.path.join(SDR_CACHE_DIRECTORY, "sdr_" + self.mKey + ".json")
+        # the backends can keep their own SDR data next to our file (FreeIPMI cache, ipmitool sdr dump)
+        self.mBackendDirectory = os.path.join(SDR_CACHE_DIRECTORY, "backend_" + self.mKey)
+        # sensor records without reading
+        self.mRecords = []
+        # sensor name => sensor ID
+        self.mIndex = {}
+
+    def is_empty(self):
+        return len(self.mRecords) == 0
+
+    def load(self):
+        import json
+        try:
+            with open(self.mFile) as f:
+                l_data = json.load(f)
+        except (IOError, ValueError):
+            return False
+        self.set_records([cSensorRecord(x["id"], x["name"], x["type"], None, x["units"], "") for x in l_data])
+        print("SDR_CACHE_LOADED", self.mFile, len(self.mRecords))
+        return True
+
+    def save(self):
+        import json, os
+        try:
+            if(not os.path.isdir(SDR_CACHE_DIRECTORY)):
+                os.makedirs(SDR_CACHE_DIRECTORY)
+            l_data = [{"id" : x.mID, "name" : x.mName, "type" : x.mType, "units" : x.mUnits} for x in self.mRecords]
+            with open(self.mFile, "w") as f:
+                json.dump(l_data, f, indent = 1)
+            print("SDR_CACHE_SAVED", self.mFile, len(self.mRecords))
+        except (IOError, OSError) as e:
+            # not fatal, the cache will be rebuilt at the next start
+            print("SDR_CACHE_NOT_SAVED", self.mFile, str(e))
+
+    def set_records(self, records):
+        self.mRecords = [cSensorRecord(x.mID, x.mName, x.mType, None, x.mUnits, "") for x in records]
+        self.mIndex = {}
+        for l_record in self.mRecords:
+            self.mIndex[l_record.mName] = l_record.mID
+
+    def remove_stale_files(self):
+        # cache files of other boards or firmware revisions for this node
+        import glob, os, shutil
+        for l_file in glob.glob(os.path.join(SDR_CACHE_DIRECTORY, "sdr_" + self.mPrefix + "_*.json")):
+            if(l_file != self.mFile):
+                print("SDR_CACHE_REMOVED", l_file)
+                os.remove(l_file)
+        for l_dir in glob.glob(os.path.join(SDR_CACHE_DIRECTORY, "backend_" + self.mPrefix + "_*")):
+            if(l_dir != self.mBackendDirectory):
+                shutil.rmtree(l_dir, ignore_errors = True)
+
+    def invalidate(self):
+        import os, shutil
+        print("SDR_CACHE_INVALIDATED", self.mFile)
+        self.mRecords = []
+        self.mIndex = {}
+        if(os.path.exists(self.mFile)):
+            os.remove(self.mFile)
+        shutil.rmtree(self.mBackendDirectory, ignore_errors = True)
+
+    def get_sensor_id(self, name):
+        return self.mIndex.get(name)
+
+    def get_records(self, kinds):
+        return [x for x in self.mRecords if x.mKind in kinds]
+
+def get_freeipmi_lan_options(node):
+    if(node.is_local()):
+        return []
+    return ["-h", node.mHost, "-u", node.mUser, "-p", node.mPassword, "-D", "LAN_2_0"]
+
+def get_bmc_firmware_revision(node):
+    import glob
+    if(node.is_local()):
+        for l_file in glob.glob(BMC_SYSFS_FIRMWARE_REVISION):
+            with open(l_file) as f:
+                return f.read().strip()
+    # line format : Firmware Revision         : 1.20
+    l_cmd = [FREEIPMI_BMC_INFO_PATH, "--get-device-id"] + get_freeipmi_lan_options(node)
+    l_result = execute_command(node.mName + ":BMC_FIRMWARE_REVISION", l_cmd)
+    for l_line in l_result.mLines:
+        l_fields = [x.strip() for x in l_line.split(":", 1)]
+        if(len(l_fields) == 2 and l_fields[0] == "Firmware Revision"):
+            return l_fields[1]
+    return "unknown"
+
+def open_sdr_cache(backend_name, node):
+    l_firmware_revision = get_bmc_firmware_revision(node)
+    print("BMC_FIRMWARE_REVISION", node.mName, l_firmware_revision)
+    # the board of a remote node cannot be checked, all the nodes of a chassis are the same board.
+    l_board_name = SERVER_NAME
+    if(node.is_local()):
+        l_board_name = check_server_name()
+    l_sdr_cache = cSDRCache(backend_name, node.mName, l_board_name, l_firmware_revision)
+    l_sdr_cache.remove_stale_files()
+    l_sdr_cache.load()
+    return l_sdr_cache
+
+class cFreeIPMIBackend:
+    def __init__(self, node, sdr_cache):
+        self.mName = "freeipmi"
+        self.mNode = node
+        self.mSDRCache = sdr_cache
+
+    def get_sensors_command(self):
+        l_cmd = [FREEIPMI_SENSORS_PATH, "--sdr-cache-directory=" + self.mSDRCache.mBackendDirectory]
+        return l_cmd + get_freeipmi_lan_options(self.mNode)
+
+    def parse_sensor_lines(self, lines):
+        # line format : ID | Name | Type | Reading | Units | Event
+        l_records = []
+        for l_line in lines:
+            l_fields = [x.strip() for x in l_line.split("|")]
+            if(len(l_fields) < 6 or l_fields[0] == "ID"):
+                continue
+            l_records.append(cSensorRecord(l_fields[0], l_fields[1], l_fields[2], parse_reading(l_fields[3]), l_fields[4], l_fields[5]))
+        return l_records
+
+    def read_all_sensors(self, label):
+        l_result = execute_command(label, self.get_sensors_command())
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_SENSORS_FAILED " + str(l_result))
+        return self.parse_sensor_lines(l_result.mLines)
+
+    def read_sensors(self, label, records):
+        l_ids = ",".join([x.mID for x in records])
+        l_result = execute_command(label, self.get_sensors_command() + ["--record-ids=" + l_ids])
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_SENSORS_FAILED " + str(l_result))
+        return self.parse_sensor_lines(l_result.mLines)
+
+    def raw(self, label, netfn, cmd, data):
+        # ipmi-raw expects the LUN first and hexadecimal bytes
+        l_cmd = [FREEIPMI_RAW_PATH] + get_freeipmi_lan_options(self.mNode)
+        l_cmd = l_cmd + ["00", netfn, cmd] + ["%02x" % x for x in data]
+        l_result = execute_command(label, l_cmd)
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_RAW_FAILED " + str(l_result))
+        return l_result.joined_output()
+
+    def close(self):
+        return
+
+class cIpmitoolShellBackend:
+    def __init__(self, node, sdr_cache):
+        import os
+        self.mName = "ipmitool"
+        self.mNode = node
+        self.mProcess = None
+        self.mSDRCache = sdr_cache
+        self.mSDRDumpFile = os.path.join(sdr_cache.mBackendDirectory, "sdr.dump")
+        self.open()
+
+    def open(self):
+        import os, subprocess
+        l_cmd = [IPMITOOL_PATH, "-I", "open"]
+        if(not self.mNode.is_local()):
+            l_cmd = [IPMITOOL_PATH, "-I", "lanplus", "-H", self.mNode.mHost, "-U", self.mNode.mUser, "-P", self.mNode.mPassword]
+        if(os.path.exists(self.mSDRDumpFile)):
+            # do not download the SDR repository from the BMC
+            l_cmd = l_cmd + ["-S", self.mSDRDumpFile]
+        l_cmd = l_cmd + ["shell"]
+        print("OPENING_IPMI_SESSION", self.mNode.mName, self.mNode.mHost)
+        self.mProcess = subprocess.Popen(l_cmd, stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                                         stderr = subprocess.STDOUT, bufsize = 0)
+        try:
+            self.read_until_prompt()
+        except:
+            # BMC down, bad credentials or timeout : the shell that did not open is not left behind
+            self.kill()
+            self.mProcess = None
+            raise
+
+    def close(self):
+        if(self.mProcess is None):
+            return
+        try:
+            self.mProcess.stdin.write(b"exit\n")
+            self.mProcess.stdin.close()
+            self.mProcess.wait(timeout = IPMITOOL_SHELL_TIMEOUT)
+            self.mProcess.stdout.close()
+        except Exception:
+            self.kill()
+        self.mProcess = None
+
+    def kill(self):
+        # the process is reaped and its pipes closed, nothing is left behind by a lost session
+        self.mProcess.kill()
+        self.mProcess.wait()
+        for l_pipe in [self.mProcess.stdin, self.mProcess.stdout]:
+            try:
+                l_pipe.close()
+            except OSError:
+                pass
+
+    def read_until_prompt(self):
+        import os, select, time
+        l_fd = self.mProcess.stdout.fileno()
+        l_deadline = time.time() + IPMITOOL_SHELL_TIMEOUT
+        l_buffer = b""
+        while(not l_buffer.endswith(IPMITOOL_SHELL_PROMPT)):
+            l_remaining = l_deadline - time.time()
+            l_ready = select.select([l_fd], [], [], max(0.0, l_remaining))[0]
+            if(not l_ready):
+                raise IPMISessionError("NO_ANSWER_FROM_IPMITOOL_SHELL_AFTER " + str(IPMITOOL_SHELL_TIMEOUT) + " seconds")
+            l_chunk = os.read(l_fd, 4096)
+            if(not l_chunk):
+                raise IPMISessionError("IPMITOOL_SHELL_EXITED")
+            l_buffer = l_buffer + l_chunk
+        return l_buffer[:-len(IPMITOOL_SHELL_PROMPT)].decode(errors = "replace")
+
+    def execute(self, label, cmd):
+        import time
+        print("EXECUTING" , label, "ipmitool>", cmd)
+        l_result = cCommandResult(label, ["ipmitool>", cmd])
+        l_start = time.time()
+        try:
+            if(self.mProcess is None):
+                raise IPMISessionError("NO_IPMITOOL_SHELL")
+            self.mProcess.stdin.write((cmd + "\n").encode())
+            l_output = self.read_until_prompt()
+        except (IPMISessionError, OSError) as e:
+            # the BMC or the session may have gone away, reopen it once and retry.
+            print("IPMI_SESSION_LOST", label, str(e))
+            if(self.mProcess is not None):
+                self.kill()
+                self.mProcess = None
+            self.open()
+            self.mProcess.stdin.write((cmd + "\n").encode())
+            l_output = self.read_until_prompt()
+        l_lines = split_output_lines(l_output)
+        # readline may echo the command
+        if(len(l_lines) > 0 and l_lines[0].endswith(cmd)):
+            l_lines = l_lines[1:]
+        l_result.mErrorLines = [x for x in l_lines if x.strip().startswith(IPMITOOL_SHELL_ERROR_PREFIXES)]
+        l_result.mReturnCode = 1 if(len(l_result.mErrorLines) > 0) else 0
+        l_result.mLines = [x for x in l_lines if x not in l_result.mErrorLines]
+        l_result.mDuration = time.time() - l_start
+        print("OUTPUT" , label, l_result.joined_output())
+        if(not l_result.is_ok()):
+            print("ERROR_OUTPUT" , label, " ".join([x.strip() for x in l_result.mErrorLines]))
+        return l_result
+
+    def read_all_sensors(self, label):
+        # line format : CPU_Temp         | 30h | ok  |  3.1 | 62 degrees C
+        # 'sdr elist full' only lists the full sensor records (analog sensors with a reading and units),
+        # the sensor type is not printed and is deduced from the units.
+        l_records = []
+        l_result = self.execute(label, "sdr elist full")
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_SENSORS_FAILED " + str(l_result))
+        for l_line in l_result.mLines:
+            l_fields = [x.strip() for x in l_line.split("|")]
+            if(len(l_fields) < 5):
+                continue
+            l_reading_and_units = l_fields[4].split(" ", 1)
+            l_reading = parse_reading(l_reading_and_units[0])
+            l_units = ""
+            if(l_reading is not None and len(l_reading_and_units) > 1):
+                l_units = l_reading_and_units[1].strip()
+            l_records.append(cSensorRecord(l_fields[1], l_fields[0], "", l_reading, l_units, l_fields[2]))
+        self.dump_sdr()
+        return l_records
+
+    def dump_sdr(self):
+        import os
+        if(os.path.exists(self.mSDRDumpFile)):
+            return
+        try:
+            if(not os.path.isdir(self.mSDRCache.mBackendDirectory)):
+                os.makedirs(self.mSDRCache.mBackendDirectory)
+        except OSError as e:
+            print("SDR_DUMP_NOT_SAVED", self.mSDRDumpFile, str(e))
+            return
+        self.execute("SDR_DUMP", "sdr dump " + self.mSDRDumpFile)
+
+    def read_sensors(self, label, records):
+        # line format : CPU_Temp         | 62.000
+        # sensors are read by name, the type and units come from the SDR cache.
+        l_names = " ".join(['"' + x.mName + '"' for x in records])
+        l_readings = {}
+        l_result = self.execute(label, "sensor reading " + l_names)
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_SENSORS_FAILED " + str(l_result))
+        for l_line in l_result.mLines:
+            l_fields = [x.strip() for x in l_line.split("|")]
+            if(len(l_fields) == 2):
+                l_readings[l_fields[0]] = parse_reading(l_fields[1])
+        # an empty reading for every sensor means that the BMC did not answer
+        if(len([x for x in l_readings.values() if x is not None]) == 0):
+            raise IPMISessionError("NO_SENSOR_READING " + l_names)
+        return [cSensorRecord(x.mID, x.mName, x.mType, l_readings.get(x.mName), x.mUnits, "") for x in records]
+
+    def raw(self, label, netfn, cmd, data):
+        l_cmd = "raw 0x" + netfn + " 0x" + cmd + " " + " ".join(["0x%02x" % x for x in data])
+        l_result = self.execute(label, l_cmd)
+        if(not l_result.is_ok()):
+            raise IPMISessionError("IPMI_RAW_FAILED " + str(l_result))
+        return l_result.joined_output()
+
+# Thermal model of a X200D6HM node : each temperature goes toward an equilibrium that depends on the load of the node
+# and on the duty of the fans cooling it, with its own time constant (first order). The readings are given with the
+# 1 degree resolution of the BMC. Used by the fake BMC and by the simulator (fan_control_simulator.py).
+# name : fan slots cooling the sensor, ambient temperature, temperature rise at full load, time constant in seconds
+THERMAL_MODEL_SENSORS = {"CPU_Temp" : ([0, 1], 35.0, 50.0, 30.0),
+                         "DDR4_A_Temp" : ([2, 3], 30.0, 35.0, 60.0),
+                         "MB_Temp" : ([0, 1, 2, 3], 25.0, 30.0, 120.0)}
+# the part of the temperature rise removed by the fans at full speed
+THERMAL_MODEL_FAN_EFFICIENCY = 0.6
+THERMAL_MODEL_NOISE = 0.3
+THERMAL_MODEL_FAN_MAX_RPM = 21000.0
+
+class cThermalModel:
+    def __init__(self, seed = None):
+        import random
+        self.mRandom = random.Random(seed)
+        self.mDuties = [64] * 8
+        self.mTemperatures = {}
+        for (l_name, (l_slots, l_ambient, l_rise, l_time_constant)) in THERMAL_MODEL_SENSORS.items():
+            self.mTemperatures[l_name] = l_ambient
+
+    def set_duties(self, duties):
+        self.mDuties = list(duties)
+
+    def get_duty_fraction(self, slots, duties = None):
+        if(duties is None):
+            duties = self.mDuties
+        return sum([duties[x] for x in slots]) / len(slots) / 64.0
+
+    def get_equilibrium(self, name, load):
+        (l_slots, l_ambient, l_rise, l_time_constant) = THERMAL_MODEL_SENSORS[name]
+        return l_ambient + l_rise * load * (1.0 - THERMAL_MODEL_FAN_EFFICIENCY * self.get_duty_fraction(l_slots))
+
+    def step(self, elapsed, load):
+        import math
+        for (l_name, (l_slots, l_ambient, l_rise, l_time_constant)) in THERMAL_MODEL_SENSORS.items():
+            l_equilibrium = self.get_equilibrium(l_name, load)
+            l_factor = 1.0 - math.exp(- max(0.0, elapsed) / l_time_constant)
+            self.mTemperatures[l_name] = self.mTemperatures[l_name] + l_factor * (l_equilibrium - self.mTemperatures[l_name])
+
+    def get_readings(self):
+        l_readings = {}
+        for (l_name, l_temp) in self.mTemperatures.items():
+            l_readings[l_name] = float(round(l_temp + self.mRandom.gauss(0.0, THERMAL_MODEL_NOISE)))
+        return l_readings
+
+    def get_fan_speeds(self):
+        l_speeds = {}
+        for l_fan in range(4):
+            l_speeds["REAR_FAN" + str(l_fan + 1)] = THERMAL_MODEL_FAN_MAX_RPM * self.mDuties[l_fan] / 64
+        return l_speeds
+
+# A fake BMC running the thermal model in real time at FAKE_BMC_LOAD,
+# used for nodes declared with the host name "fake" to test the control loop without the real server.
+FAKE_BMC_HOST = "fake"
+FAKE_BMC_LOAD = 1.0
+
+class cFakeBackend:
+    def __init__(self, node):
+        import time
+        self.mName = "fake"
+        self.mNode = node
+        self.mModel = cThermalModel(node.mName)
+        self.mLastUpdate = time.time()
+        self.mSDRCache = cSDRCache("fake", node.mName, "fake", "fake")
+        l_records = [cSensorRecord(str(i + 1), name, "Temperature", None, "C", "") for (i, name) in enumerate(sorted(THERMAL_MODEL_SENSORS.keys()))]
+        l_records = l_records + [cSensorRecord(str(51 + i), "REAR_FAN" + str(i + 1), "Fan", None, "RPM", "") for i in range(4)]
+        # the SDR repository of the fake BMC, the cache can be invalidated and rebuilt from it
+        self.mSDRRecords = l_records
+        self.mSDRCache.set_records(l_records)
+
+    def read_sensors(self, label, records):
+        import time
+        l_now = time.time()
+        self.mModel.step(l_now - self.mLastUpdate, FAKE_BMC_LOAD)
+        self.mLastUpdate = l_now
+        l_readings = self.mModel.get_readings()
+        l_readings.update(self.mModel.get_fan_speeds())
+        l_records = []
+        for l_record in records:
+            l_records.append(cSensorRecord(l_record.mID, l_record.mName, l_record.mType, l_readings.get(l_record.mName), l_record.mUnits, ""))
+        print("OUTPUT", label, " ".join([str(x) for x in l_records]))
+        return l_records
+
+    def read_all_sensors(self, label):
+        return self.read_sensors(label, self.mSDRRecords)
+
+    def raw(self, label, netfn, cmd, data):
+        print("EXECUTING", label, "fake raw", netfn, cmd, " ".join(["%02x" % x for x in data]))
+        self.mModel.set_duties(data)
+        return "00"
+
+    def close(self):
+        return
+
+def create_ipmi_backend(node):
+    import os
+    if(node.mHost == FAKE_BMC_HOST):
+        l_backend = cFakeBackend(node)
+    else:
+        l_use_ipmitool = (IPMI_BACKEND_NAME == "ipmitool")
+        if(IPMI_BACKEND_NAME == "auto"):
+            l_use_ipmitool = os.path.exists(IPMITOOL_PATH)
+        if(l_use_ipmitool):
+            l_backend = cIpmitoolShellBackend(node, open_sdr_cache("ipmitool", node))
+        else:
+            l_backend = cFreeIPMIBackend(node, open_sdr_cache("freeipmi", node))
+    print("IPMI_BACKEND", node.mName, l_backend.mName)
+    return l_backend
+
+def get_ipmi_backend(node = LOCAL_BMC_NODE):
+    # one backend (one IPMI session) per node, opened at the first use
+    if(node.mBackend is None):
+        node.mBackend = create_ipmi_backend(node)
+    return node.mBackend
+# the sensors needed by the control loop, the other ones are not read when the SDR cache is available.
+CONTROL_SENSOR_KINDS = ["Temperature", "Fan"]
+
+def read_sensor_snapshot(kinds = None, node = LOCAL_BMC_NODE):
+    # kinds = None reads all the sensors
+    import time
+    l_backend = get_ipmi_backend(node)
+    l_label = node.mName + ":READ_SENSORS"
+    l_sdr_cache = l_backend.mSDRCache
+    l_timestamp = time.time()
+    l_records = None
+    if(kinds is not None and not l_sdr_cache.is_empty()):
+        try:
+            l_records = l_backend.read_sensors(l_label, l_sdr_cache.get_records(kinds))
+        except IPMISessionError as e:
+            # the SDR may have changed behind our back
+            print("SDR_CACHE_READ_FAILED", str(e))
+            l_sdr_cache.invalidate()
+    if(l_records is None):
+        l_records = l_backend.read_all_sensors(l_label)
+        if(l_sdr_cache.is_empty()):
+            l_sdr_cache.set_records(l_records)
+            l_sdr_cache.save()
+    l_snapshot = cSensorSnapshot(l_timestamp, l_records)
+    print("READ_FAN_SPEED", node.mName, l_snapshot.get_fan_speeds())
+    print("TEMPERATURE", node.mName, l_snapshot.get_temperatures())
+    print("VOLTAGE", node.mName, l_snapshot.get_voltages())
+    print("POWER", node.mName, l_snapshot.get_power())
+    return l_snapshot
+
+def get_fan_speeds(snapshot = None):
+    if(snapshot is None):
+        snapshot = read_sensor_snapshot()
+    return snapshot.get_fan_speeds()
+
+def get_temperatures(snapshot = None):
+    if(snapshot is None):
+        snapshot = read_sensor_snapshot()
+    return snapshot.get_temperatures()
@@ -0,0 +1,258 @@
+# Simulator for fan_control : runs the controllers, the zones, the polling scheduler and the duty deadband of
+# fan_control.py without any BMC, faster than real time, and compares control strategies on
+#   - the overshoot (max temperature above SIMULATION_TEMPERATURE_LIMIT and degree-seconds above it)
+#   - the number of IPMI writes (raw 0x3a 0x01 commands)
+#   - the fan energy (the power of a fan grows as the cube of its speed)
+#
+# The temperatures come either from the thermal model of fan_control_sensors.py driven by a load profile
+# (closed loop, a day of control decisions in a few seconds) or from a recorded trace : the output of fan_control.py
+# (sample_output.txt) or a fan_control_samples.csv dump. A trace was recorded with its own fan duties, the replayed
+# temperatures are corrected by the fan sensitivity of the thermal model (filtered by its time constant) so that a
+# strategy running the fans slower than the recorded one sees hotter temperatures.
+#
+# usage : python fan_control_simulator.py [--trace sample_output.txt] [--duration 86400] [--strategies table,pid-zones] [--verbose]
+
+from fan_control_sensors import cBMCNode, FAKE_BMC_HOST, cSensorRecord, cSensorSnapshot
+from fan_control_sensors import THERMAL_MODEL_SENSORS, THERMAL_MODEL_FAN_EFFICIENCY, cThermalModel
+from fan_control_actuators import set_fan_duties
+from fan_control_controllers import create_zones, compute_zone_duties, cPollScheduler
+
+SIMULATION_DURATION = 86400.0
+SIMULATION_STEP = 1.0
+SIMULATION_TEMPERATURE_LIMIT = 70.0
+SIMULATION_STRATEGIES = ["table", "pid", "table-zones", "pid-zones"]
+
+# one fan at full speed, only the 4 first slots of the raw command have a fan on a X200D6HM node
+FAN_POWER_WATTS = 12.0
+CONNECTED_FAN_SLOTS = [0, 1, 2, 3]
+
+# load profile of the thermal model : SIMULATION_LOAD_BUSY during SIMULATION_LOAD_BUSY_SECONDS (a linpack run)
+# at the start of each SIMULATION_LOAD_PERIOD, SIMULATION_LOAD_IDLE the rest of the time.
+SIMULATION_LOAD_PERIOD = 7200.0
+SIMULATION_LOAD_BUSY_SECONDS = 2400.0
+SIMULATION_LOAD_BUSY = 1.0
+SIMULATION_LOAD_IDLE = 0.3
+
+# the sensors printed by fan_control.py have no names, they are in the SDR order of a X200D6HM node.
+TRACE_TEMPERATURE_NAMES = ["Card_Side_Temp", "CPU_Temp", "MB_Temp",
+                           "DDR4_A_Temp", "DDR4_B_Temp", "DDR4_C_Temp", "DDR4_D_Temp", "DDR4_E_Temp", "DDR4_F_Temp",
+                           "Mezz_Temp", "PCH_Thermal", "PSU1_Temp", "PSU2_Temp"]
+# a recorded sensor without parameters in the thermal model gets the parameters of MB_Temp
+TRACE_DEFAULT_MODEL_SENSOR = "MB_Temp"
+
+def get_load(timestamp):
+    if(timestamp % SIMULATION_LOAD_PERIOD < SIMULATION_LOAD_BUSY_SECONDS):
+        return SIMULATION_LOAD_BUSY
+    return SIMULATION_LOAD_IDLE
+
+class cModelSource:
+    def __init__(self, seed = 0):
+        self.mName = "thermal_model"
+        self.mModel = cThermalModel(seed)
+        self.mTime = 0.0
+        self.mDuration = None
+
+    def set_duties(self, duties):
+        self.mModel.set_duties(duties)
+
+    def get_temperatures(self, timestamp):
+        # [(name, temperature)], the model goes forward to timestamp
+        self.mModel.step(timestamp - self.mTime, get_load(self.mTime))
+        self.mTime = timestamp
+        return sorted(self.mModel.get_readings().items())
+
+class cTraceSource:
+    def __init__(self, trace_file):
+        self.mName = trace_file
+        # [(time from the start of the trace, [(name, temperature)], duties)]
+        self.mSamples = read_trace(trace_file)
+        if(len(self.mSamples) == 0):
+            raise ValueError("NO_SAMPLE_IN_TRACE " + trace_file)
+        self.mDuration = self.mSamples[-1][0] + SIMULATION_STEP
+        self.mDuties = list(self.mSamples[0][2])
+        self.mCorrections = {}
+        self.mIndex = 0
+        self.mTime = 0.0
+
+    def set_duties(self, duties):
+        self.mDuties = list(duties)
+
+    def get_temperatures(self, timestamp):
+        import math
+        while(self.mIndex + 1 < len(self.mSamples) and self.mSamples[self.mIndex + 1][0] <= timestamp):
+            self.mIndex = self.mIndex + 1
+        (l_time, l_temps, l_recorded_duties) = self.mSamples[self.mIndex]
+        l_elapsed = max(0.0, timestamp - self.mTime)
+        self.mTime = timestamp
+        l_result = []
+        for (l_index, (l_name, l_temp)) in enumerate(l_temps):
+            l_model_name = l_name if l_name in THERMAL_MODEL_SENSORS else TRACE_DEFAULT_MODEL_SENSOR
+            (l_slots, l_ambient, l_rise, l_time_constant) = THERMAL_MODEL_SENSORS[l_model_name]
+            l_recorded = sum([l_recorded_duties[x] for x in l_slots]) / len(l_slots) / 64.0
+            l_simulated = sum([self.mDuties[x] for x in l_slots]) / len(l_slots) / 64.0
+            l_target = l_rise * THERMAL_MODEL_FAN_EFFICIENCY * (l_recorded - l_simulated)
+            l_correction = self.mCorrections.get(l_index, 0.0)
+            l_correction = l_correction + (1.0 - math.exp(- l_elapsed / l_time_constant)) * (l_target - l_correction)
+            self.mCorrections[l_index] = l_correction
+            l_result.append((l_name, l_temp + l_correction))
+        return l_result
+
+def read_trace(trace_file):
+    if(trace_file.endswith(".csv")):
+        return read_csv_trace(trace_file)
+    return read_log_trace(trace_file)
+
+def read_log_trace(trace_file):
+    # the output of fan_control.py : 'Start : <ctime>' lines, 'TEMPERATURE [node] [t1, t2, ...]' lines and the
+    # raw commands (the duties are the last 8 bytes, in hex for ipmi-raw and ipmitool).
+    import time, re
+    l_samples = []
+    l_start = None
+    l_duties = None
+    for l_line in open(trace_file):
+        l_line = l_line.strip()
+        if(l_line.startswith("Start : ")):
+            l_time = time.mktime(time.strptime(l_line[len("Start : "):], "%a %b %d %H:%M:%S %Y"))
+            if(l_start is None):
+                l_start = l_time
+            l_samples.append([l_time - l_start, [], None])
+        elif(l_line.startswith("TEMPERATURE ") and "[" in l_line and len(l_samples) > 0):
+            l_values = [float(x) for x in re.findall(r"[-0-9.]+", l_line[l_line.index("["):])]
+            l_samples[-1][1] = l_samples[-1][1] + list(zip(TRACE_TEMPERATURE_NAMES, l_values))
+        elif(l_line.startswith("EXECUTING ") and "SET_FAN_SPEED" in l_line):
+            l_duties = [int(x, 16) for x in l_line.split()[-8:]]
+            if(len(l_samples) > 0 and l_samples[-1][2] is None):
+                l_samples[-1][2] = l_duties
+    # a cycle without write kept the duties of the previous one
+    l_result = []
+    l_duties = None
+    for (l_time, l_temps, l_sample_duties) in l_samples:
+        if(l_sample_duties is not None):
+            l_duties = l_sample_duties
+        if(len(l_temps) > 0 and l_duties is not None):
+            l_result.append((l_time, l_temps, l_duties))
+    return l_result
+
+def read_csv_trace(trace_file):
+    # a fan_control_samples.csv dump, the node names of a cluster dump are removed from the sensor names
+    import csv
+    l_samples = []
+    l_start = None
+    with open(trace_file, newline = "") as f:
+        l_reader = csv.reader(f)
+        l_columns = next(l_reader)
+        for l_row in l_reader:
+            l_temps = []
+            l_duties = []
+            for (l_column, l_value) in zip(l_columns, l_row):
+                if(l_column.startswith("temperature:") and l_value != ""):
+                    l_temps.append((l_column.split(":")[-1], float(l_value)))
+                elif(l_column.startswith("duty:") and l_value != ""):
+                    l_duties.append(int(float(l_value)))
+            if(l_start is None):
+                l_start = float(l_row[0])
+            if(len(l_temps) > 0 and len(l_duties) == 8):
+                l_samples.append((float(l_row[0]) - l_start, l_temps, l_duties))
+    return l_samples
+
+class cSimulatorBackend:
+    # the IPMI backend of the simulated node, the fan duties go to the temperature source
+    def __init__(self, source):
+        self.mName = "simulator"
+        self.mSource = source
+        self.mWrites = 0
+
+    def raw(self, label, netfn, cmd, data):
+        self.mSource.set_duties(data)
+        self.mWrites = self.mWrites + 1
+        return "00"
+
+    def close(self):
+        return
+
+class cSimulationResult:
+    def __init__(self, strategy, source_name):
+        self.mStrategy = strategy
+        self.mSourceName = source_name
+        self.mDuration = 0.0
+        self.mCycles = 0
+        self.mWrites = 0
+        self.mMaxTemperature = None
+        self.mDegreeSecondsAboveLimit = 0.0
+        self.mFanEnergy = 0.0
+
+    def add_step(self, temperatures, duties, elapsed):
+        l_max_temp = max([x[1] for x in temperatures])
+        if(self.mMaxTemperature is None or l_max_temp > self.mMaxTemperature):
+            self.mMaxTemperature = l_max_temp
+        self.mDegreeSecondsAboveLimit = self.mDegreeSecondsAboveLimit + max(0.0, l_max_temp - SIMULATION_TEMPERATURE_LIMIT) * elapsed
+        l_power = sum([FAN_POWER_WATTS * (duties[x] / 64.0) ** 3 for x in CONNECTED_FAN_SLOTS])
+        # watt-hours
+        self.mFanEnergy = self.mFanEnergy + l_power * elapsed / 3600.0
+        self.mDuration = self.mDuration + elapsed
+
+    def get_overshoot(self):
+        return max(0.0, self.mMaxTemperature - SIMULATION_TEMPERATURE_LIMIT)
+
+    def __str__(self):
+        return ("%-12s %8d %8d %8.1f %10.1f %12.1f %10.2f" %
+                (self.mStrategy, self.mCycles, self.mWrites, self.mMaxTemperature, self.get_overshoot(),
+                 self.mDegreeSecondsAboveLimit, self.mFanEnergy))
+
+def simulate(strategy, source, duration):
+    # strategy : <controller>[-zones], for example 'pid' or 'table-zones'
+    l_fields = strategy.split("-")
+    l_zones = create_zones(l_fields[0], None, "zones" in l_fields[1:])
+    l_node = cBMCNode("simulator", FAKE_BMC_HOST)
+    l_node.mBackend = cSimulatorBackend(source)
+    l_scheduler = cPollScheduler()
+    l_result = cSimulationResult(strategy, source.mName)
+    l_time = 0.0
+    l_temps = source.get_temperatures(l_time)
+    while(l_time < duration):
+        l_records = [cSensorRecord(str(i + 1), l_name, "Temperature", l_temp, "C", "") for (i, (l_name, l_temp)) in enumerate(l_temps)]
+        l_snapshot = cSensorSnapshot(l_time, l_records)
+        l_scheduler.add_sample(l_time, dict([(str(i) + ":" + x[0], x[1]) for (i, x) in enumerate(l_temps)]))
+        l_duties = compute_zone_duties(l_zones, [l_snapshot], l_time)
+        l_written = set_fan_duties(l_duties, l_node, l_time)
+        l_result.mCycles = l_result.mCycles + 1
+        # the control loop waits 1 second for the fans to stabilize after a write
+        l_next_time = l_time + l_scheduler.get_next_interval() + (1.0 if l_written else 0.0)
+        # the temperatures between two control cycles are only seen by the metrics
+        while(l_time < min(l_next_time, duration)):
+            l_step = min(SIMULATION_STEP, l_next_time - l_time, duration - l_time)
+            l_result.add_step(l_temps, l_node.mLastDuties, l_step)
+            l_time = l_time + l_step
+            l_temps = source.get_temperatures(l_time)
+    l_result.mWrites = l_node.mBackend.mWrites
+    return l_result
+
+def compare_strategies(strategies, trace_file = None, duration = SIMULATION_DURATION, verbose = False):
+    import contextlib, os
+    l_results = []
+    for l_strategy in strategies:
+        l_source = cModelSource() if trace_file is None else cTraceSource(trace_file)
+        l_duration = duration if l_source.mDuration is None else l_source.mDuration
+        if(verbose):
+            l_results.append(simulate(l_strategy, l_source, l_duration))
+        else:
+            with open(os.devnull, "w") as l_devnull, contextlib.redirect_stdout(l_devnull):
+                l_results.append(simulate(l_strategy, l_source, l_duration))
+    print("SIMULATION", l_results[0].mSourceName, "DURATION", l_results[0].mDuration, "LIMIT", SIMULATION_TEMPERATURE_LIMIT)
+    print("%-12s %8s %8s %8s %10s %12s %10s" % ("STRATEGY", "CYCLES", "WRITES", "MAX_TEMP", "OVERSHOOT", "DEGREE_SEC", "FAN_WH"))
+    for l_result in l_results:
+        print(l_result)
+    return l_results
+
+def main():
+    import argparse
+    l_parser = argparse.ArgumentParser(description = "compare fan_control strategies on a thermal model or a recorded trace")
+    l_parser.add_argument("--trace", default = None, help = "replay the output of fan_control.py or a fan_control_samples.csv dump instead of the thermal model")
+    l_parser.add_argument("--duration", type = float, default = SIMULATION_DURATION, help = "simulated seconds with the thermal model (default : one day)")
+    l_parser.add_argument("--strategies", default = ",".join(SIMULATION_STRATEGIES), help = "comma separated <controller>[-zones] list (default : " + ",".join(SIMULATION_STRATEGIES) + ")")
+    l_parser.add_argument("--verbose", action = "store_true", help = "show the output of the controllers")
+    l_args = l_parser.parse_args()
+    compare_strategies(l_args.strategies.split(","), l_args.trace, l_args.duration, l_args.verbose)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Tests of the actuator layer of fan_control : the duties are only written when they move by more than
+# the deadband, and written again after DUTY_REFRESH_SECONDS. The node is a fake BMC recording its raw commands.
+#
+# usage : python -m unittest discover -s fan_control
+
+import unittest
+
+from fan_control_sensors import FAKE_BMC_HOST, cBMCNode, get_ipmi_backend
+from fan_control_actuators import DUTY_DEADBAND, DUTY_REFRESH_SECONDS, FAN_SLOTS, set_fan_duties
+
+class cDeadbandTest(unittest.TestCase):
+    def setUp(self):
+        self.mNode = cBMCNode("node1", FAKE_BMC_HOST)
+        self.mWrites = []
+        l_backend = get_ipmi_backend(self.mNode)
+        l_raw = l_backend.raw
+        def raw(label, netfn, cmd, data):
+            self.mWrites.append(list(data))
+            return l_raw(label, netfn, cmd, data)
+        l_backend.raw = raw
+
+    def duties(self, duty):
+        return [duty] * FAN_SLOTS
+
+    def test_first_write(self):
+        self.assertTrue(set_fan_duties(self.duties(20), self.mNode, 0.0))
+        self.assertEqual(self.mWrites, [self.duties(20)])
+        self.assertEqual(self.mNode.mLastDuties, self.duties(20))
+
+    def test_change_within_the_deadband(self):
+        set_fan_duties(self.duties(20), self.mNode, 0.0)
+        self.assertFalse(set_fan_duties(self.duties(20 + DUTY_DEADBAND), self.mNode, 10.0))
+        self.assertFalse(set_fan_duties(self.duties(20 - DUTY_DEADBAND), self.mNode, 20.0))
+        self.assertEqual(len(self.mWrites), 1)
+        # the reference stays the last written duties, small steps do not add up unnoticed
+        self.assertEqual(self.mNode.mLastDuties, self.duties(20))
+        self.assertEqual(self.mNode.mLastDutiesTimestamp, 0.0)
+
+    def test_change_beyond_the_deadband(self):
+        set_fan_duties(self.duties(20), self.mNode, 0.0)
+        self.assertTrue(set_fan_duties(self.duties(21 + DUTY_DEADBAND), self.mNode, 10.0))
+        self.assertEqual(self.mWrites[-1], self.duties(21 + DUTY_DEADBAND))
+
+    def test_one_slot_beyond_the_deadband(self):
+        set_fan_duties(self.duties(20), self.mNode, 0.0)
+        l_duties = self.duties(20)
+        l_duties[3] = 21 + DUTY_DEADBAND
+        self.assertTrue(set_fan_duties(l_duties, self.mNode, 10.0))
+        self.assertEqual(self.mWrites[-1], l_duties)
+
+    def test_refresh(self):
+        set_fan_duties(self.duties(20), self.mNode, 0.0)
+        self.assertFalse(set_fan_duties(self.duties(20), self.mNode, DUTY_REFRESH_SECONDS - 1.0))
+        # the BMC may have gone back to its own fan control, the same duties are written again
+        self.assertTrue(set_fan_duties(self.duties(20), self.mNode, DUTY_REFRESH_SECONDS))
+        self.assertEqual(self.mWrites, [self.duties(20)] * 2)
+        self.assertEqual(self.mNode.mLastDutiesTimestamp, DUTY_REFRESH_SECONDS)
+        self.assertFalse(set_fan_duties(self.duties(20), self.mNode, DUTY_REFRESH_SECONDS + 1.0))
+
+if __name__ == "__main__":
+    unittest.main()
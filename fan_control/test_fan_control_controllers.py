@@ -0,0 +1,147 @@
+# Tests of the controller layer of fan_control : the rate limit and the hysteresis added by get_fan_percentage
+# to every control law, the ceiling of the zones and the polling interval adapted to the temperature rate of change.
+#
+# usage : python -m unittest discover -s fan_control
+
+import unittest
+
+from fan_control_controllers import RATE_LIMIT_UP, RATE_LIMIT_DOWN, HYSTERESIS_DEGREES, TABLE_CONTROLLER_OFFSET
+from fan_control_controllers import CPU_TEMPERATURE_FAN_SPEED_MAPPING, cFanSpeedController, create_zones, get_duty_ceiling
+from fan_control_controllers import POLL_INTERVAL_MIN, POLL_INTERVAL_MAX, POLL_INTERVAL_START, POLL_TEMPERATURE_STEP
+from fan_control_controllers import POLL_HISTORY_LENGTH, POLL_BACKOFF_FACTOR, cPollScheduler
+from fan_control_actuators import DUTY_MAX, get_ipmi_duty
+
+class cFixedController(cFanSpeedController):
+    # control law giving the percentage set by the test, whatever the temperature
+    def __init__(self):
+        cFanSpeedController.__init__(self)
+        self.mName = "fixed"
+        self.mPercentage = None
+
+    def compute_percentage(self, max_temp, timestamp):
+        return self.mPercentage
+
+    def step(self, percentage, max_temp, timestamp):
+        self.mPercentage = percentage
+        return self.get_fan_percentage(max_temp, timestamp)
+
+class cRateLimitTest(unittest.TestCase):
+    def test_first_output_is_not_limited(self):
+        l_controller = cFixedController()
+        self.assertEqual(l_controller.step(80.0, 70.0, 0.0), 80.0)
+
+    def test_increase_is_limited(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        self.assertAlmostEqual(l_controller.step(80.0, 75.0, 2.0), 30.0 + 2.0 * RATE_LIMIT_UP)
+        # the limit is applied from the last output, not from the last target
+        self.assertAlmostEqual(l_controller.step(80.0, 75.0, 3.0), 30.0 + 3.0 * RATE_LIMIT_UP)
+
+    def test_decrease_is_limited(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        l_temp = 60.0 - HYSTERESIS_DEGREES - 5.0
+        self.assertAlmostEqual(l_controller.step(10.0, l_temp, 4.0), 30.0 - 4.0 * RATE_LIMIT_DOWN)
+
+    def test_no_time_elapsed_keeps_the_output(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 10.0)
+        self.assertEqual(l_controller.step(80.0, 75.0, 10.0), 30.0)
+        # a timestamp going backwards does not give a negative rate
+        self.assertEqual(l_controller.step(80.0, 75.0, 5.0), 30.0)
+
+    def test_target_within_the_limit(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        self.assertEqual(l_controller.step(32.0, 62.0, 10.0), 32.0)
+
+class cHysteresisTest(unittest.TestCase):
+    def test_small_cooling_keeps_the_speed(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        self.assertEqual(l_controller.step(20.0, 60.0 - HYSTERESIS_DEGREES / 2, 1000.0), 30.0)
+
+    def test_hold_does_not_move_the_reference_temperature(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        # the temperature creeping down by less than HYSTERESIS_DEGREES per cycle still slows the fans down
+        # once it is HYSTERESIS_DEGREES below the temperature of the last change
+        l_temp = 60.0
+        for l_step in range(1, 4):
+            l_temp = l_temp - HYSTERESIS_DEGREES * 0.4
+            l_output = l_controller.step(20.0, l_temp, 1000.0 * l_step)
+        self.assertEqual(l_output, 20.0)
+
+    def test_large_cooling_slows_the_fans_down(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        self.assertEqual(l_controller.step(20.0, 60.0 - HYSTERESIS_DEGREES - 0.5, 1000.0), 20.0)
+
+    def test_increase_is_not_delayed(self):
+        l_controller = cFixedController()
+        l_controller.step(30.0, 60.0, 0.0)
+        self.assertEqual(l_controller.step(35.0, 60.5, 1000.0), 35.0)
+
+class cDutyCeilingTest(unittest.TestCase):
+    def test_table_controller_ceiling(self):
+        l_max_percentage = max(CPU_TEMPERATURE_FAN_SPEED_MAPPING.values()) + TABLE_CONTROLLER_OFFSET
+        self.assertEqual(get_duty_ceiling(create_zones("table")), get_ipmi_duty(l_max_percentage))
+        self.assertTrue(get_duty_ceiling(create_zones("table")) < DUTY_MAX)
+
+    def test_table_controller_reaches_its_ceiling(self):
+        l_zones = create_zones("table")
+        l_controller = l_zones[0].mController
+        l_percentage = l_controller.get_fan_percentage(120.0, 0.0)
+        self.assertEqual(get_ipmi_duty(l_percentage), get_duty_ceiling(l_zones))
+
+    def test_pid_controller_ceiling(self):
+        self.assertEqual(get_duty_ceiling(create_zones("pid", None, True)), DUTY_MAX)
+
+class cPollSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.mScheduler = cPollScheduler()
+
+    def add_samples(self, slopes, seconds = 10.0, count = POLL_HISTORY_LENGTH):
+        # count samples of each sensor, rising at its slope in degrees per second
+        for i in range(count):
+            self.mScheduler.add_sample(i * seconds, dict([(l_name, 40.0 + l_slope * i * seconds) for (l_name, l_slope) in slopes.items()]))
+
+    def test_interval_follows_the_rate_of_change(self):
+        # 0.125 degree per second : POLL_TEMPERATURE_STEP degrees in 8 seconds
+        self.add_samples({"CPU_Temp" : 0.125})
+        self.assertEqual(self.mScheduler.get_max_slope(), (0.125, "CPU_Temp"))
+        self.assertEqual(self.mScheduler.get_next_interval(), POLL_TEMPERATURE_STEP / 0.125)
+
+    def test_fastest_sensor_rising_or_falling(self):
+        self.add_samples({"CPU_Temp" : 0.05, "MB_Temp" : -0.2, "DDR4_A_Temp" : 0.0})
+        self.assertEqual(self.mScheduler.get_max_slope(), (0.2, "MB_Temp"))
+        self.assertEqual(self.mScheduler.get_next_interval(), POLL_TEMPERATURE_STEP / 0.2)
+
+    def test_ramp_is_clamped_to_the_minimum(self):
+        self.add_samples({"CPU_Temp" : 5.0}, 1.0)
+        self.assertEqual(self.mScheduler.get_next_interval(), POLL_INTERVAL_MIN)
+
+    def test_flat_temperature_backs_off_to_the_maximum(self):
+        self.add_samples({"CPU_Temp" : 0.0})
+        l_intervals = [self.mScheduler.get_next_interval() for i in range(12)]
+        self.assertEqual(l_intervals[0], POLL_INTERVAL_START * POLL_BACKOFF_FACTOR)
+        self.assertEqual(l_intervals[1], POLL_INTERVAL_START * POLL_BACKOFF_FACTOR ** 2)
+        self.assertEqual(l_intervals[-1], POLL_INTERVAL_MAX)
+        self.assertEqual(max(l_intervals), POLL_INTERVAL_MAX)
+
+    def test_no_sample(self):
+        self.assertEqual(self.mScheduler.get_max_slope(), (0.0, None))
+        self.assertEqual(self.mScheduler.get_next_interval(), POLL_INTERVAL_START * POLL_BACKOFF_FACTOR)
+
+    def test_ramp_after_a_flat_temperature(self):
+        self.add_samples({"CPU_Temp" : 0.0})
+        for i in range(12):
+            self.mScheduler.get_next_interval()
+        # only the last POLL_HISTORY_LENGTH readings count, the ramp is seen at once
+        for i in range(POLL_HISTORY_LENGTH):
+            self.mScheduler.add_sample(1000.0 + i * 2.0, {"CPU_Temp" : 40.0 + i * 2.0})
+        self.assertEqual(self.mScheduler.get_max_slope(), (1.0, "CPU_Temp"))
+        self.assertEqual(self.mScheduler.get_next_interval(), POLL_INTERVAL_MIN)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Tests of the sample history of fan_control : the ring buffer, its columns and the thermal status.
+#
+# usage : python -m unittest discover -s fan_control
+
+import json, math, os, shutil, tempfile, unittest
+
+from fan_control_history import cSampleHistory, publish_thermal_status, THERMAL_LIMIT
+from fan_control_actuators import FAN_SLOTS, DUTY_MAX
+
+class cSampleHistoryTest(unittest.TestCase):
+    def test_ring_buffer_keeps_the_last_samples(self):
+        l_history = cSampleHistory(3)
+        for l_time in range(5):
+            l_history.add_sample(float(l_time), {"CPU_Temp" : 40.0 + l_time}, {"FAN1" : 1000.0}, [20] * FAN_SLOTS)
+        l_rows = l_history.get_rows()
+        self.assertEqual([x[0] for x in l_rows], [2.0, 3.0, 4.0])
+        self.assertEqual([x[1] for x in l_rows], [42.0, 43.0, 44.0])
+
+    def test_missing_reading_is_nan(self):
+        l_history = cSampleHistory(4)
+        l_history.add_sample(1.0, {"CPU_Temp" : 40.0, "MB_Temp" : 30.0}, {}, None)
+        l_history.add_sample(2.0, {"CPU_Temp" : 41.0}, {}, None)
+        l_row = l_history.get_rows()[-1]
+        self.assertEqual(l_history.mColumns[:3], ["timestamp", "temperature:CPU_Temp", "temperature:MB_Temp"])
+        self.assertEqual(l_row[1], 41.0)
+        self.assertTrue(math.isnan(l_row[2]))
+        self.assertTrue(all([math.isnan(x) for x in l_row[3:]]))
+
+    def test_node_missing_the_first_cycle_is_recorded(self):
+        l_history = cSampleHistory(4)
+        l_history.set_nodes(["node1", "node2"])
+        l_history.add_sample(1.0, {"node1:CPU_Temp" : 50.0}, {"node1:FAN1" : 1000.0}, [20] * FAN_SLOTS)
+        l_history.add_sample(2.0, {"node1:CPU_Temp" : 51.0, "node2:CPU_Temp" : 60.0},
+                             {"node1:FAN1" : 1000.0, "node2:FAN1" : 900.0}, [21] * FAN_SLOTS)
+        self.assertEqual(l_history.mColumns[:5], ["timestamp", "temperature:node1:CPU_Temp", "temperature:node2:CPU_Temp",
+                                                  "fan:node1:FAN1", "fan:node2:FAN1"])
+        (l_first, l_second) = l_history.get_rows()
+        self.assertTrue(math.isnan(l_first[2]))
+        self.assertTrue(math.isnan(l_first[4]))
+        self.assertEqual(list(l_second[1:5]), [51.0, 60.0, 1000.0, 900.0])
+        self.assertTrue('sensor="node2:CPU_Temp"} 60.0' in l_history.get_metrics())
+
+    def test_dump(self):
+        l_directory = tempfile.mkdtemp()
+        try:
+            l_history = cSampleHistory(4)
+            l_history.add_sample(1.0, {"CPU_Temp" : 40.0}, {}, [20] * FAN_SLOTS)
+            l_history.add_sample(2.0, {}, {}, [20] * FAN_SLOTS)
+            l_history.dump(l_directory)
+            with open(os.path.join(l_directory, "fan_control_samples.json")) as f:
+                l_description = json.load(f)
+            self.assertEqual(l_description["rows"], 2)
+            self.assertEqual(l_description["columns"], l_history.mColumns)
+            self.assertEqual(os.path.getsize(os.path.join(l_directory, "fan_control_samples.bin")),
+                             2 * len(l_history.mColumns) * 8)
+            with open(os.path.join(l_directory, "fan_control_samples.csv")) as f:
+                l_lines = f.read().splitlines()
+            self.assertEqual(l_lines[2].split(",")[:2], ["2.0", ""])
+        finally:
+            shutil.rmtree(l_directory)
+
+class cThermalStatusTest(unittest.TestCase):
+    def setUp(self):
+        self.mDirectory = tempfile.mkdtemp()
+        self.mPath = os.path.join(self.mDirectory, "status", "thermal_status.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.mDirectory)
+
+    def publish(self, temperatures, duties, *args):
+        publish_thermal_status(self.mPath, 100.0, temperatures, duties, *args)
+        with open(self.mPath) as f:
+            return json.load(f)
+
+    def test_headroom(self):
+        l_status = self.publish({"CPU_Temp" : 70.0, "MB_Temp" : 40.0}, [20] * FAN_SLOTS)
+        self.assertEqual(l_status["hottest_sensor"], "CPU_Temp")
+        self.assertEqual(l_status["headroom"], THERMAL_LIMIT - 70.0)
+        self.assertFalse(l_status["fans_at_ceiling"])
+
+    def test_fans_at_the_ceiling_of_the_controller(self):
+        l_status = self.publish({"CPU_Temp" : 80.0}, [35] * FAN_SLOTS, 35)
+        self.assertEqual(l_status["duty_ceiling"], 35)
+        self.assertTrue(l_status["fans_at_ceiling"])
+        self.assertFalse(self.publish({"CPU_Temp" : 80.0}, [34] * FAN_SLOTS, 35)["fans_at_ceiling"])
+
+    def test_ceiling_is_at_most_duty_max(self):
+        self.assertFalse(self.publish({"CPU_Temp" : 80.0}, [DUTY_MAX - 1] * FAN_SLOTS)["fans_at_ceiling"])
+        l_status = self.publish({"CPU_Temp" : 80.0}, [DUTY_MAX] * FAN_SLOTS, DUTY_MAX + 4)
+        self.assertEqual(l_status["duty_ceiling"], DUTY_MAX)
+        self.assertTrue(l_status["fans_at_ceiling"])
+
+    def test_no_duty_written_yet(self):
+        self.assertFalse(self.publish({"CPU_Temp" : 80.0}, None, 35)["fans_at_ceiling"])
+
+if __name__ == "__main__":
+    unittest.main()
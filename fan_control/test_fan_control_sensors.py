@@ -0,0 +1,235 @@
+# Tests of the persistent ipmitool shell backend of fan_control against a shell script playing the ipmitool shell :
+# the errors printed by ipmitool are reported as failed commands and a lost session is reopened.
+# Tests of the SDR cache : saved and loaded by board and firmware revision, invalidated when a cached read fails.
+#
+# usage : python -m unittest discover -s fan_control
+
+import os, shutil, stat, subprocess, tempfile, unittest
+
+import fan_control_sensors
+from fan_control_sensors import IPMISessionError, LOCAL_BMC_NODE, FAKE_BMC_HOST, CONTROL_SENSOR_KINDS, SERVER_NAME
+from fan_control_sensors import cBMCNode, cIpmitoolShellBackend, cSensorRecord, cSDRCache, open_sdr_cache, read_sensor_snapshot
+
+# the first "sensor reading GONE" exits the shell, as a BMC dropping the session would do, the next ones answer.
+FAKE_IPMITOOL_SHELL = """#!/bin/sh
+printf 'ipmitool> '
+while read l; do
+  case "$l" in
+    "raw 0x3a 0x01 0xff"*) echo "Unable to send RAW command (channel=0x0 netfn=0x3a lun=0x0 cmd=0x1 rsp=0xc1): Invalid command";;
+    raw*) ;;
+    'sensor reading "GONE"'*)
+      if [ ! -e "$0.lost" ]; then touch "$0.lost"; exit 1; fi
+      echo "CPU_Temp         | 46";;
+    'sensor reading "NONE"'*) echo "CPU_Temp         | ";;
+    "sensor reading"*) echo "CPU_Temp         | 45"; echo "MB_Temp          | ";;
+    "sdr elist full") echo "Error: Unable to establish IPMI v2 / RMCP+ session";;
+    exit) exit 0;;
+  esac
+  printf 'ipmitool> '
+done
+"""
+
+# a BMC that can not be reached : ipmitool prints its error and exits before the prompt.
+FAILING_IPMITOOL_SHELL = """#!/bin/sh
+echo "Error: Unable to establish IPMI v2 / RMCP+ session"
+exit 1
+"""
+
+class cFakeSDRCache:
+    def __init__(self, directory):
+        self.mBackendDirectory = directory
+
+class cIpmitoolShellBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.mDirectory = tempfile.mkdtemp()
+        self.mScript = self.write_script("ipmitool", FAKE_IPMITOOL_SHELL)
+        self.mIpmitoolPath = fan_control_sensors.IPMITOOL_PATH
+        fan_control_sensors.IPMITOOL_PATH = self.mScript
+        # every ipmitool started is recorded
+        self.mPopen = subprocess.Popen
+        self.mProcesses = []
+        subprocess.Popen = self.popen
+        self.mBackend = cIpmitoolShellBackend(LOCAL_BMC_NODE, cFakeSDRCache(self.mDirectory))
+
+    def tearDown(self):
+        self.mBackend.close()
+        subprocess.Popen = self.mPopen
+        fan_control_sensors.IPMITOOL_PATH = self.mIpmitoolPath
+        shutil.rmtree(self.mDirectory)
+
+    def popen(self, *args, **kwargs):
+        l_process = self.mPopen(*args, **kwargs)
+        self.mProcesses.append(l_process)
+        return l_process
+
+    def write_script(self, name, text):
+        l_script = os.path.join(self.mDirectory, name)
+        with open(l_script, "w") as f:
+            f.write(text)
+        os.chmod(l_script, stat.S_IRWXU)
+        return l_script
+
+    def assertReaped(self, processes):
+        for l_process in processes:
+            self.assertEqual(l_process.returncode, 1)
+            self.assertTrue(l_process.stdout.closed)
+
+    def records(self, names):
+        return [cSensorRecord(str(i), x, "Temperature", None, "degrees C", "") for (i, x) in enumerate(names)]
+
+    def test_raw_command(self):
+        self.mBackend.raw("SET_FAN_SPEED", "3a", "01", [20] * 8)
+
+    def test_failed_raw_command(self):
+        l_result = self.mBackend.execute("SET_FAN_SPEED", "raw 0x3a 0x01 0xff")
+        self.assertFalse(l_result.is_ok())
+        self.assertEqual(len(l_result.mErrorLines), 1)
+        self.assertEqual(l_result.mLines, [])
+        with self.assertRaises(IPMISessionError):
+            self.mBackend.raw("SET_FAN_SPEED", "3a", "01", [0xff] * 8)
+
+    def test_failed_sensor_walk(self):
+        with self.assertRaises(IPMISessionError):
+            self.mBackend.read_all_sensors("READ_SENSORS")
+
+    def test_sensor_reading(self):
+        l_records = self.mBackend.read_sensors("READ_SENSORS", self.records(["CPU_Temp", "MB_Temp"]))
+        self.assertEqual([x.mReading for x in l_records], [45.0, None])
+
+    def test_empty_reading(self):
+        with self.assertRaises(IPMISessionError):
+            self.mBackend.read_sensors("READ_SENSORS", self.records(["NONE"]))
+
+    def test_lost_session_is_reopened(self):
+        l_lost_process = self.mBackend.mProcess
+        l_records = self.mBackend.read_sensors("READ_SENSORS", self.records(["GONE", "CPU_Temp"]))
+        self.assertEqual(l_records[1].mReading, 46.0)
+        self.assertTrue(self.mBackend.mProcess is not l_lost_process)
+        # the lost session was reaped
+        self.assertEqual(l_lost_process.returncode, 1)
+
+    def test_failed_open_is_reaped(self):
+        fan_control_sensors.IPMITOOL_PATH = self.write_script("failing_ipmitool", FAILING_IPMITOOL_SHELL)
+        self.mProcesses = []
+        with self.assertRaises(IPMISessionError):
+            cIpmitoolShellBackend(LOCAL_BMC_NODE, cFakeSDRCache(self.mDirectory))
+        self.assertEqual(len(self.mProcesses), 1)
+        self.assertReaped(self.mProcesses)
+
+    def test_unreachable_bmc_leaks_no_process(self):
+        fan_control_sensors.IPMITOOL_PATH = self.write_script("failing_ipmitool", FAILING_IPMITOOL_SHELL)
+        # the session is lost and cannot be reopened, then each cycle tries once more
+        for i in range(3):
+            with self.assertRaises(IPMISessionError):
+                self.mBackend.read_sensors("READ_SENSORS", self.records(["GONE"]))
+            self.assertTrue(self.mBackend.mProcess is None)
+        self.assertEqual(len(self.mProcesses), 4)
+        self.assertReaped(self.mProcesses[1:])
+        # the BMC is back
+        fan_control_sensors.IPMITOOL_PATH = self.mScript
+        l_records = self.mBackend.read_sensors("READ_SENSORS", self.records(["CPU_Temp"]))
+        self.assertEqual(l_records[0].mReading, 45.0)
+
+class cSDRCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.mDirectory = tempfile.mkdtemp()
+        self.mCacheDirectory = fan_control_sensors.SDR_CACHE_DIRECTORY
+        fan_control_sensors.SDR_CACHE_DIRECTORY = os.path.join(self.mDirectory, "cache")
+        self.mFirmwareRevision = fan_control_sensors.get_bmc_firmware_revision
+        self.mRecords = [cSensorRecord("1", "CPU_Temp", "Temperature", 45.0, "C", "ok"),
+                         cSensorRecord("51", "REAR_FAN1", "Fan", 3000.0, "RPM", "ok")]
+
+    def tearDown(self):
+        fan_control_sensors.SDR_CACHE_DIRECTORY = self.mCacheDirectory
+        fan_control_sensors.get_bmc_firmware_revision = self.mFirmwareRevision
+        shutil.rmtree(self.mDirectory)
+
+    def saved_cache(self, firmware_revision = "1.20", node_name = "node1"):
+        l_cache = cSDRCache("ipmitool", node_name, SERVER_NAME, firmware_revision)
+        l_cache.set_records(self.mRecords)
+        l_cache.save()
+        os.makedirs(l_cache.mBackendDirectory)
+        return l_cache
+
+    def open_cache(self, firmware_revision):
+        fan_control_sensors.get_bmc_firmware_revision = lambda node : firmware_revision
+        return open_sdr_cache("ipmitool", cBMCNode("node1", "10.0.0.1", "admin", "admin"))
+
+    def test_save_and_load(self):
+        self.saved_cache()
+        l_cache = cSDRCache("ipmitool", "node1", SERVER_NAME, "1.20")
+        self.assertTrue(l_cache.is_empty())
+        self.assertTrue(l_cache.load())
+        self.assertEqual([(x.mID, x.mName, x.mUnits, x.mReading) for x in l_cache.mRecords],
+                         [("1", "CPU_Temp", "C", None), ("51", "REAR_FAN1", "RPM", None)])
+        self.assertEqual(l_cache.get_sensor_id("REAR_FAN1"), "51")
+        self.assertEqual([x.mName for x in l_cache.get_records(["Fan"])], ["REAR_FAN1"])
+
+    def test_missing_or_corrupt_cache(self):
+        l_cache = cSDRCache("ipmitool", "node1", SERVER_NAME, "1.20")
+        self.assertFalse(l_cache.load())
+        os.makedirs(fan_control_sensors.SDR_CACHE_DIRECTORY)
+        with open(l_cache.mFile, "w") as f:
+            f.write("{not json")
+        self.assertFalse(l_cache.load())
+        self.assertTrue(l_cache.is_empty())
+
+    def test_same_firmware_revision(self):
+        self.saved_cache()
+        self.assertEqual(len(self.open_cache("1.20").mRecords), 2)
+
+    def test_firmware_revision_change(self):
+        l_old = self.saved_cache("1.20")
+        l_other_node = self.saved_cache("1.20", "node2")
+        l_cache = self.open_cache("1.30")
+        self.assertTrue(l_cache.is_empty())
+        # the files of the old revision of this node are removed, the other nodes keep theirs
+        self.assertFalse(os.path.exists(l_old.mFile))
+        self.assertFalse(os.path.exists(l_old.mBackendDirectory))
+        self.assertTrue(os.path.exists(l_other_node.mFile))
+        self.assertTrue(os.path.exists(l_other_node.mBackendDirectory))
+
+    def test_board_change(self):
+        l_old = self.saved_cache()
+        l_cache = cSDRCache("ipmitool", "node1", "S7200AP", "1.20")
+        self.assertFalse(l_cache.load())
+        l_cache.remove_stale_files()
+        self.assertFalse(os.path.exists(l_old.mFile))
+
+    def test_invalidate(self):
+        l_cache = self.saved_cache()
+        l_cache.invalidate()
+        self.assertTrue(l_cache.is_empty())
+        self.assertEqual(l_cache.get_sensor_id("CPU_Temp"), None)
+        self.assertFalse(os.path.exists(l_cache.mFile))
+        self.assertFalse(os.path.exists(l_cache.mBackendDirectory))
+
+    def test_failed_cached_read_rebuilds_the_cache(self):
+        # the fake BMC starts with a cache of its sensors, a cached read that fails invalidates it
+        l_node = cBMCNode("node1", FAKE_BMC_HOST)
+        l_backend = fan_control_sensors.get_ipmi_backend(l_node)
+        l_cache = l_backend.mSDRCache
+        l_read_sensors = l_backend.read_sensors
+        l_reads = []
+        def read_sensors(label, records):
+            l_reads.append([x.mName for x in records])
+            if(len(l_reads) == 1):
+                raise IPMISessionError("NO_SENSOR_READING")
+            return l_read_sensors(label, records)
+        l_backend.read_sensors = read_sensors
+        l_snapshot = read_sensor_snapshot(CONTROL_SENSOR_KINDS, l_node)
+        self.assertTrue(l_snapshot.get_record_by_name("CPU_Temp").mReading is not None)
+        # the cached read, then the walk of all the sensors
+        self.assertEqual(len(l_reads), 2)
+        self.assertFalse(l_cache.is_empty())
+        self.assertTrue(os.path.exists(l_cache.mFile))
+        l_saved = cSDRCache("fake", "node1", "fake", "fake")
+        self.assertTrue(l_saved.load())
+        self.assertEqual(len(l_saved.mRecords), len(l_cache.mRecords))
+        # the next cycle reads the sensors from the new cache
+        read_sensor_snapshot(CONTROL_SENSOR_KINDS, l_node)
+        self.assertEqual(len(l_reads), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
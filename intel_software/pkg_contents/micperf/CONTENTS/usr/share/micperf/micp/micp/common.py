@@ -82,6 +82,8 @@ E_MPSS_NA = 89
 E_LOOKUP = 90
 # Missing dependency
 E_DEP = 91
+# Kernel timeout
+E_TIMEOUT = 124
 # No executable
 E_EXEC = 126
 # Missing library
@@ -17,6 +17,10 @@ import subprocess
 import shlex
 import socket
 import re
+import tarfile
+import tempfile
+import hashlib
+import threading
 import xml.etree.ElementTree
 
 import common as micp_common
@@ -25,8 +29,18 @@ import common as micp_common
 Environment Variables to override implementation:
     INTEL_MPSS_USER:     UID of device side user, defaults to getpass.getuser().
     INTEL_MPSS_SSH_KEY:  Path to SSH key to log into device.
+    INTEL_MPSS_SSH_CONTROL_PERSIST:  Seconds an idle multiplexed SSH
+                         connection is kept open, defaults to 60, 0
+                         disables the multiplexing.
+    INTEL_MPSS_TAR_COMPRESS:  Set to 1 to gzip the tar stream used to
+                         copy several files at once to a device.
 """
 
+# OpenSSH connection multiplexing: the first ssh or scp command to a
+# device opens a master connection, the next ones reuse its channel
+# instead of doing a full handshake.
+SSH_CONTROL_PERSIST = 60
+
 class Connect(object):
     def __init__(self):
         raise NotImplementedError('Abstract base class')
@@ -119,11 +133,49 @@ class SSLConnect(Connect):
         return self._connect.Popen(args, **kwargs)
 
     def copyto(self, source, dest):
+        if type(source) is not str and len(source) > 1:
+            return self.copyto_tar(source, dest)
         return self._connect.copyto(source, dest)
 
     def copyfrom(self, source, dest):
         return self._connect.copyfrom(source, dest)
 
+    @staticmethod
+    def _tar_compress():
+        return os.environ.get('INTEL_MPSS_TAR_COMPRESS', '0') == '1'
+
+    def copyto_tar(self, source, dest):
+        """
+        Copies the local files or directories in source to the dest
+        directory of the connected system with a single tar stream
+        instead of one scp per file.
+        """
+        tarArgs = ['tar', '-x', '-f', '-', '-C', dest]
+        mode = 'w|'
+        if self._tar_compress():
+            tarArgs.insert(1, '-z')
+            mode = 'w|gz'
+        # nobody reads the output of the remote tar while the stream is
+        # written, a pipe filled by its warnings would block the transfer
+        output = tempfile.TemporaryFile()
+        try:
+            pid = self.Popen(tarArgs, stdout=output, stderr=output)
+            try:
+                archive = tarfile.open(fileobj=pid.stdin, mode=mode)
+                for src in source:
+                    archive.add(src, arcname=os.path.basename(src.rstrip('/')))
+                archive.close()
+            except IOError:
+                # the remote tar exited, its error is reported below
+                pass
+            pid.communicate()
+            if pid.returncode != 0:
+                output.seek(0)
+                sys.stderr.write(output.read())
+                raise subprocess.CalledProcessError(pid.returncode, tarArgs)
+        finally:
+            output.close()
+
 
 class MPSSConnect(Connect):
     def __init__(self, host):
@@ -196,10 +248,15 @@ class MPSSConnect(Connect):
                     try:
                         result = self._get_offload_index_from_loose_match()
                     except GetOffloadIndexError as looseErr:
-                        errStr = ' AND \n        '.join((exactErr.__str__(),
-                                                         configErr.__str__(),
-                                                         looseErr.__str__()))
-                        raise GetOffloadIndexError(errStr)
+                        if micp_common.is_selfboot_platform():
+                            # another self-boot node, it runs its kernels
+                            # itself like the local node
+                            result = -1
+                        else:
+                            errStr = ' AND \n        '.join((exactErr.__str__(),
+                                                             configErr.__str__(),
+                                                             looseErr.__str__()))
+                            raise GetOffloadIndexError(errStr)
         self._offloadIndex = result
         return result
 
@@ -219,7 +276,7 @@ class MPSSConnect(Connect):
             hwinf = pid.communicate()[0]
             result = [index for (serialNo, index) in serialMap if serialNo in hwinf][0]
             return result
-        except (ValueError, IOError, IndexError):
+        except (ValueError, IOError, OSError, IndexError):
             raise GetOffloadIndexError('Could not determine mic index from sysfs entries')
 
     def _get_offload_index_from_xmlconfig(self):
@@ -266,11 +323,32 @@ class LinuxSSLConnect(Connect):
         self._user = user
         self._sslkey = sslkey
 
+    def _control_options(self):
+        """ssh and scp options sharing one master connection per host"""
+        persist = os.environ.get('INTEL_MPSS_SSH_CONTROL_PERSIST',
+                                 str(SSH_CONTROL_PERSIST))
+        if persist == '0':
+            return []
+        # short path, sockets are limited to about 100 characters
+        controlDir = '/tmp/micperf-ssh-{0}'.format(os.getuid())
+        try:
+            os.mkdir(controlDir, 0700)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                return []
+        # do not share sockets with another user
+        if os.stat(controlDir).st_uid != os.getuid():
+            return []
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath={0}/%r@%h:%p'.format(controlDir),
+                '-o', 'ControlPersist={0}'.format(persist)]
+
     def Popen(self, args, **kwargs):
         kwargs['shell'] = False
         if type(args) is str:
             args = shlex.split(args)
         sshArgs = ['ssh']
+        sshArgs.extend(self._control_options())
         if self._sslkey:
             sshArgs.extend(['-i', self._sslkey])
         if self._user:
@@ -287,6 +365,7 @@ class LinuxSSLConnect(Connect):
         else:
             devPath = '{0}:{1}'.format(self._host, dest)
         scpArgs = ['scp', '-r', '-p']
+        scpArgs.extend(self._control_options())
         if self._sslkey:
             scpArgs.extend([ '-i', self._sslkey])
         scpArgs.extend(source)
@@ -314,6 +393,7 @@ class LinuxSSLConnect(Connect):
             else:
                 devPath = '{0}:{1}'.format(self._host, src)
             scpArgs = ['scp', '-r', '-p']
+            scpArgs.extend(self._control_options())
             if self._sslkey:
                 scpArgs.extend(['-i', self._sslkey])
             scpArgs.append(devPath)
@@ -406,6 +486,54 @@ class WinSSLConnect(Connect):
                 raise subprocess.CalledProcessError(pid.returncode, scpArgs)
 
 
+_digestCache = {}
+_digestLock = threading.Lock()
+
+def file_digest(path):
+    """
+    sha1 of a local file, the digest is computed again only when the
+    size or the modification time of the file change
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    with _digestLock:
+        if key in _digestCache:
+            return _digestCache[key]
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(1 << 20), ''):
+            sha1.update(chunk)
+    with _digestLock:
+        _digestCache[key] = sha1.hexdigest()
+    return _digestCache[key]
+
+def stage_files(connect, source, dest):
+    """
+    Copies the local files in source to the dest directory of the
+    connected system unless a file with the same name and the same
+    sha1 is already there.  The files are left in place so that the
+    next kernel executions reuse them, directories are always copied.
+    Returns the list of files copied.
+    """
+    names = [os.path.basename(ff) for ff in source if os.path.isfile(ff)]
+    remoteDigest = {}
+    if names:
+        # sha1sum prints nothing for the missing files
+        paths = [dest.rstrip('/') + '/' + name for name in names]
+        pid = connect.Popen(['sha1sum'] + paths)
+        out, err = pid.communicate()
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                remoteDigest[os.path.basename(fields[1].lstrip('*'))] = fields[0]
+    toCopy = [ff for ff in source
+              if not os.path.isfile(ff) or
+              remoteDigest.get(os.path.basename(ff)) != file_digest(ff)]
+    if toCopy:
+        connect.copyto(toCopy, dest)
+    return toCopy
+
+
 class GetOffloadIndexError(Exception):
     pass
 
@@ -23,6 +23,9 @@ import distutils.version
 import copy
 import platform
 import sys
+import threading
+import cPickle
+import tempfile
 
 import common as micp_common
 import connect as micp_connect
@@ -41,6 +44,140 @@ MAX_THREADS_SNC4 = 16
 INTEL_KNL = "KNL"
 INTEL_KNM = "KNM"
 
+# DMI types selected by the dmidecode -t keywords, a single full dump
+# of the SMBIOS table is split into the per keyword outputs
+DMIDECODE_KEYWORD_TYPES = {'bios': (0, 13),
+                           'system': (1, 12, 15, 23, 32),
+                           'baseboard': (2, 10, 41),
+                           'chassis': (3,),
+                           'processor': (4,),
+                           'memory': (5, 6, 16, 17),
+                           'cache': (7,),
+                           'connector': (8,),
+                           'slot': (9,)}
+DMIDECODE_COMMAND = 'dmidecode -t '
+
+def split_dmidecode_dump(dump, keyword):
+    """
+    returns the part of a full dmidecode dump that 'dmidecode -t keyword'
+    prints: the dump header followed by the structures of the DMI types
+    selected by keyword
+    """
+    dmiTypes = DMIDECODE_KEYWORD_TYPES[keyword]
+    handleExpr = re.compile(r'^Handle 0x[0-9A-Fa-f]+, DMI type (\d+),', re.MULTILINE)
+    header = []
+    result = []
+    for section in dump.split('\n\n'):
+        if not section.strip():
+            continue
+        match = handleExpr.search(section)
+        if match is None:
+            if not result:
+                header.append(section)
+        elif int(match.group(1)) in dmiTypes:
+            result.append(section.strip('\n'))
+    return '\n\n'.join(header + result) + '\n'
+
+# The system description is saved on disk and reused as long as the
+# node has not been rebooted and runs the same kernel and micperf.
+# MIC_PERF_INFO_CACHE overrides the cache file, empty to disable the
+# cache, clear_info_cache() (micpinfo --refresh) removes it.
+INFO_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'micperf',
+                               'info_cache.pkl')
+INFO_BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+# commands run again when the cache is used, their output does not
+# depend on the boot
+INFO_VOLATILE_COMMANDS = ('env', 'set')
+
+def normalized_sku(sku):
+    """SKU name without the deprecated names and the QS and PRQ marks,
+    two systems have the same SKU when their normalized SKUs are equal"""
+    deprecationDict = {'B1QS-7110 P/A': 'B1QS-7110 P/A/X',
+                       'C0-3120P/3120A': 'C0-3120 P/A',
+                       'C0-5110P/5120D': 'C0-5110P',
+                       'C0-7120P/7120X/7120': 'C0-7120 P/A/X/D'}
+    sku = deprecationDict.get(sku, sku)
+    sku = sku.replace('QS', '')
+    sku = sku.replace('PRQ', '')
+    return sku
+
+def _info_cache_file():
+    return os.environ.get('MIC_PERF_INFO_CACHE', INFO_CACHE_FILE)
+
+def _info_cache_key():
+    """boot ID, kernel release and micperf version, None if the boot ID
+    is not available (e.g. on Windows)"""
+    try:
+        with open(INFO_BOOT_ID_FILE) as fid:
+            bootId = fid.read().strip()
+    except (IOError, OSError):
+        return None
+    return (bootId, platform.release(), micp_version.__version__)
+
+def load_info_cache():
+    """returns the state of the InfoKNXSB object saved since the last
+    boot, None if there is none"""
+    cacheFile = _info_cache_file()
+    key = _info_cache_key()
+    if not cacheFile or key is None:
+        return None
+    try:
+        with open(cacheFile, 'rb') as fid:
+            (cacheKey, state) = cPickle.load(fid)
+    except Exception:
+        return None
+    if cacheKey != key:
+        return None
+    return state
+
+def save_info_cache(state):
+    """saves the state of an InfoKNXSB object, errors are ignored"""
+    cacheFile = _info_cache_file()
+    key = _info_cache_key()
+    if not cacheFile or key is None:
+        return
+    try:
+        cacheDir = os.path.dirname(os.path.abspath(cacheFile))
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir, 0700)
+        # written next to the cache and renamed, a concurrent reader sees
+        # either the old or the new cache
+        (fd, tmpName) = tempfile.mkstemp(dir=cacheDir)
+        with os.fdopen(fd, 'wb') as fid:
+            cPickle.dump((key, state), fid, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpName, cacheFile)
+    except (IOError, OSError, cPickle.PicklingError):
+        pass
+
+def clear_info_cache():
+    """removes the saved system description, the next Info() gathers it
+    again"""
+    cacheFile = _info_cache_file()
+    if cacheFile and os.path.exists(cacheFile):
+        os.remove(cacheFile)
+
+def _map_threads(function, argList):
+    """
+    returns [function(arg) for arg in argList], the calls are done at
+    the same time in separate threads
+    """
+    results = [None] * len(argList)
+    errors = []
+    def worker(index):
+        try:
+            results[index] = function(argList[index])
+        except Exception:
+            errors.append(sys.exc_info())
+    threads = [threading.Thread(target=worker, args=(index,))
+               for index in range(len(argList))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
 def system_hw_hash():
     return Info().system_hw_hash()
 
@@ -90,6 +227,25 @@ def mic_sku(devIdx):
     info.set_device_index(origIdx)
     return result
 
+def device_sku(device):
+    """
+    normalized SKU of a device given as to micprun -d: the SKU of a
+    coprocessor, of this host or of another self-boot node read from its
+    /proc/cpuinfo, 'NotAvailable' when it can not be determined
+    """
+    connect = micp_connect.MPSSConnect(device)
+    devIdx = connect.get_offload_index()
+    if devIdx >= 0:
+        return normalized_sku(mic_sku(devIdx))
+    if device in micp_common.LOCAL_HOST_ID:
+        return normalized_sku(Info().mic_sku())
+    pid = connect.Popen(micp_common.READ_CPUINFO_PROCFS)
+    cpuinfo, __ = pid.communicate()
+    sku = re.search(r'model name\s*:.*?(72\d\d)', cpuinfo)
+    if pid.returncode or not sku:
+        return 'NotAvailable'
+    return normalized_sku(sku.group(1))
+
 
 class InfoKNXXB(object):
     """
@@ -411,69 +567,94 @@ class InfoKNXXB(object):
     def _init_command_dict(self):
         """
         runs a set the commands on the host to determine the system
-        configuration.
+        configuration.  The commands are independent and run at the same
+        time, the SMBIOS table is read once by a single dmidecode and
+        split into the 'dmidecode -t keyword' outputs.
         """
         self._commandDict = {}
-        missing_commands = set()
-        for cmd in self._get_command_list():
-            try:
-                pid = subprocess.Popen(shlex.split(cmd),
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE,
-                                       bufsize=-1,
-                                       shell=micp_common.is_platform_windows())
-                out, err = pid.communicate()
-                self._commandDict[cmd] = '\n'.join((out, err))
-            except OSError:
-                if cmd.startswith('lspci'):
-                    try:
-                        cmd = '/sbin/' + cmd
-                        pid = subprocess.Popen(shlex.split(cmd),
-                                               stdout=subprocess.PIPE,
-                                               stderr=subprocess.PIPE,
-                                               bufsize=-1)
-                        out, err = pid.communicate()
-                        self._commandDict[cmd] = '\n'.join((out, err))
-                    except OSError:
-                        sys.stderr.write('WARNING: '
-                            'Could not find lspci in path, '
-                            'and it is not located in /sbin/lspci.\n')
-                        self._commandDict[cmd] = ''
-                elif cmd.startswith('/'):
-                    try:
-                        cmdList = shlex.split(cmd)
-                        origPath = cmdList[0]
-                        cmdList[0] = os.path.basename(origPath)
-                        cmd = ' '.join(cmdList)
-                        pid = subprocess.Popen(cmdList,
-                                               stdout=subprocess.PIPE,
-                                               stderr=subprocess.PIPE,
-                                               bufsize=-1)
-                        out, err = pid.communicate()
-                        self._commandDict[cmd] = '\n'.join((out, err))
-                    except OSError:
-                        warning_msg = 'WARNING: Could not find {0} or {1}.\n'
-                        sys.stderr.write(warning_msg.format(origPath, cmdList[0]))
-                        self._commandDict[cmd] = ''
-                elif cmd == 'set':
-                    self._commandDict[cmd] = '\n'.join(
-                                sorted(['{0}={1}'.format(var, val)
-                                for (var, val)
-                                in zip(os.environ.keys(), os.environ.values())])
-                            )
-                elif cmd.startswith('type '):
-                    try:
-                        self._commandDict[cmd] = open(cmd[5:]).read()
-                    except (IOError, IndexError):
-                        self._commandDict[cmd] = ''
-                else:
-                    self._commandDict[cmd] = ''
-                    command = cmd.split()[0]
+        commands = self._get_command_list()
+        dmiCommands = [cmd for cmd in commands if cmd.startswith(DMIDECODE_COMMAND)]
+        commands = [cmd for cmd in commands if cmd not in dmiCommands]
+        if dmiCommands:
+            commands.append('dmidecode')
 
-                    # print warning message only once per missing command
-                    if command not in missing_commands:
-                        sys.stderr.write('WARNING: Could not find {0}.\n'.format(command))
-                        missing_commands.add(command)
+        missing_commands = set()
+        for (cmd, output, missing) in _map_threads(self._run_info_command, commands):
+            if cmd == 'dmidecode':
+                for dmiCmd in dmiCommands:
+                    if missing:
+                        self._commandDict[dmiCmd] = ''
+                    else:
+                        keyword = dmiCmd[len(DMIDECODE_COMMAND):]
+                        self._commandDict[dmiCmd] = split_dmidecode_dump(output, keyword)
+            else:
+                self._commandDict[cmd] = output
+
+            # print warning message only once per missing command
+            if missing and missing not in missing_commands:
+                sys.stderr.write('WARNING: Could not find {0}.\n'.format(missing))
+                missing_commands.add(missing)
+
+    def _run_info_command(self, cmd):
+        """
+        runs one of the commands of _init_command_dict(), returns the
+        tuple (cmd, output, missing) where missing is the name of the
+        command if it was not found, None otherwise.  cmd may be
+        modified when the command is found at another location.
+        """
+        missing = None
+        output = ''
+        try:
+            pid = subprocess.Popen(shlex.split(cmd),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   bufsize=-1,
+                                   shell=micp_common.is_platform_windows())
+            out, err = pid.communicate()
+            output = '\n'.join((out, err))
+        except OSError:
+            if cmd.startswith('lspci'):
+                try:
+                    cmd = '/sbin/' + cmd
+                    pid = subprocess.Popen(shlex.split(cmd),
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.PIPE,
+                                           bufsize=-1)
+                    out, err = pid.communicate()
+                    output = '\n'.join((out, err))
+                except OSError:
+                    sys.stderr.write('WARNING: '
+                        'Could not find lspci in path, '
+                        'and it is not located in /sbin/lspci.\n')
+            elif cmd.startswith('/'):
+                try:
+                    cmdList = shlex.split(cmd)
+                    origPath = cmdList[0]
+                    cmdList[0] = os.path.basename(origPath)
+                    cmd = ' '.join(cmdList)
+                    pid = subprocess.Popen(cmdList,
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.PIPE,
+                                           bufsize=-1)
+                    out, err = pid.communicate()
+                    output = '\n'.join((out, err))
+                except OSError:
+                    warning_msg = 'WARNING: Could not find {0} or {1}.\n'
+                    sys.stderr.write(warning_msg.format(origPath, cmdList[0]))
+            elif cmd == 'set':
+                output = '\n'.join(
+                            sorted(['{0}={1}'.format(var, val)
+                            for (var, val)
+                            in zip(os.environ.keys(), os.environ.values())])
+                        )
+            elif cmd.startswith('type '):
+                try:
+                    output = open(cmd[5:]).read()
+                except (IOError, IndexError):
+                    pass
+            else:
+                missing = cmd.split()[0]
+        return (cmd, output, missing)
 
     def _init_micinfo_dict(self):
         """
@@ -592,18 +773,7 @@ class InfoKNXXB(object):
 
     def is_same_sku(self, other):
         """method used by micperf-pt"""
-        deprecationDict = {'B1QS-7110 P/A': 'B1QS-7110 P/A/X',
-                           'C0-3120P/3120A': 'C0-3120 P/A',
-                           'C0-5110P/5120D': 'C0-5110P',
-                           'C0-7120P/7120X/7120': 'C0-7120 P/A/X/D'}
-        mySku = deprecationDict.get(self.mic_sku(), self.mic_sku())
-        mySku = mySku.replace('QS', '')
-        mySku = mySku.replace('PRQ', '')
-
-        otherSku = deprecationDict.get(other.mic_sku(), other.mic_sku())
-        otherSku = otherSku.replace('QS', '')
-        otherSku = otherSku.replace('PRQ', '')
-        return mySku == otherSku
+        return normalized_sku(self.mic_sku()) == normalized_sku(other.mic_sku())
 
     def is_same_hw(self, other):
         """method used by micperf-pt"""
@@ -956,6 +1126,25 @@ class InfoKNXSB(InfoKNXXB):
             self._linux_init_micinfo_dict()
 
 
+    @classmethod
+    def from_cache(cls):
+        """
+        returns an InfoKNXSB object restored from the on disk cache (see
+        load_info_cache()), the object is created and saved in the cache
+        if there is no valid cache
+        """
+        state = load_info_cache()
+        if state is None:
+            result = cls()
+            save_info_cache(result.__dict__)
+            return result
+        result = cls.__new__(cls)
+        result.__dict__.update(state)
+        for cmd in INFO_VOLATILE_COMMANDS:
+            if cmd in result._commandDict:
+                (__, result._commandDict[cmd], __) = result._run_info_command(cmd)
+        return result
+
     def get_device_name(self):
         """returns the default SB device _SB_HOST, see set_device_name()"""
         return self._SB_HOST
@@ -1465,7 +1654,7 @@ class Info(InfoKNXLB, Borg):
         """create an InfoKNXLB or an InfoKNXSB object"""
         Borg.__init__(self)
         if self.__dict__ == {}:
-            self._device = InfoKNXSB()
+            self._device = InfoKNXSB.from_cache()
 
     def __str__(self, categories=None):
         """
@@ -0,0 +1,139 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Write-ahead journal of a micprun sweep.  The stats of each kernel
+execution are appended to the journal as soon as the execution
+completes, an interrupted sweep can then be resumed (micprun --resume)
+without running again the parameters already measured.
+"""
+
+import os
+import cPickle
+import threading
+
+import common as micp_common
+
+from micp.common import mp_print, CAT_INFO, CAT_WARN
+
+# run arguments that must be the same to resume a sweep
+JOURNAL_RUN_ARGS = ('kernelNames', 'offMethod', 'paramCat', 'kernelArgs',
+                    'devIdx', 'repeat', 'warmup')
+
+CONST_RESUMING = \
+"""Resuming from journal {0}, {1} kernel executions already completed."""
+
+CONST_DISCARDED = \
+"""Journal {0} of a previous sweep is discarded, use --resume to
+continue that sweep instead."""
+
+CONST_TRUNCATED = \
+"""Last record of journal {0} is incomplete and was ignored."""
+
+
+class JournalMismatchError(micp_common.MicpException):
+    """the journal was written by a sweep with different arguments"""
+    def micp_exit_code(self):
+        return micp_common.E_PARSE
+
+
+def journal_file_name(pickleFileName):
+    """the journal is written next to the pickle file of the sweep"""
+    return os.path.splitext(pickleFileName)[0] + '.journal'
+
+
+class Journal(object):
+    """
+    Append only file of records, the first record holds the run
+    arguments of the sweep, the next ones are tuples (deviceTag,
+    kernelName, offloadName, xName, paramStr, statsList), one for each
+    completed kernel execution.  Records are flushed to the disk one
+    by one, a record cut by a crash is ignored when the journal is
+    read again.
+    """
+    def __init__(self, fileName, runArgs, resume=False):
+        self._fileName = fileName
+        self._lock = threading.Lock()
+        self._completed = {}
+        runArgs = dict((key, runArgs.get(key)) for key in JOURNAL_RUN_ARGS)
+
+        if resume and os.path.exists(fileName):
+            self._load(runArgs)
+            mp_print(CONST_RESUMING.format(fileName, self.num_completed()),
+                CAT_INFO)
+            self._fid = open(fileName, 'ab')
+        else:
+            if os.path.exists(fileName):
+                mp_print(CONST_DISCARDED.format(fileName), CAT_WARN)
+            self._fid = open(fileName, 'wb')
+            self._write(runArgs)
+
+    def _load(self, runArgs):
+        validSize = 0
+        with open(self._fileName, 'rb') as fid:
+            try:
+                journalArgs = cPickle.load(fid)
+            except Exception:
+                journalArgs = None
+            if journalArgs != runArgs:
+                raise JournalMismatchError(
+                    'Journal {0} was written by a sweep with different '
+                    'arguments: {1}'.format(self._fileName, journalArgs))
+            validSize = fid.tell()
+            while True:
+                try:
+                    record = cPickle.load(fid)
+                except EOFError:
+                    break
+                except Exception:
+                    mp_print(CONST_TRUNCATED.format(self._fileName), CAT_WARN)
+                    break
+                self._completed[record[:3] + (record[4],)] = record
+                validSize = fid.tell()
+        # drop a partial record so that new records can be read back
+        with open(self._fileName, 'r+b') as fid:
+            fid.truncate(validSize)
+
+    def _write(self, record):
+        with self._lock:
+            cPickle.dump(record, self._fid, cPickle.HIGHEST_PROTOCOL)
+            self._fid.flush()
+            os.fsync(self._fid.fileno())
+
+    def record(self, deviceTag, kernelName, offloadName, xName, param, stats):
+        """appends the stats of one completed kernel execution"""
+        record = (deviceTag, kernelName, offloadName, xName, str(param), list(stats))
+        self._write(record)
+        with self._lock:
+            self._completed[record[:3] + (record[4],)] = record
+
+    def is_completed(self, deviceTag, kernelName, offloadName, param):
+        with self._lock:
+            return (deviceTag, kernelName, offloadName, str(param)) in self._completed
+
+    def completed_stats(self, deviceTag, kernelName, offloadName, paramList):
+        """stats recorded for the parameters in paramList, in that order"""
+        result = []
+        with self._lock:
+            for param in paramList:
+                record = self._completed.get((deviceTag, kernelName, offloadName, str(param)))
+                if record:
+                    result.extend(record[5])
+        return result
+
+    def num_completed(self):
+        with self._lock:
+            return len(self._completed)
+
+    def close(self):
+        self._fid.close()
+
+    def remove(self):
+        """to be called once the sweep is complete and its results are
+        saved in the pickle file"""
+        self.close()
+        os.remove(self._fileName)
@@ -0,0 +1,191 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Statistical models of the performance measured by past runs.  The runs
+of a StatsCollectionStore are grouped by SKU, memory mode and cluster
+mode and the distribution of each measured point is fitted within each
+group.  The models are saved as JSON files, micprun -m selects the
+group of the system it runs on and tests the new results against the
+fitted distributions instead of a fixed margin.
+"""
+
+import json
+
+import info as micp_info
+import stats as micp_stats
+import regression as micp_regression
+import common as micp_common
+
+MODEL_FORMAT = 1
+
+# points measured by less runs are left out of the model
+DEFAULT_MIN_RUNS = 3
+
+# All2All, Hemisphere and Quadrant modes all have a single NUMA node
+# with CPUs and are not told apart
+CLUSTER_MODES = {1: 'quadrant', 2: 'snc2', 4: 'snc4'}
+
+# memory mode of the runs whose tag has no mcdram_/ddr_ prefix
+# (coprocessors)
+NO_MEMORY_MODE = 'none'
+
+CONST_NO_GROUP = \
+"""Statistical model {0} has no group for this system ({1}), available
+groups: {2}"""
+
+
+class ModelError(micp_common.MicpException):
+    """the model file can not be read or does not match the system"""
+    def micp_exit_code(self):
+        return micp_common.E_PARSE
+
+
+def memory_mode(tag):
+    """memory mode given by the prefix of a run tag"""
+    for mode in ('mcdram', 'ddr'):
+        if tag.startswith(mode + '_'):
+            return mode
+    return NO_MEMORY_MODE
+
+
+def cluster_mode(info):
+    """cluster mode of the system described by info"""
+    try:
+        nodes = info.get_number_of_nodes_with_cpus()
+    except Exception:
+        return 'unknown'
+    return CLUSTER_MODES.get(nodes, 'numa{0}'.format(nodes))
+
+
+def group_key(sku, memory, cluster):
+    return '/'.join((sku, memory, cluster))
+
+
+def run_group(statsColl):
+    """group key of a stored run"""
+    sku = micp_info.normalized_sku(statsColl.info.mic_sku())
+    return group_key(sku, memory_mode(statsColl.tag), cluster_mode(statsColl.info))
+
+
+def system_group(info=None):
+    """group key of the system micprun runs on"""
+    if info is None:
+        info = micp_info.Info()
+    if micp_common.is_selfboot_platform():
+        if info.is_processor_mcdram_available():
+            memory = 'mcdram'
+        else:
+            memory = 'ddr'
+    else:
+        memory = NO_MEMORY_MODE
+    sku = micp_info.normalized_sku(info.mic_sku())
+    return group_key(sku, memory, cluster_mode(info))
+
+
+def fit_point(values):
+    """
+    fitted distribution of the values measured for one point: median
+    and standard deviation estimated from the median absolute deviation
+    so that a few outlier runs do not widen the model, the mean and
+    sample standard deviation are kept for reference
+    """
+    count = len(values)
+    mean = sum(values) / count
+    if count > 1:
+        stdev = (sum((vv - mean)**2 for vv in values) / (count - 1)) ** 0.5
+    else:
+        stdev = 0.0
+    median = micp_regression.median(values)
+    mad = micp_regression.median_abs_deviation(values)
+    robustStdev = micp_regression.MAD_NORMAL_SCALE * mad
+    if robustStdev == 0:
+        # more than half of the values are equal
+        robustStdev = stdev
+    return {'count': count, 'median': median, 'mad': mad, 'mean': mean,
+            'stdev': stdev, 'robust_stdev': robustStdev}
+
+
+def build_model(statsCollList, minRuns=DEFAULT_MIN_RUNS):
+    """
+    returns the model of the runs in statsCollList, a dictionary
+    {'format': MODEL_FORMAT, 'groups': {groupKey: group}}, each group
+    holding the tags of its runs and model[kernel][offload][desc], the
+    fitted distribution (see fit_point()) of the value compared by the
+    statistical regression test.  Runs repeated with micprun --repeat
+    contribute their whole sample, values tagged as thermally throttled
+    are left out.
+    """
+    groups = {}
+    for statsColl in statsCollList:
+        key = run_group(statsColl)
+        group = groups.setdefault(key, {'runs': [], 'values': {}})
+        group['runs'].append(statsColl.tag)
+        for kernel in statsColl._store:
+            for offload in statsColl._store[kernel]:
+                offloadName = micp_stats.split_offload(offload)[0]
+                for stat in statsColl._store[kernel][offload]:
+                    # values measured on a thermally throttled node
+                    # would widen and lower the fitted distribution
+                    if stat.is_thermally_throttled():
+                        continue
+                    tag = micp_regression.model_tag(stat)
+                    if tag is None:
+                        continue
+                    sample = stat.sample(tag)
+                    if not sample:
+                        sample = [micp_regression.perf_value(stat, tag)]
+                    point = (kernel, offloadName, stat.desc)
+                    group['values'].setdefault(point, []).extend(sample)
+
+    result = {'format': MODEL_FORMAT, 'groups': {}}
+    for (key, group) in groups.items():
+        model = {}
+        for ((kernel, offload, desc), values) in group['values'].items():
+            values = [vv for vv in values if vv == vv]
+            if len(values) < minRuns:
+                continue
+            model.setdefault(kernel, {}).setdefault(offload, {})[desc] = fit_point(values)
+        sku, memory, cluster = key.split('/')
+        result['groups'][key] = {'sku': sku, 'memory': memory, 'cluster': cluster,
+                                 'runs': sorted(group['runs']), 'model': model}
+    return result
+
+
+def save_model(model, fileName):
+    with open(fileName, 'w') as fid:
+        json.dump(model, fid, indent=1, sort_keys=True)
+
+
+def load_model(fileName, info=None):
+    """
+    returns the statistical model of the group of this system in the
+    model file, model[kernel][offload][desc] = (center, spread) as
+    expected by StatsCollection.perf_regression_test()
+    """
+    try:
+        with open(fileName) as fid:
+            model = json.load(fid)
+    except (IOError, ValueError) as err:
+        raise ModelError('Could not read statistical model {0}: {1}'.format(fileName, err))
+    if type(model) is not dict or model.get('format') != MODEL_FORMAT:
+        raise ModelError('{0} is not a statistical model file'.format(fileName))
+
+    key = system_group(info)
+    try:
+        group = model['groups'][key]
+    except KeyError:
+        raise ModelError(CONST_NO_GROUP.format(fileName, key,
+            ', '.join(sorted(model['groups'])) or 'none'))
+
+    result = {}
+    for (kernel, offloads) in group['model'].items():
+        for (offload, points) in offloads.items():
+            result.setdefault(str(kernel), {})[str(offload)] = dict(
+                (desc, (point['median'], point['robust_stdev']))
+                for (desc, point) in points.items())
+    return result
@@ -13,6 +13,9 @@ import copy
 import sys
 import shutil
 import socket
+import select
+import errno
+import time
 from math import copysign
 
 import params as micp_params
@@ -28,10 +31,167 @@ CONST_EXECUTABLE_NOT_FOUND = 'Executable for kernel {} and offload {} does not e
 
 CONST_NOT_SUPPORTED_KERNEL = 'Micperf kernel "{}" does not support the "{}" offload method, skipping.'
 
+CONST_KERNEL_TIMEOUT = 'Kernel {} did not complete within {} seconds, it has been stopped.'
+
+class KernelTimeoutError(micp_common.MicpException):
+    """Exception raised when a kernel runs longer than the timeout given
+    to the offload method"""
+    def micp_exit_code(self):
+        return micp_common.E_TIMEOUT
+
+class _LineSink(object):
+    """Incremental parser of a process output: splits the chunks read
+    from the pipe into lines and gives each complete line to writeLine
+    as soon as it is received"""
+    def __init__(self, writeLine):
+        self._writeLine = writeLine
+        self._partial = ''
+
+    def write(self, chunk):
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._writeLine(line + '\n')
+
+    def close(self):
+        if self._partial:
+            self._writeLine(self._partial + '\n')
+            self._partial = ''
+
+def _write_stdout(line):
+    sys.stdout.write(line)
+    sys.stdout.flush()
+
+def _write_stderr(line):
+    sys.stderr.write(line)
+    sys.stderr.flush()
+
+class StreamEngine(object):
+    """Runs the device and the host processes of a kernel at the same
+    time.  The standard output and error of all the processes are read
+    with select() as soon as data is available and streamed to their
+    sinks (live progress of long kernels, no process can block on a full
+    pipe).  The processes still running when the timeout expires or when
+    an exception is raised are left to the caller which kills them."""
+
+    _READ_SIZE = 65536
+    _SELECT_INTERVAL = 1.0
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, timeout=None):
+        self._timeout = timeout
+        self._procs = {}
+        self._streams = {}
+        self._sinks = {}
+        self._output = {}
+
+    def add_process(self, procName, proc, outSink=None, errSink=None):
+        """adds a started process, its standard input is closed"""
+        if proc.stdin:
+            proc.stdin.close()
+        self._procs[procName] = proc
+        for (streamName, stream, sink) in (('out', proc.stdout, outSink),
+                                           ('err', proc.stderr, errSink)):
+            self._output[(procName, streamName)] = []
+            self._sinks[(procName, streamName)] = sink
+            if stream is not None:
+                self._streams[stream.fileno()] = (procName, streamName)
+
+    def run(self, kernelName):
+        """returns a dictionary {procName: (stdout, stderr)} once all the
+        processes have ended"""
+        deadline = None
+        if self._timeout:
+            deadline = time.time() + self._timeout
+        if micp_common.is_platform_windows():
+            # select() does not support pipes on Windows
+            self._communicate()
+        else:
+            self._select_loop(kernelName, deadline)
+        for proc in self._procs.values():
+            while proc.poll() is None:
+                self._check_deadline(kernelName, deadline)
+                time.sleep(self._POLL_INTERVAL)
+        return dict([(procName, (''.join(self._output[(procName, 'out')]),
+                                 ''.join(self._output[(procName, 'err')])))
+                     for procName in self._procs])
+
+    def _check_deadline(self, kernelName, deadline):
+        if deadline is not None and time.time() >= deadline:
+            raise KernelTimeoutError(CONST_KERNEL_TIMEOUT.format(kernelName, self._timeout))
+
+    def _select_loop(self, kernelName, deadline):
+        while self._streams:
+            self._check_deadline(kernelName, deadline)
+            wait = self._SELECT_INTERVAL
+            if deadline is not None:
+                wait = max(0, min(wait, deadline - time.time()))
+            try:
+                ready = select.select(self._streams.keys(), [], [], wait)[0]
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                key = self._streams[fd]
+                chunk = os.read(fd, self._READ_SIZE)
+                if chunk:
+                    self._output[key].append(chunk)
+                    if self._sinks[key]:
+                        self._sinks[key].write(chunk)
+                else:
+                    del self._streams[fd]
+                    if self._sinks[key]:
+                        self._sinks[key].close()
+
+    def _communicate(self):
+        for (procName, proc) in self._procs.items():
+            (out, err) = proc.communicate()
+            for (streamName, data) in (('out', out), ('err', err)):
+                key = (procName, streamName)
+                if data:
+                    self._output[key].append(data)
+                if self._sinks[key]:
+                    self._sinks[key].write(data or '')
+                    self._sinks[key].close()
+
+class _KernelOutputSink(_LineSink):
+    """host output written to the kernel log file given to micprun,
+    standard output is used if the file can not be written"""
+    def __init__(self, kernelName, kernelStdOut):
+        super(_KernelOutputSink, self).__init__(self._write_line)
+        self._kernelName = kernelName
+        self._kernelStdOut = kernelStdOut
+        # separate outputs in file by separator
+        outSepFormat = '{ch:=^{width}}\n{:=^{width}}\n{ch:=^{width}}\n'
+        self._write_line(outSepFormat.format(' ' + kernelName + ' ', width=80, ch=''))
+
+    def _write_line(self, line):
+        if self._kernelStdOut:
+            try:
+                self._kernelStdOut.write(line)
+                self._kernelStdOut.flush()
+                return
+            except EnvironmentError:
+                err_msg = 'Failed writing "{}" kernel output to file.'
+                mp_print(err_msg.format(self._kernelName), CAT_WARN)
+                self._kernelStdOut = None
+        _write_stdout(line)
+
 class Offload(object):
 
     _CARD_EXECUTION_DIR = '/tmp/'
 
+    # seconds, None for no timeout
+    _timeout = None
+    # called with the index of the parameter and its stats after each
+    # kernel execution
+    _resultCallback = None
+    # the host side runs on the target device when it is another node,
+    # only for the local offload (self-boot nodes), the host side of the
+    # other offload methods always runs on this host
+    _hostOnTarget = False
+
     def __init__(self):
         raise NotImplementedError('Abstract base class')
 
@@ -58,6 +218,17 @@ class Offload(object):
             else:
                 raise
 
+    def set_timeout(self, timeout):
+        """stop each kernel execution after timeout seconds (None or 0
+        for no timeout)"""
+        self._timeout = timeout or None
+
+    def set_result_callback(self, callback):
+        """callback(paramIndex, statsList) is called as soon as the
+        kernel execution with the paramIndex-th parameter completes
+        (None to remove)"""
+        self._resultCallback = callback
+
     @staticmethod
     def _validate_mpi_requirements(kernel):
         """raises an exception if MPI requirements for current kernel are not met"""
@@ -95,12 +266,15 @@ class Offload(object):
             micp.connect.CalledProcessError: Kernel executable returns
             an error code other than 127.
 
+            KernelTimeoutError: Kernel did not complete within the
+            timeout given with set_timeout().
+
             micp_common.MissingDependenciesError: Some libararies or tools
             have not been installed.
         """
         result = []
         filesToCopy = None
-        filesToRemove = []
+        remoteDirsToRemove = []
         devParamFile = []
         hostParamFile = []
 
@@ -110,6 +284,11 @@ class Offload(object):
                                      '        127.0.0.1    {0}\n\n').format(socket.gethostname())
         connect = micp_connect.MPSSConnect(device)
         localConnect = micp_connect.MPSSConnect('localhost')
+        # the host side of a local offload targeting another (self-boot)
+        # node runs on that node, micperf must be installed there
+        remoteHost = self._hostOnTarget and \
+                     device not in micp_common.LOCAL_HOST_ID
+        hostConnect = connect if remoteHost else localConnect
 
         self._validate_mpi_requirements(kernel)
         try:
@@ -156,12 +335,11 @@ class Offload(object):
             if self._runDev:
                 filesToCopy = [execPath]
                 filesToCopy.extend(kernel.path_aux_data(self.name))
-                filesToRemove = [self._CARD_EXECUTION_DIR + os.path.basename(ff)
-                                 for ff in filesToCopy
-                                 if os.path.basename(ff)]
-                connect.copyto(filesToCopy, self._CARD_EXECUTION_DIR)
+                # executables and libraries stay on the device for the
+                # next runs, they are copied again only when they change
+                micp_connect.stage_files(connect, filesToCopy, self._CARD_EXECUTION_DIR)
 
-            for (hostParam, devParam) in zip(paramList, devParamList):
+            for (paramIndex, (hostParam, devParam)) in enumerate(zip(paramList, devParamList)):
                 print ''
                 print micp_common.star_border('RUN')
                 print 'Running {0} {1}'.format(kernel.name, hostParam.__str__())
@@ -225,6 +403,11 @@ class Offload(object):
                             hostArgs = [hostParamFile]
                         else:
                             hostArgs = []
+                        if remoteHost:
+                            # same path on the remote node
+                            paramDir = os.path.dirname(hostParamFile)
+                            connect.copyto(paramDir, os.path.dirname(paramDir))
+                            remoteDirsToRemove.append(paramDir)
                         hostParamFile = [hostParamFile]
                     elif kernel.param_type() == 'getopt':
                         hostArgs = hostParam.__str__().split()
@@ -256,38 +439,37 @@ class Offload(object):
                         for env in confProcEnv if env != "LD_LIBRARY_PATH"])
                     mp_print(envs_string, CAT_ENV)
                     mp_print(' '.join(hostArgs), CAT_CMD)
-                    hostProc = self._run_workload(localConnect.Popen, hostArgs, hostProcEnv, kernel.get_working_directory(), "host")
+                    hostCwd = kernel.get_working_directory()
+                    if remoteHost:
+                        # only the kernel settings are exported over ssh,
+                        # the remote node keeps its own environment
+                        hostProcEnv = confProcEnv
+                        if hostCwd:
+                            hostArgs = ['cd', hostCwd, '&&'] + hostArgs
+                        hostCwd = None
+                    hostProc = self._run_workload(hostConnect.Popen, hostArgs, hostProcEnv, hostCwd, "host")
                 try:
                     block = []
+                    engine = StreamEngine(self._timeout)
+                    if self._runDev:
+                        engine.add_process('dev', devProc,
+                            _LineSink(_write_stdout), _LineSink(_write_stderr))
+                    if self._runHost:
+                        if not kernelStdOut:
+                            hostSink = _LineSink(_write_stdout)
+                        else:
+                            hostSink = _KernelOutputSink(kernel.name, kernelStdOut)
+                        engine.add_process('host', hostProc,
+                            hostSink, _LineSink(_write_stderr))
+                    output = engine.run(kernel.name)
                     if self._runDev:
-                        (devOut, devErr) = devProc.communicate()
-                        print devOut
-                        sys.stderr.write(devErr)
+                        (devOut, devErr) = output['dev']
                         if devProc.returncode != 0:
                             raise micp_connect.CalledProcessError(devProc.returncode, devArgs)
                         block.append(devOut)
                         block.append(devErr)
                     if self._runHost:
-                        (hostOut, hostErr) = hostProc.communicate()
-                        if not kernelStdOut:
-                            print hostOut
-                        else:
-                            # separate outputs in file by separator
-                            outSepFormat = \
-                                '{ch:=^{width}}\n{:=^{width}}\n{ch:=^{width}}'
-                            outSeparator = \
-                                outSepFormat.format(' ' + kernel.name + ' ',
-                                    width=80, ch='')
-                            kernelStdOut.write(outSeparator)
-                            try:
-                                kernelStdOut.write('\n' + hostOut + '\n')
-                            except EnvironmentError as e:
-                                err_msg = \
-                                    'Failed writing "{}" kernel output to file.'
-                                mp_print(err_msg.format(kernel.name), CAT_WARN)
-                                mp_print("Output:\n{}".format(hostOut),
-                                    wrap=False)
-                        sys.stderr.write(hostErr)
+                        (hostOut, hostErr) = output['host']
                         if hostProc.returncode == 127:
                             raise micp_common.MissingDependenciesError(
                                 micp_common.DEP_REDIST)
@@ -307,8 +489,13 @@ class Offload(object):
                         killOut, killErr = pid.communicate()
                         print '\n'.join([killOut, killErr])
                         devProc.kill()
+                        devProc.wait()
                     if self._runHost and hostProc.returncode is None:
+                        if remoteHost:
+                            pid = connect.Popen('pkill -9 {0}'.format(os.path.basename(execPath)))
+                            pid.communicate()
                         hostProc.kill()
+                        hostProc.wait()
                     kernel.clean_up(hostParamFile, devParamFile, connect)
 
                 if kernel.internal_scaling():
@@ -323,12 +510,19 @@ class Offload(object):
                     stat = micp_stats.Stats(hostParam, kernel.parse_desc(block), kernel.parse_perf(block))
                     if '[ PERFORMANCE ]' not in block:
                         stat.reprint()
+                    thisResult = [stat]
                     result.append(stat)
+                if self._resultCallback:
+                    self._resultCallback(paramIndex, thisResult)
         except (Exception, KeyboardInterrupt) as err:
             err.partialResult = result
             raise
         finally:
-            kernel.clean_up([], filesToRemove + devParamFile, connect)
+            kernel.clean_up([], devParamFile, connect)
+            if remoteDirsToRemove:
+                # the parameter directories copied to the remote node
+                pid = connect.Popen(' '.join(['rm', '-rf'] + remoteDirsToRemove))
+                pid.communicate()
 
         # print peak point only if comparison function has been defined
         if len(result) > 1 and kernel._ordering_key(result[0]) is not None:
@@ -462,6 +656,7 @@ class LocalOffload(Offload):
         self.name = 'local'
         self._runDev = False
         self._runHost = True
+        self._hostOnTarget = True
 
 class OffloadFactory(micp_common.Factory):
     def __init__(self):
@@ -0,0 +1,388 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Comparison engine used by the performance regression tests.  The
+rolled up values of a run and of one or more reference runs are read
+once into arrays indexed by (kernel, offload, position, perf tag), the
+relative errors, z-scores and confidence intervals are then computed
+in bulk.  Values measured by repeated runs are compared through the
+confidence interval of their median.  NumPy is used when it is
+installed, otherwise the same computations are done on lists.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+# two-sided 95% quantiles of the Student t distribution by degrees of
+# freedom, the normal quantile is used above the table
+_T_QUANTILES_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+                   2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120,
+                   2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064,
+                   2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+_NORMAL_QUANTILE_95 = 1.960
+
+
+def t_quantile_95(dof):
+    """two-sided 95% quantile of the t distribution with dof degrees of
+    freedom"""
+    if dof < 1:
+        return NAN
+    if dof <= len(_T_QUANTILES_95):
+        return _T_QUANTILES_95[dof - 1]
+    return _NORMAL_QUANTILE_95
+
+
+def perf_value(stat, tag):
+    """value of a perf tag as a float, NaN when missing"""
+    try:
+        return float(stat.perf[tag]['value'])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return NAN
+
+
+def perf_sign(tag):
+    """times are better when lower, every other measurement when higher"""
+    if tag.find('Time') != -1:
+        return -1.0
+    return 1.0
+
+
+def model_tag(stat):
+    """perf tag compared with a statistical model: the first one of the
+    Stats, None if there is none"""
+    for tag in stat.perf:
+        return tag
+    return None
+
+
+def _is_finite(value):
+    return not (math.isnan(value) or math.isinf(value))
+
+
+def median(values):
+    """median of a list of floats, NaN for an empty list"""
+    ordered = sorted(values)
+    size = len(ordered)
+    if size == 0:
+        return NAN
+    if size % 2:
+        return ordered[size // 2]
+    return 0.5 * (ordered[size // 2 - 1] + ordered[size // 2])
+
+
+def median_abs_deviation(values):
+    """median absolute deviation from the median, multiply by
+    MAD_NORMAL_SCALE to estimate the standard deviation of normal
+    samples"""
+    center = median(values)
+    return median([abs(vv - center) for vv in values])
+
+MAD_NORMAL_SCALE = 1.4826
+
+
+def median_confidence_interval(values):
+    """
+    95% confidence interval (low, high) of the median given by order
+    statistics, it makes no assumption on the distribution of the
+    values.  Below 6 values the interval is (min, max) and covers less
+    than 95%.
+    """
+    ordered = sorted(values)
+    size = len(ordered)
+    if size == 0:
+        return (NAN, NAN)
+    if size > 100:
+        # normal approximation of the binomial distribution
+        rank = int(math.floor((size - _NORMAL_QUANTILE_95 * math.sqrt(size)) / 2.0))
+    else:
+        # largest rank such that P(B < rank) <= 2.5% for B ~ Binomial(size, 1/2)
+        rank = 0
+        pmf = 0.5 ** size
+        cdf = pmf
+        while cdf <= 0.025:
+            rank += 1
+            pmf = pmf * (size - rank + 1) / rank
+            cdf += pmf
+    if rank < 1:
+        return (ordered[0], ordered[-1])
+    return (ordered[rank - 1], ordered[size - rank])
+
+
+class PerfComparison(object):
+    """
+    Rolled up values of a run and of the runs it is compared with.  One
+    entry per (kernel, offload, position, perf tag) of the run, the
+    entries of a same Stats are contiguous and form a group.
+    """
+    def __init__(self, sharedKeys, actualFunc, refFuncList):
+        """
+        actualFunc(kernel, offload) and each refFunc(kernel, offload)
+        return the list of Stats to be compared position by position,
+        entries may be None
+        """
+        self.keys = []
+        self.descs = []
+        self.groupStarts = []
+        actual = []
+        signs = []
+        # confidence interval of the values measured by repeated runs
+        actualLow = []
+        actualHigh = []
+        refRows = [[] for __ in refFuncList]
+
+        for (kernel, offload) in sharedKeys:
+            actualList = actualFunc(kernel, offload)
+            refLists = [refFunc(kernel, offload) for refFunc in refFuncList]
+            for (position, stat) in enumerate(actualList):
+                if stat is None:
+                    continue
+                refStats = [refList[position] if position < len(refList) else None
+                            for refList in refLists]
+                tags = [tag for tag in stat.perf if stat.perf[tag].get('rollup', True)]
+                if not tags:
+                    continue
+                self.groupStarts.append(len(self.keys))
+                self.descs.append(stat.desc)
+                for tag in tags:
+                    self.keys.append((kernel, offload, position, tag))
+                    actual.append(perf_value(stat, tag))
+                    signs.append(perf_sign(tag))
+                    low, high = stat_confidence_interval(stat, tag)
+                    actualLow.append(low)
+                    actualHigh.append(high)
+                    for (row, refStat) in zip(refRows, refStats):
+                        row.append(perf_value(refStat, tag) if refStat is not None else NAN)
+
+        self.numRefs = len(refFuncList)
+        if numpy is not None:
+            self.actual = numpy.array(actual, dtype=float)
+            self.signs = numpy.array(signs, dtype=float)
+            self.ref = numpy.array(refRows, dtype=float).reshape(self.numRefs, len(actual))
+            self.actualLow = numpy.array(actualLow, dtype=float)
+            self.actualHigh = numpy.array(actualHigh, dtype=float)
+        else:
+            self.actual = actual
+            self.signs = signs
+            self.ref = refRows
+            self.actualLow = actualLow
+            self.actualHigh = actualHigh
+        self._refStats = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def num_groups(self):
+        return len(self.groupStarts)
+
+    def group_key(self, group):
+        """(kernel, offload, desc) of a group"""
+        kernel, offload, __, __ = self.keys[self.groupStarts[group]]
+        return kernel, offload, self.descs[group]
+
+    def ref_stats(self):
+        """
+        returns (mean, stdev, count) of the reference values of each
+        entry, stdev is NaN with less than two reference values
+        """
+        if self._refStats is not None:
+            return self._refStats
+        if numpy is not None:
+            valid = ~numpy.isnan(self.ref)
+            count = valid.sum(axis=0)
+            total = numpy.where(valid, self.ref, 0.0).sum(axis=0)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                mean = total / count
+                dev = numpy.where(valid, self.ref - mean, 0.0)
+                stdev = numpy.sqrt((dev * dev).sum(axis=0) / (count - 1))
+            stdev[count < 2] = NAN
+        else:
+            mean, stdev, count = [], [], []
+            for column in zip(*self.ref) if self.ref else [() for __ in self.actual]:
+                values = [vv for vv in column if not math.isnan(vv)]
+                nn = len(values)
+                mm = sum(values) / nn if nn else NAN
+                if nn > 1:
+                    ss = math.sqrt(sum((vv - mm)**2 for vv in values) / (nn - 1))
+                else:
+                    ss = NAN
+                mean.append(mm)
+                stdev.append(ss)
+                count.append(nn)
+        self._refStats = (mean, stdev, count)
+        return self._refStats
+
+    def relative_errors(self):
+        """signed relative error of each entry with respect to the mean of
+        the references, positive values are improvements"""
+        mean, __, __ = self.ref_stats()
+        if numpy is not None:
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                return self.signs * (self.actual - mean) / mean
+        return [_divide(sign * (aa - mm), mm)
+                for (sign, aa, mm) in zip(self.signs, self.actual, mean)]
+
+    def significant_errors(self):
+        """
+        relative errors that are not explained by the noise of the run:
+        for the entries measured by repeated runs the error of the end
+        of the confidence interval of the median closest to the
+        reference mean, 0 when the interval contains the mean, the
+        relative error of the value for the other entries
+        """
+        mean, __, __ = self.ref_stats()
+        relErrors = self.relative_errors()
+        if numpy is not None:
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                lowErrors = self.signs * (self.actualLow - mean) / mean
+                highErrors = self.signs * (self.actualHigh - mean) / mean
+            nearest = numpy.fmin(lowErrors, highErrors)
+            farthest = numpy.fmax(lowErrors, highErrors)
+            inInterval = numpy.where(nearest > 0, nearest,
+                                     numpy.where(farthest < 0, farthest, 0.0))
+            return numpy.where(numpy.isnan(self.actualLow) | numpy.isnan(relErrors),
+                               relErrors, inInterval)
+        result = []
+        for (ii, relError) in enumerate(relErrors):
+            if math.isnan(self.actualLow[ii]) or math.isnan(relError):
+                result.append(relError)
+                continue
+            bounds = sorted([_divide(self.signs[ii] * (bound - mean[ii]), mean[ii])
+                             for bound in (self.actualLow[ii], self.actualHigh[ii])])
+            if bounds[0] > 0:
+                result.append(bounds[0])
+            elif bounds[1] < 0:
+                result.append(bounds[1])
+            else:
+                result.append(0.0)
+        return result
+
+    def z_scores(self):
+        """signed distance of each entry to the mean of the references in
+        reference standard deviations, NaN with less than two references"""
+        mean, stdev, __ = self.ref_stats()
+        if numpy is not None:
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                return self.signs * (self.actual - mean) / stdev
+        return [_divide(sign * (aa - mm), ss)
+                for (sign, aa, mm, ss) in zip(self.signs, self.actual, mean, stdev)]
+
+    def confidence_intervals(self):
+        """half width of the 95% confidence interval of the reference mean
+        of each entry, NaN with less than two references"""
+        __, stdev, count = self.ref_stats()
+        return [_divide(t_quantile_95(int(nn) - 1) * ss, math.sqrt(nn)) if nn > 1 else NAN
+                for (ss, nn) in zip(stdev, count)]
+
+    def group_min(self, values):
+        """smallest finite value of each group, NaN for a group without
+        finite values"""
+        if numpy is not None and len(self.groupStarts):
+            values = numpy.asarray(values, dtype=float)
+            values = numpy.where(numpy.isinf(values), NAN, values)
+            return list(numpy.fmin.reduceat(values, self.groupStarts))
+        bounds = zip(self.groupStarts, self.groupStarts[1:] + [len(self.keys)])
+        result = []
+        for (start, stop) in bounds:
+            finite = [vv for vv in values[start:stop] if _is_finite(vv)]
+            result.append(min(finite) if finite else NAN)
+        return result
+
+    def group_argmin(self, values):
+        """index of the entry with the smallest finite value in each group,
+        None for a group without finite values"""
+        bounds = zip(self.groupStarts, self.groupStarts[1:] + [len(self.keys)])
+        result = []
+        for (start, stop) in bounds:
+            finite = [(values[ii], ii) for ii in range(start, stop) if _is_finite(values[ii])]
+            result.append(min(finite)[1] if finite else None)
+        return result
+
+
+def stat_confidence_interval(stat, tag):
+    """confidence interval of the median of the values measured for
+    tag by repeated runs, (NaN, NaN) if the kernel ran once"""
+    try:
+        sample = stat.sample(tag)
+    except AttributeError:
+        sample = None
+    if not sample:
+        return (NAN, NAN)
+    return median_confidence_interval(sample)
+
+
+def _divide(num, den):
+    try:
+        return num / den
+    except ZeroDivisionError:
+        return NAN
+
+
+def has_model_entry(model, kernel, offload, desc):
+    """true if the statistical model has a (mean, stdev) entry for the
+    given kernel, offload and description"""
+    try:
+        model[kernel][offload][desc]
+    except (KeyError, TypeError):
+        return False
+    return True
+
+
+def model_comparison(statList, model, kernelOffloadList):
+    """
+    Compares the first perf tag of each Stats of statList with the
+    (mean, stdev) given by the statistical model for its kernel, offload
+    and description.  Returns the list of relative distances to the
+    mean +/- 3 stdev band, None for the values inside the band.
+    Raises KeyError when the model has no entry for a Stats, see
+    has_model_entry().
+    """
+    values = []
+    means = []
+    stdevs = []
+    for (stat, (kernel, offload)) in zip(statList, kernelOffloadList):
+        try:
+            mean, stdev = model[kernel][offload][stat.desc]
+        except KeyError:
+            raise KeyError(stat.desc)
+        values.append(perf_value(stat, model_tag(stat)))
+        means.append(float(mean))
+        stdevs.append(float(stdev))
+
+    # using 3 standard deviations for comparison to cover ~99.7% of cases
+    if numpy is not None:
+        values = numpy.array(values, dtype=float)
+        means = numpy.array(means, dtype=float)
+        stdevs = numpy.array(stdevs, dtype=float)
+        minExpected = means - 3 * stdevs
+        maxExpected = means + 3 * stdevs
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            below = (values - minExpected) / minExpected
+            above = (values - maxExpected) / maxExpected
+        result = numpy.where(values <= minExpected, below,
+                             numpy.where(values >= maxExpected, above, NAN))
+        result[numpy.isinf(result)] = NAN
+        return [None if math.isnan(rr) else float(rr) for rr in result]
+
+    result = []
+    for (value, mean, stdev) in zip(values, means, stdevs):
+        minExpected = mean - 3 * stdev
+        maxExpected = mean + 3 * stdev
+        if value <= minExpected:
+            rr = _divide(value - minExpected, minExpected)
+        elif value >= maxExpected:
+            rr = _divide(value - maxExpected, maxExpected)
+        else:
+            rr = NAN
+        result.append(None if math.isnan(rr) else rr)
+    return result
@@ -0,0 +1,265 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+SQLite database indexing the micp_run_stats_TAG.pkl files of a
+results directory.  Runs are selected with indexed queries on their
+tag, SKU, version, hardware hash and kernels instead of unpickling
+every file, and the stats of one kernel of a run are read without
+loading the run.  The rows only hold text and JSON, reading them does
+not depend on the Python pickle format.  The index is optional, any
+failure to build it leaves the pickle files to be read one by one.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+
+import info as micp_info
+import stats as micp_stats
+
+# kept in the results directory when it is writable, otherwise in a
+# per-user cache directory
+RESULTS_DB_NAME = 'micp_run_stats.sqlite'
+RESULTS_DB_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'micperf')
+# increment when the tables change, the database is then rebuilt
+RESULTS_DB_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    tag TEXT PRIMARY KEY,
+    file TEXT,
+    mtime REAL,
+    sku TEXT,
+    sku_key TEXT,
+    version TEXT,
+    param_cat TEXT,
+    off_method TEXT,
+    hw_hash TEXT);
+CREATE INDEX IF NOT EXISTS runs_sku_key ON runs (sku_key);
+CREATE INDEX IF NOT EXISTS runs_version ON runs (version);
+CREATE INDEX IF NOT EXISTS runs_hw_hash ON runs (hw_hash);
+CREATE TABLE IF NOT EXISTS stats (
+    tag TEXT,
+    kernel TEXT,
+    offload TEXT,
+    x_name TEXT,
+    position INTEGER,
+    description TEXT,
+    params TEXT,
+    params_csv TEXT,
+    params_csv_header TEXT,
+    params_named TEXT,
+    perf TEXT,
+    thermal TEXT,
+    samples TEXT);
+CREATE INDEX IF NOT EXISTS stats_tag_kernel ON stats (tag, kernel);
+CREATE INDEX IF NOT EXISTS stats_kernel ON stats (kernel);
+"""
+
+# columns that can be used to select runs
+RUN_COLUMNS = ('tag', 'sku', 'sku_key', 'version', 'param_cat', 'off_method',
+               'hw_hash')
+
+
+class StoredParams(object):
+    """
+    parameters of a stats row, only their text forms and the values of
+    the named parameters are stored
+    """
+    def __init__(self, text, csvText, csvHeader, named):
+        self._text = text
+        self._csv = csvText
+        self._csvHeader = csvHeader
+        self._named = named
+
+    def __str__(self):
+        return self._text
+
+    def csv(self):
+        return self._csv
+
+    def csv_header(self):
+        return self._csvHeader
+
+    def get_named(self, name):
+        try:
+            return self._named[name]
+        except KeyError:
+            raise NameError
+
+
+def _named_params(params):
+    """values of the named parameters, empty for positional parameters"""
+    names = getattr(params, '_paramNames', None)
+    if names is None:
+        # ParamsDrop keeps the decorated parameters
+        names = getattr(getattr(params, '_params', None), '_paramNames', [])
+    result = {}
+    for name in names:
+        try:
+            result[name] = params.get_named(name)
+        except Exception:
+            pass
+    return result
+
+
+def _call_or_none(method):
+    """info methods may fail on pickles of older micperf versions"""
+    try:
+        return method()
+    except Exception:
+        return None
+
+
+def _db_file(pickleDir):
+    if os.access(pickleDir, os.W_OK):
+        return os.path.join(pickleDir, RESULTS_DB_NAME)
+    dirHash = hashlib.sha1(os.path.abspath(pickleDir)).hexdigest()[:16]
+    return os.path.join(RESULTS_DB_CACHE_DIR, 'results_{0}.sqlite'.format(dirHash))
+
+
+class ResultsDatabase(object):
+    """
+    Index of the pickle files of a directory, refresh() adds the new and
+    modified files and removes the deleted ones.
+    """
+    def __init__(self, dbFile):
+        dbDir = os.path.dirname(dbFile)
+        if dbDir and not os.path.isdir(dbDir):
+            os.makedirs(dbDir, 0700)
+        self._conn = sqlite3.connect(dbFile)
+        self._conn.text_factory = str
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != RESULTS_DB_SCHEMA_VERSION:
+            self._conn.executescript('DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS stats;')
+            self._conn.execute('PRAGMA user_version = {0}'.format(RESULTS_DB_SCHEMA_VERSION))
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def refresh(self, pickleFiles):
+        """pickleFiles maps the tags to the pickle file names"""
+        indexed = dict(self._conn.execute('SELECT tag, mtime FROM runs'))
+        for tag in set(indexed) - set(pickleFiles):
+            self.remove(tag)
+        for (tag, fileName) in pickleFiles.items():
+            try:
+                mtime = os.path.getmtime(fileName)
+            except OSError:
+                continue
+            if indexed.get(tag) != mtime:
+                try:
+                    statsColl = micp_stats.load_stats(fileName)
+                except Exception:
+                    # not a readable stats file, skip it until it changes
+                    statsColl = None
+                self.add(tag, fileName, mtime, statsColl)
+        self._conn.commit()
+
+    def remove(self, tag):
+        self._conn.execute('DELETE FROM runs WHERE tag = ?', (tag,))
+        self._conn.execute('DELETE FROM stats WHERE tag = ?', (tag,))
+
+    def add(self, tag, fileName, mtime, statsColl):
+        """indexes the StatsCollection stored in fileName (None to only
+        record the file)"""
+        self.remove(tag)
+        run = dict((column, None) for column in RUN_COLUMNS)
+        run['tag'] = tag
+        if statsColl is not None:
+            info = statsColl.info
+            run['sku'] = _call_or_none(info.mic_sku)
+            if run['sku'] is not None:
+                run['sku_key'] = micp_info.normalized_sku(run['sku'])
+            run['version'] = _call_or_none(info.micperf_version)
+            run['hw_hash'] = _call_or_none(info.system_hw_hash)
+            run['param_cat'] = statsColl.runArgs.get('paramCat')
+            run['off_method'] = statsColl.runArgs.get('offMethod')
+        self._conn.execute('INSERT INTO runs (tag, file, mtime, sku, sku_key, '
+                           'version, param_cat, off_method, hw_hash) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (tag, fileName, mtime, run['sku'], run['sku_key'],
+                            run['version'], run['param_cat'], run['off_method'],
+                            run['hw_hash']))
+        if statsColl is None:
+            return
+        rows = []
+        for kernel in statsColl._store:
+            xName = statsColl._xName.get(kernel)
+            for offload in statsColl._store[kernel]:
+                for (position, stat) in enumerate(statsColl._store[kernel][offload]):
+                    rows.append((tag, kernel, offload, xName, position, stat.desc,
+                                 str(stat.params), _call_or_none(stat.params.csv),
+                                 _call_or_none(stat.params.csv_header),
+                                 json.dumps(_named_params(stat.params)),
+                                 json.dumps(stat.perf),
+                                 json.dumps(getattr(stat, 'thermal', None)),
+                                 json.dumps(getattr(stat, 'samples', None))))
+        self._conn.executemany('INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def runs(self, kernel=None, **columns):
+        """
+        returns the runs, as dictionaries of the RUN_COLUMNS, whose
+        columns have the given values and that include kernel when given
+        """
+        query = 'SELECT {0} FROM runs'.format(', '.join(RUN_COLUMNS))
+        conditions = []
+        values = []
+        for (column, value) in sorted(columns.items()):
+            if column not in RUN_COLUMNS:
+                raise NameError('micp_resultsdb.runs: unknown column {0}'.format(column))
+            conditions.append('{0} = ?'.format(column))
+            values.append(value)
+        if kernel is not None:
+            conditions.append('tag IN (SELECT tag FROM stats WHERE kernel = ?)')
+            values.append(kernel)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY tag DESC'
+        return [dict(zip(RUN_COLUMNS, row)) for row in self._conn.execute(query, values)]
+
+    def kernel_stats(self, tag, kernel):
+        """
+        returns the stats of one kernel of a run as a dictionary that maps
+        the offload names to lists of micp.stats.Stats
+        """
+        result = {}
+        rows = self._conn.execute('SELECT offload, description, params, params_csv, '
+                                  'params_csv_header, params_named, perf, thermal, samples '
+                                  'FROM stats WHERE tag = ? AND kernel = ? '
+                                  'ORDER BY offload, position', (tag, kernel))
+        for (offload, desc, params, paramsCsv, paramsCsvHeader, named, perf,
+             thermal, samples) in rows:
+            stat = micp_stats.Stats(StoredParams(params, paramsCsv, paramsCsvHeader,
+                                                 json.loads(named)),
+                                    desc, json.loads(perf))
+            stat.thermal = json.loads(thermal)
+            stat.samples = json.loads(samples)
+            result.setdefault(offload, []).append(stat)
+        return result
+
+    def close(self):
+        self._conn.close()
+
+
+def open_results_db(pickleDir, pickleFiles):
+    """
+    returns the up to date ResultsDatabase of pickleDir or None if no
+    database can be written or indexing fails
+    """
+    try:
+        database = ResultsDatabase(_db_file(pickleDir))
+    except Exception:
+        return None
+    try:
+        database.refresh(pickleFiles)
+    except Exception:
+        # e.g. a perf value json can not encode
+        database.close()
+        return None
+    return database
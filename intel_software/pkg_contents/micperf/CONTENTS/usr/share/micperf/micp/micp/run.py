@@ -14,10 +14,10 @@ serves as an executable wrapper to this function.
 
 import os
 import copy
-import cPickle
 import sys
 import subprocess
 import datetime
+import threading
 
 import common as micp_common
 import kernel as micp_kernel
@@ -26,6 +26,8 @@ import params as micp_params
 import stats as micp_stats
 import info as micp_info
 import connect as micp_connect
+import thermal as micp_thermal
+import journal as micp_journal
 
 from micp.common import mp_print, CAT_INFO, CAT_WARN, CAT_OFFLOAD
 from distutils import spawn
@@ -45,20 +47,282 @@ arguments."""
 CONST_SKIPPED_EXEC = \
 """Execution of the '{}' kernel will be skipped."""
 
+CONST_PARALLEL_SWEEP = \
+"""Running the kernels on {0} devices at the same time ({1})."""
+
+CONST_DEVICE_FAILED = \
+"""Run on device '{0}' failed: {1}"""
+
+CONST_MIXED_SKUS = \
+"""The devices do not have the SKU {0} of the system information stored
+with the results: {1}.  Run the devices of each SKU separately."""
+
+CONST_REPETITION = \
+"""Repetition {0} of {1} of '{2}' ({3})"""
+
+CONST_WARMUP = \
+"""Warm-up run {0} of {1} of '{2}' ({3}), results discarded"""
+
+
+def device_list(devIdx):
+    """
+    returns the list of devices given either as a list or as a comma
+    separated string e.g. 'mic0,mic1' or 'node1,node2'
+    """
+    if type(devIdx) in (list, tuple):
+        return [str(dd) for dd in devIdx]
+    return [dd.strip() for dd in str(devIdx).split(',') if dd.strip()]
+
+
+class MixedSkuError(micp_common.MicpException):
+    """the devices of a multi-device run stored in a pickle file do not
+    all have the same SKU"""
+    def micp_exit_code(self):
+        return micp_common.E_PARSE
+
+
+def check_device_skus(devices, info):
+    """
+    a pickle file stores one system information, hardware hash and tag:
+    the ones of info.  A multi-device run is stored only if every device
+    has the SKU of info, raises MixedSkuError otherwise.
+    """
+    runSku = micp_info.normalized_sku(info.mic_sku())
+    skus = [(dev, micp_info.device_sku(dev)) for dev in devices]
+    others = ['{0} ({1})'.format(dev, sku) for (dev, sku) in skus if sku != runSku]
+    if others:
+        raise MixedSkuError(CONST_MIXED_SKUS.format(runSku, ', '.join(others)))
+
+
+class _DeviceSweep(threading.Thread):
+    """worker thread running the sweep of one device"""
+    def __init__(self, device, sweep):
+        super(_DeviceSweep, self).__init__(name='micp-{0}'.format(device))
+        self.daemon = True
+        self.device = device
+        self.exitCode = micp_common.E_NO_ERROR
+        self.excInfo = None
+        self._sweep = sweep
+
+    def run(self):
+        try:
+            self.exitCode = self._sweep(self.device)
+        except (Exception, KeyboardInterrupt) as err:
+            mp_print(CONST_DEVICE_FAILED.format(self.device, err), CAT_WARN)
+            self.excInfo = sys.exc_info()
+
+
+def _run_parallel(devices, sweep):
+    """
+    runs sweep(device) for all the devices at the same time, the wall
+    time is the one of the slowest device.  Returns the first non zero
+    exit code, the first exception raised by a device is raised again
+    once all the devices are done.
+    """
+    mp_print(CONST_PARALLEL_SWEEP.format(len(devices), ', '.join(devices)),
+        CAT_INFO)
+    workers = [_DeviceSweep(device, sweep) for device in devices]
+    for worker in workers:
+        worker.start()
+    # join with a timeout, otherwise ctrl-c does not reach the main thread
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(1.0)
+    for worker in workers:
+        if worker.excInfo:
+            raise worker.excInfo[0], worker.excInfo[1], worker.excInfo[2]
+    exitCodes = [worker.exitCode for worker in workers
+                 if worker.exitCode != micp_common.E_NO_ERROR]
+    if exitCodes:
+        return exitCodes[0]
+    return micp_common.E_NO_ERROR
+
+
+def _run_repeated(offload, kernel, device, kernelParams, kernelStdOut,
+                  repeat, warmup, callback=None):
+    """
+    runs the kernel warmup + repeat times with each parameter, the stats
+    of the warm-up runs are discarded and the others merged with
+    micp.stats.merge_repeats().  callback(paramIndex, statsList) is
+    called with the merged stats of each parameter.
+    """
+    result = []
+    for (paramIndex, param) in enumerate(kernelParams):
+        runs = []
+        try:
+            for trial in range(warmup + repeat):
+                if trial < warmup:
+                    mp_print(CONST_WARMUP.format(trial + 1, warmup, kernel.name,
+                        param), CAT_INFO)
+                else:
+                    mp_print(CONST_REPETITION.format(trial - warmup + 1, repeat,
+                        kernel.name, param), CAT_INFO)
+                runs.append(offload.run(kernel, device, [param],
+                    kernelStdOut=kernelStdOut))
+        except (Exception, KeyboardInterrupt) as err:
+            # the completed repetitions of the interrupted parameter are kept
+            err.partialResult = result + micp_stats.merge_repeats(runs[warmup:])
+            raise
+        merged = micp_stats.merge_repeats(runs[warmup:])
+        if callback:
+            callback(paramIndex, merged)
+        result.extend(merged)
+    return result
+
+
+def _run_sweep(result, device, kernelList, xNameList, offloadList, paramCat,
+               kernelArgs, kernelStdOut, thermalWait, thermalHeadroom,
+               deviceTag=None, resultLock=None, journal=None, repeat=1,
+               warmup=0):
+    """
+    runs all the kernels with all the offload methods on one device, the
+    stats are appended to result (tagged with deviceTag when given) and
+    the exit code is returned.  thermalWait and thermalHeadroom are
+    ignored if thermalWait is None.  Each kernel execution is recorded
+    in journal (micp.journal.Journal) when given, the executions
+    already in the journal are not run again.  With repeat > 1 or
+    warmup > 0 each parameter is run several times (see
+    _run_repeated()).
+    """
+    if resultLock is None:
+        resultLock = threading.Lock()
+
+    def append(kernelName, offloadName, xName, stats):
+        with resultLock:
+            result.append(kernelName, offloadName, xName, stats, deviceTag)
+
+    def tag_thermal(kernel, stats, thermalStatus):
+        # only the stats not tagged yet, the journal callback tags them
+        # as each parameter completes
+        stats = [ss for ss in stats if not ss.is_thermally_throttled()]
+        if thermalWait is not None and stats:
+            micp_thermal.tag_stats(stats, kernel.name, thermalStatus,
+                float(thermalHeadroom))
+
+    def journal_callback(kernel, offload, xName, paramList, thermalStatus):
+        def callback(paramIndex, stats):
+            # tagged before they are recorded, the stats restored by
+            # --resume keep their thermal tag
+            tag_thermal(kernel, stats, thermalStatus)
+            journal.record(deviceTag, kernel.name, offload.name, xName,
+                paramList[paramIndex], stats)
+        return callback
+
+    errorString = 'WARNING: {0} kernel does not implement parameter categories'
+    exit_code = micp_common.E_NO_ERROR
+    for offload in offloadList:
+        for (kernel, xName) in zip(kernelList, xNameList):
+            if paramCat:
+                try:
+                    kernelArgs = kernel.category_params(paramCat, offload.name)
+                except NotImplementedError:
+                    sys.stderr.write(errorString.format(kernel.name) + '\n')
+                    continue
+            try:
+                paramNames = kernel.param_names(full=True)
+                defaults = kernel.param_defaults(offload.name)
+                paramForEnv = kernel.param_for_env()
+                if kernel.param_type() == 'getopt':
+                    options = kernel.options()
+                    long_options = kernel.long_options()
+                    kernelParams = [micp_params.ParamsGetopt(ka, paramNames, options,
+                                                             long_options, defaults)
+                                    for ka in kernelArgs]
+                else:
+                    param_validator = getattr(kernel, 'param_validator', micp_params.NO_VALIDATOR)
+                    kernelParams = [micp_params.Params(ka, paramNames, defaults, paramForEnv, param_validator)
+                                    for ka in kernelArgs]
+            except NotImplementedError:
+                kernelParams = [micp_params.ParamsPos(ka)
+                                for ka in kernelArgs]
+            except micp_params.MicpParamsHelpError as err:
+                if offload.name in kernel.offload_methods():
+                    print kernel.help(err.__str__(), offload.name)
+                continue
+            if journal:
+                completed = journal.completed_stats(deviceTag, kernel.name,
+                    offload.name, kernelParams)
+                if completed:
+                    append(kernel.name, offload.name, xName, completed)
+                kernelParams = [pp for pp in kernelParams
+                    if not journal.is_completed(deviceTag, kernel.name, offload.name, pp)]
+                if not kernelParams:
+                    continue
+            thermalStatus = None
+            if thermalWait is not None:
+                thermalStatus = micp_thermal.wait_for_cooldown(kernel.name,
+                    float(thermalWait), float(thermalHeadroom))
+            if journal:
+                callback = journal_callback(kernel, offload, xName,
+                    kernelParams, thermalStatus)
+            else:
+                callback = None
+            isRepeated = repeat > 1 or warmup > 0
+            # repeated runs are recorded once merged
+            offload.set_result_callback(None if isRepeated else callback)
+            try:
+                if isRepeated:
+                    runResult = _run_repeated(offload, kernel, device,
+                        kernelParams, kernelStdOut, repeat, warmup, callback)
+                else:
+                    runResult = offload.run(kernel, device, kernelParams,
+                        kernelStdOut=kernelStdOut)
+            except micp_offload.KernelTimeoutError as err:
+                # a hung kernel does not block the rest of the sweep
+                mp_print(str(err), CAT_WARN)
+                if err.partialResult:
+                    append(kernel.name, offload.name, xName, err.partialResult)
+                exit_code = err.micp_exit_code()
+                continue
+            except (Exception, KeyboardInterrupt) as err:
+                if 'partialResult' in dir(err):
+                    append(kernel.name, offload.name, xName, err.partialResult)
+                raise
+            tag_thermal(kernel, runResult, thermalStatus)
+            append(kernel.name, offload.name, xName, runResult)
+    return exit_code
+
+
 def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
         kernelArgs='', devIdx='0', verbLevel='0', outDir='', tag='',
         compResult='', margin='', kernelPlugin='', statistical_model={},
-        sudo=False, logFileName=None):
+        sudo=False, logFileName=None, thermalWait=0,
+        thermalHeadroom=micp_thermal.DEFAULT_MIN_HEADROOM, kernelTimeout=0,
+        resume=False, compHistory=None, repeat=1, warmup=0):
     """
     Core function that is used by the micprun executable. Specifying
     an existing outDir causes run to store a pkl file in outDir. The
     file is named according to system information and run parameters.
+    devIdx may list several devices or hosts (see device_list()), the
+    kernels then run on all of them at the same time and the results
+    of each device are stored in the same collection under the
+    collection tag followed by the device name.  The system information
+    of the collection is the one of this system (of the first card on a
+    coprocessor host), with outDir all the devices must have its SKU
+    (see check_device_skus()).
+    Before each kernel run waits at most thermalWait seconds for the
+    thermal headroom published by the fan controller to reach
+    thermalHeadroom degrees, results of kernels run on a hot node are
+    tagged as thermally throttled.  A kernel running longer than
+    kernelTimeout seconds (0 for no limit) is stopped and the sweep goes
+    on with the next kernel.
+    When outDir is given each completed kernel execution is recorded in
+    a journal next to the pkl file, with resume the executions found in
+    the journal of an interrupted sweep are not run again.  The journal
+    is removed once the pkl file of the complete sweep is written.
+    compHistory lists StatsCollection compared by the regression test
+    together with compResult.
+    With repeat > 1 each kernel runs repeat times with each parameter
+    after warmup runs whose results are discarded, the stats then hold
+    the median of the repetitions and their full sample.
     """
-    runArgs = locals()
+    runArgs = dict(locals())
+    # the reference runs are not a setting of this run
+    del runArgs['compHistory']
 
     if compResult:
         if type(compResult) == str:
-            compResult = cPickle.load(open(compResult, 'rb'))
+            compResult = micp_stats.load_stats(compResult)
             # Note we expect that the user would have already
             # overridden these parameters if they pass the
             # compResult as an object rather than a path.
@@ -68,10 +332,13 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
             kernelArgs = runArgs['kernelArgs'] = compResult.runArgs['kernelArgs']
             devIdx = runArgs['devIdx'] = compResult.runArgs['devIdx']
 
-    device = devIdx
+    devices = device_list(devIdx)
+    device = devices[0]
     mpssConnect = micp_connect.MPSSConnect(device)
     devIdx = mpssConnect.get_offload_index()
     verbLevel = int(verbLevel)
+    repeat = int(repeat)
+    warmup = int(warmup)
 
     info = micp_info.Info()
     info.set_device_index(devIdx)
@@ -92,6 +359,7 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
         kernelNames = kernelNames.split(':')
 
     kernelList = [kernelFactory.create(kn) for kn in kernelNames]
+    kernelByName = zip(kernelNames, kernelList)
 
     # check if sudo kernels can be executed
     if os.getuid() != 0:
@@ -120,6 +388,7 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
 
     if not kernelList:
         return micp_common.E_NO_ERROR
+    kernelNames = [kn for (kn, kk) in kernelByName if kk in kernelList]
 
     xNameList = [kk.independent_var(paramCat) for kk in kernelList]
 
@@ -129,6 +398,8 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
     else:
         offloadNames = offMethod.split(':')
     offloadList = [offloadFactory.create(on) for on in offloadNames]
+    for offload in offloadList:
+        offload.set_timeout(float(kernelTimeout))
 
     if paramCat and kernelArgs:
         sys.stderr.write('WARNING: paramCat and and kernel arguments both specified.\n')
@@ -138,7 +409,6 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
     if kernelArgs and type(kernelArgs) is not list:
         kernelArgs = [kernelArgs]
 
-    errorString = 'WARNING: {0} kernel does not implement parameter categories'
     result = micp_stats.StatsCollection(runArgs, tag, info)
     if outDir:
         if result.tag:
@@ -148,7 +418,13 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
     else:
         fileName = None
 
-    exit_code = micp_common.E_NO_ERROR
+    if fileName and len(devices) > 1:
+        check_device_skus(devices, info)
+
+    journal = None
+    if fileName:
+        journal = micp_journal.Journal(micp_journal.journal_file_name(fileName),
+            runArgs, resume)
 
     kernelStdOut = None
     if logFileName:
@@ -158,57 +434,48 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
             # ignore, kernels will be print to standard output
             pass
 
+    resultLock = threading.Lock()
+
+    def device_sweep(dev):
+        """sweep of one device of a multi-device run, each device has its
+        own kernel and offload objects"""
+        devOffloadList = [offloadFactory.create(on) for on in offloadNames]
+        for devOffload in devOffloadList:
+            devOffload.set_timeout(float(kernelTimeout))
+        devKernelList = [kernelFactory.create(kn) for kn in kernelNames]
+        # the thermal status published by the fan controller is the one
+        # of the local node
+        if dev in micp_common.LOCAL_HOST_ID:
+            devThermalWait = thermalWait
+        else:
+            devThermalWait = None
+        return _run_sweep(result, dev, devKernelList, xNameList, devOffloadList,
+            paramCat, kernelArgs, kernelStdOut, devThermalWait, thermalHeadroom,
+            dev, resultLock, journal, repeat, warmup)
+
     try:
-        for offload in offloadList:
-            for (kernel, xName) in zip(kernelList, xNameList):
-                if paramCat:
-                    try:
-                        kernelArgs = kernel.category_params(paramCat, offload.name)
-                    except NotImplementedError:
-                        sys.stderr.write(errorString.format(kernel.name) + '\n')
-                        continue
-                try:
-                    paramNames = kernel.param_names(full=True)
-                    defaults = kernel.param_defaults(offload.name)
-                    paramForEnv = kernel.param_for_env()
-                    if kernel.param_type() == 'getopt':
-                        options = kernel.options()
-                        long_options = kernel.long_options()
-                        kernelParams = [micp_params.ParamsGetopt(ka, paramNames, options,
-                                                                 long_options, defaults)
-                                        for ka in kernelArgs]
-                    else:
-                        param_validator = getattr(kernel, 'param_validator', micp_params.NO_VALIDATOR)
-                        kernelParams = [micp_params.Params(ka, paramNames, defaults, paramForEnv, param_validator)
-                                        for ka in kernelArgs]
-                except NotImplementedError:
-                    kernelParams = [micp_params.ParamsPos(ka)
-                                    for ka in kernelArgs]
-                except micp_params.MicpParamsHelpError as err:
-                    if offload.name in kernel.offload_methods():
-                        print kernel.help(err.__str__(), offload.name)
-                    continue
-                try:
-                    runResult = offload.run(kernel, device, kernelParams,
-                        kernelStdOut=kernelStdOut)
-                except (Exception, KeyboardInterrupt) as err:
-                    if 'partialResult' in dir(err):
-                        result.append(kernel.name, offload.name, xName, err.partialResult)
-                    if fileName:
-                        fid = open(fileName, 'wb')
-                        cPickle.dump(result, fid)
-                        fid.close()
-                    raise
-                result.append(kernel.name, offload.name, xName, runResult)
+        try:
+            if len(devices) == 1:
+                exit_code = _run_sweep(result, device, kernelList, xNameList,
+                    offloadList, paramCat, kernelArgs, kernelStdOut,
+                    thermalWait, thermalHeadroom, journal=journal,
+                    repeat=repeat, warmup=warmup)
+            else:
+                exit_code = _run_parallel(devices, device_sweep)
+        except (Exception, KeyboardInterrupt):
+            if fileName:
+                micp_stats.dump_stats(result, fileName)
+            raise
     finally:
         # check since the file might not have been opened
         if kernelStdOut:
             kernelStdOut.close()
+        if journal:
+            journal.close()
 
     if fileName:
-        fid = open(fileName, 'wb')
-        cPickle.dump(result, fid)
-        fid.close()
+        micp_stats.dump_stats(result, fileName)
+        journal.remove()
 
     if compResult:
         combined = copy.deepcopy(result)
@@ -240,7 +507,8 @@ def run(kernelNames='all', offMethod='native:scif', paramCat='optimal',
         except NameError:
             pass
 
-    if compResult and margin:
-        result.perf_regression_test(float(margin), compResult, statistical_model)
+    if compResult and (margin or statistical_model):
+        refList = [compResult] + list(compHistory or [])
+        result.perf_regression_test(float(margin or 0), refList, statistical_model)
 
     return exit_code
@@ -30,6 +30,8 @@ except (ImportError, RuntimeError):
 import info as micp_info
 import common as micp_common
 import version as micp_version
+import resultsdb as micp_resultsdb
+import regression as micp_regression
 
 class Stats(object):
     """
@@ -44,11 +46,47 @@ class Stats(object):
         if not all(['value' in dd and 'units' in dd for dd in perf.values()]):
             raise KeyError('perf dictionary must contain "value", and "units" keys')
         self.perf = perf
+        # set by micp.thermal when the node was hot during the run
+        self.thermal = None
+        # values of each perf tag measured by repeated runs, the value
+        # in perf is then their median (see merge_repeats())
+        self.samples = None
+
+    def is_thermally_throttled(self):
+        # pickles written before the thermal tag do not have the attribute
+        thermal = getattr(self, 'thermal', None)
+        return thermal is not None and thermal.get('throttled', False)
+
+    def sample(self, tag):
+        """values measured for tag by repeated runs, None if the kernel
+        ran once"""
+        samples = getattr(self, 'samples', None)
+        if not samples:
+            return None
+        return samples.get(tag)
+
+    def mad(self, tag):
+        """median absolute deviation of the sample of tag, None if the
+        kernel ran once"""
+        sample = self.sample(tag)
+        if not sample:
+            return None
+        return micp_regression.median_abs_deviation(sample)
+
+    def confidence_interval(self, tag):
+        """95% confidence interval (low, high) of the median of the
+        sample of tag, None if the kernel ran once"""
+        sample = self.sample(tag)
+        if not sample:
+            return None
+        return micp_regression.median_confidence_interval(sample)
 
     def __str__(self, rolledUp=True):
         result = []
         result.append(self.desc)
         result.append('Parameters:  ' + self.params.__str__())
+        if self.is_thermally_throttled():
+            result.append('Thermally throttled (headroom {0}C)'.format(self.thermal['headroom']))
         result.extend(['{0}      {1}'.format(self.perf[tag]['value'], self.perf[tag]['units'])
                        for tag in self.perf if rolledUp == False or self.perf[tag].get('rollup', True)])
         return '\n'.join(result)
@@ -128,10 +166,17 @@ class Stats(object):
 
     def reprint(self):
         mp_print(self.desc, CAT_DESC)
+        if self.is_thermally_throttled():
+            mp_print('thermally throttled', CAT_PERF)
         for tag in sorted(self.perf.keys()):
             perf_text = '{0} {1} {2}'.format(tag, self.perf[tag]['value'], self.perf[tag]['units'])
             if self.perf[tag].get('rollup', True):
                 perf_text = perf_text + " R"
+            sample = self.sample(tag)
+            if sample:
+                low, high = self.confidence_interval(tag)
+                perf_text = perf_text + ' (median of {0} runs, MAD {1:.4g}, 95% CI {2:.4g} - {3:.4g})'.format(
+                    len(sample), self.mad(tag), low, high)
             mp_print(perf_text, CAT_PERF)
 
 class StatsCollection(object):
@@ -197,8 +242,8 @@ class StatsCollection(object):
             result.append(micp_common.star_border('ROLLED UP'))
         for kernelName in sorted(self._store.keys()):
             result.append(micp_common.star_border(kernelName))
-            myOffloadList = [off for off in self._store[kernelName].keys() if split_offload(off)[1] == self.tag]
-            otherOffloadList = [off for off in self._store[kernelName].keys() if split_offload(off)[1] != self.tag]
+            myOffloadList = [off for off in self._store[kernelName].keys() if self._is_own_tag(split_offload(off)[1])]
+            otherOffloadList = [off for off in self._store[kernelName].keys() if not self._is_own_tag(split_offload(off)[1])]
             offloadList = sorted(myOffloadList) + sorted(otherOffloadList)
             for offloadName in offloadList:
                 if len(self._store[kernelName][offloadName]) > 0:
@@ -215,8 +260,18 @@ class StatsCollection(object):
         result.append(micp_common.star_border(''))
         return '\n'.join(result)
 
-    def append(self, kernelName, offloadName, xName, stats):
-        offloadName = offloadName +  '__' + self.tag
+    def device_tag(self, device=None):
+        """tag of the results of one device in a multi-device run, the
+        collection tag followed by the device name"""
+        if device is None:
+            return self.tag
+        return '{0}_{1}'.format(self.tag, re.sub(r'[^\w.-]', '-', str(device)))
+
+    def _is_own_tag(self, tag):
+        return tag == self.tag or (tag is not None and tag.startswith(self.tag + '_'))
+
+    def append(self, kernelName, offloadName, xName, stats, device=None):
+        offloadName = offloadName +  '__' + self.device_tag(device)
         if kernelName in self._store:
             if offloadName in self._store[kernelName]:
                 self._store[kernelName][offloadName].extend(stats)
@@ -338,32 +393,10 @@ class StatsCollection(object):
             fid.close()
 
     def get_optimal_stat(self, kernelName, offloadName):
-        statList = self.get_stat_list(kernelName, offloadName)
-        if len(statList) == 0:
-            return None
-        optimalStat = statList[0]
-        for stat in statList:
-            dd = stat - optimalStat
-            if dd > 0:
-                optimalStat = stat
-        return optimalStat
+        return optimal_stat(self.get_stat_list(kernelName, offloadName))
 
     def get_stat_list(self, kernelName, offloadName):
-        if '__' in offloadName:
-            return self._store[kernelName][offloadName]
-        else:
-            allOff = self._store[kernelName].keys()
-            extensions = set([split_offload(oo)[1] for oo in allOff])
-            extensions.discard(None)
-            extensions = list(extensions)
-            extensions.sort()
-            result = []
-            for ex in extensions:
-                try:
-                    result.extend(self._store[kernelName]['__'.join((offloadName, ex))])
-                except KeyError:
-                    pass
-            return result
+        return offload_stat_list(self._store[kernelName], offloadName)
 
     def _pretty_x_label(self, kernelName):
         if self._xName[kernelName] == 'num_core':
@@ -593,59 +626,98 @@ class StatsCollection(object):
             pass
 
 
-    def _get_kernel_perf_results(self, ref, kernel, offload):
-        """given the kernel name, the offload method and a the reference results
-        returns the tuple (list_of_actual_results, list_of_expected_results)"""
+    def _kernel_perf_results(self, collection, kernel, offload):
+        """given a collection (self or a reference), the kernel name and the
+        offload method returns the list of stats compared by the
+        regression tests"""
         if self.runArgs['paramCat'].startswith('optimal'):
-            return ([self.get_optimal_stat(kernel, offload)],
-                    [ref.get_optimal_stat(kernel, offload)])
-
-        return (self.get_stat_list(kernel, offload),
-                ref.get_stat_list(kernel, offload))
+            return [collection.get_optimal_stat(kernel, offload)]
+        return collection.get_stat_list(kernel, offload)
 
+    def _perf_results_func(self, collection):
+        """function returning the stats of collection for the regression
+        comparison, references may lack some of the kernels"""
+        def perf_results(kernel, offload):
+            try:
+                return self._kernel_perf_results(collection, kernel, offload)
+            except KeyError:
+                return []
+        return perf_results
 
-    def _statistical_test(self, sharedKeys, statistical_model, ref):
+    def _statistical_test(self, sharedKeys, statistical_model, refList):
         """performance statistical regression test"""
-        max_regression = 0
-        best_performance = 0
+        statList = []
+        kernelOffloadList = []
         for (kernel, offload) in sharedKeys:
-            actual_res, __ = self._get_kernel_perf_results(ref, kernel, offload)
-            all_valid_results = [res for res in actual_res if res is not None]
+            all_valid_results = [res for res in self._kernel_perf_results(self, kernel, offload)
+                                 if res is not None]
             for kernel_result in all_valid_results:
-                # do performance regression test
-                result = kernel_result.statistical_comparison(
-                                        statistical_model, kernel, offload)
-
-                if result is not None:
-                    if result < 0:
-                        self._print_regression(kernel, offload, result, kernel_result.desc)
-                        if result < max_regression:
-                            max_regression = result
-                    else:
-                        if result > best_performance:
-                            best_performance = result
+                # models built by micpmodel leave out the points measured
+                # by too few runs
+                if not micp_regression.has_model_entry(statistical_model,
+                        kernel, offload, kernel_result.desc):
+                    self._print_no_model_data(kernel, offload, kernel_result.desc)
+                    continue
+                statList.append(kernel_result)
+                kernelOffloadList.append((kernel, offload))
+
+        results = micp_regression.model_comparison(statList, statistical_model,
+                                                   kernelOffloadList)
+
+        max_regression = 0
+        best_performance = 0
+        for (kernel_result, (kernel, offload), result) in zip(statList, kernelOffloadList, results):
+            if result is not None:
+                if result < 0:
+                    self._print_regression(kernel, offload, result, kernel_result.desc)
+                    if result < max_regression:
+                        max_regression = result
+                else:
+                    if result > best_performance:
+                        best_performance = result
 
         test_failed = max_regression != 0
         res = max_regression if test_failed else best_performance
         self._print_perf_test_verdict(test_failed, res)
 
-    def _relative_error_test(self, sharedKeys, margin, ref):
-        """performance regression test based on relative errors"""
+    def _relative_error_test(self, sharedKeys, margin, refList):
+        """
+        performance regression test based on relative errors, with more
+        than one reference the errors are relative to the mean of the
+        references and the z-scores and confidence intervals of the
+        regressions are printed.  Values measured by repeated runs only
+        regress when the whole confidence interval of their median is
+        beyond the margin.
+        """
+        comparison = micp_regression.PerfComparison(sharedKeys,
+            self._perf_results_func(self),
+            [self._perf_results_func(ref) for ref in refList])
+        # Difference between stats is the worst relative error on the rolled
+        # stats, for repeated runs the part of it beyond the confidence
+        # interval of the median
+        relErrors = comparison.significant_errors()
+        groupErrors = comparison.group_min(relErrors)
+        worstEntries = comparison.group_argmin(relErrors)
+        if comparison.numRefs > 1:
+            mean, __, count = comparison.ref_stats()
+            zScores = comparison.z_scores()
+            confidence = comparison.confidence_intervals()
+
         maxRegr = 0
-        for (kk,oo) in sharedKeys:
-            selfStatList, refStatList = self._get_kernel_perf_results(ref, kk, oo)
-            all_valid_results = [(actual, expected) for (actual, expected)
-                                 in zip(selfStatList, refStatList)
-                                 if actual is not None and expected is not None]
-            for (actual, expected) in all_valid_results:
-                # Difference between stats is the relative error on the rolled stats
-                relError = actual - expected
-                if relError < -margin:
-                    if relError < maxRegr:
-                        maxRegr = relError
-                    self._print_regression(kk, oo, -relError, actual.desc)
-                elif relError > margin and relError > maxRegr and maxRegr >= 0:
+        for (group, relError) in enumerate(groupErrors):
+            if math.isnan(relError):
+                continue
+            kk, oo, desc = comparison.group_key(group)
+            if relError < -margin:
+                if relError < maxRegr:
                     maxRegr = relError
+                self._print_regression(kk, oo, -relError, desc)
+                if comparison.numRefs > 1:
+                    entry = worstEntries[group]
+                    self._print_reference_spread(comparison.keys[entry][3],
+                        zScores[entry], mean[entry], confidence[entry], count[entry])
+            elif relError > margin and relError > maxRegr and maxRegr >= 0:
+                maxRegr = relError
         test_failed = maxRegr < -margin
         self._print_perf_test_verdict(test_failed, maxRegr)
 
@@ -658,6 +730,20 @@ class StatsCollection(object):
         print message.format(kernel, offload, error*100, desc)
 
 
+    @staticmethod
+    def _print_no_model_data(kernel, offload, desc):
+        """print that a value is not covered by the statistical model"""
+        print '[----------] No model data {0} {1} ({2})'.format(kernel, offload, desc)
+
+
+    @staticmethod
+    def _print_reference_spread(perfTag, zScore, mean, confidence, count):
+        """print how far a regression is from the distribution of the
+        reference values"""
+        message = '[----------] {0} z-score {1:.2f}, reference {2:.4g} +/- {3:.4g} (95% CI, {4} runs)'
+        print message.format(perfTag, zScore, mean, confidence, count)
+
+
     @staticmethod
     def _print_perf_test_verdict(test_failed, max_regression):
         """print final performance regression test result,
@@ -677,27 +763,37 @@ class StatsCollection(object):
 
 
     def perf_regression_test(self, margin=0.04, ref=None, statistical_model={}):
-        """statistical or relative error performance tests based on input arguments"""
+        """
+        statistical or relative error performance tests based on input
+        arguments, ref is a StatsCollection or a list of StatsCollection
+        that are compared with at once
+        """
         if ref is None:
             scs = StatsCollectionStore()
             ref = scs.get_for_regression_test(self.runArgs['paramCat'])
-
-        jointKernels = list(set(self._store.keys()) &
-                            set(ref._store.keys()))
-
-        # get list of valid (kernel, offload method) combinations
-        sharedKeys = []
-        for kk in jointKernels:
-            selfOffloads = [off.split('__')[0] for off in self._store[kk].keys()]
-            refOffloads = [off.split('__')[0] for off in ref._store[kk].keys()]
-            jointOff = list(set(selfOffloads) &
-                            set(refOffloads))
-            sharedKeys.extend([(kk,oo) for oo in jointOff])
+        if type(ref) is list:
+            refList = ref
+        else:
+            refList = [ref]
+
+        # get list of valid (kernel, offload method) combinations, shared
+        # with at least one of the references
+        sharedKeys = set()
+        for ref in refList:
+            jointKernels = list(set(self._store.keys()) &
+                                set(ref._store.keys()))
+            for kk in jointKernels:
+                selfOffloads = [off.split('__')[0] for off in self._store[kk].keys()]
+                refOffloads = [off.split('__')[0] for off in ref._store[kk].keys()]
+                jointOff = list(set(selfOffloads) &
+                                set(refOffloads))
+                sharedKeys.update([(kk,oo) for oo in jointOff])
+        sharedKeys = sorted(sharedKeys)
 
         if statistical_model:
-            self._statistical_test(sharedKeys, statistical_model, ref)
+            self._statistical_test(sharedKeys, statistical_model, refList)
         else:
-            self._relative_error_test(sharedKeys, margin, ref)
+            self._relative_error_test(sharedKeys, margin, refList)
 
 
 class StatsCollectionStore(object):
@@ -716,6 +812,55 @@ class StatsCollectionStore(object):
                             if fileName[-4:] == '.pkl' and fileName[:15] == 'micp_run_stats_']
         self._storedTags.sort(reverse=True)
 
+        # index of the pickle files, None if it can not be written in
+        # which case the pickle files are read one by one
+        self._db = micp_resultsdb.open_results_db(self._pickleDir,
+            dict((tag, self._tag_file_name(tag)) for tag in self._storedTags))
+
+    def _tag_file_name(self, tag):
+        return os.path.join(self._pickleDir, 'micp_run_stats_' + tag + '.pkl')
+
+    def _indexed_runs(self, filt, refInfo):
+        """
+        runs matching the filter found with an indexed query, or from
+        the pickle headers when there is no index, None if the filter
+        needs the whole Info of the runs
+        """
+        if filt == 'same_sku':
+            skuKey = micp_info.normalized_sku(refInfo.mic_sku())
+            if self._db is not None:
+                return self._db.runs(sku_key=skuKey)
+            return [run for run in self._header_runs()
+                    if run['sku'] is not None and
+                    micp_info.normalized_sku(run['sku']) == skuKey]
+        if filt == 'same_hw':
+            hwHash = refInfo.system_hw_hash()
+            if self._db is not None:
+                return self._db.runs(hw_hash=hwHash)
+            return [run for run in self._header_runs() if run['hw_hash'] == hwHash]
+        return None
+
+    def _header_runs(self):
+        """runs described by the headers of the pickle files"""
+        result = []
+        for tag in self._storedTags:
+            header = self.get_header(tag)
+            if header is not None:
+                result.append({'tag': tag, 'sku': header['sku'],
+                               'version': header['version'],
+                               'hw_hash': header['hwHash']})
+        return result
+
+    def get_header(self, tag):
+        """returns the header of a stored run (see stats_header()), only
+        the header of the pickle file is read"""
+        if tag not in self._storedTags:
+            return None
+        try:
+            return load_stats_header(self._tag_file_name(tag))
+        except Exception:
+            return None
+
     def get_by_tag(self, tag):
         if tag not in self._storedTags:
             tagSplit = tag.split(':')
@@ -727,8 +872,7 @@ class StatsCollectionStore(object):
                 return self.get_for_regression_test(tagSplit[1])
             return None
         else:
-            fileName = os.path.join(self._pickleDir, 'micp_run_stats_' + tag + '.pkl')
-            return cPickle.load(open(fileName, 'rb'))
+            return load_stats(self._tag_file_name(tag))
 
     def get_by_filter(self, filt, refInfo=None):
         if refInfo is None:
@@ -737,6 +881,9 @@ class StatsCollectionStore(object):
         methodName = 'is_' + filt
         if methodName not in dir(refInfo):
             raise NameError('micp_stats.get_by_filter:  Filter named {0} is not valid'.format(filt))
+        runs = self._indexed_runs(filt, refInfo)
+        if runs is not None:
+            return [self.get_by_tag(run['tag']) for run in runs]
         filt = refInfo.__getattribute__(methodName)
         for tag in self._storedTags:
             statsColl = self.get_by_tag(tag)
@@ -744,25 +891,47 @@ class StatsCollectionStore(object):
                 result.append(statsColl)
         return result
 
+    def get_kernel_stats(self, tag, kernelName):
+        """
+        returns the stats of one kernel of a stored run as a dictionary
+        that maps the offload names to lists of Stats, without loading
+        the whole run when the index is available
+        """
+        return self._kernel_stats_reader(tag)(kernelName)
+
+    def _kernel_stats_reader(self, tag):
+        """
+        returns a function giving the stats of a kernel of a stored run
+        (see get_kernel_stats()), the run is loaded at most once when
+        there is no index
+        """
+        if self._db is not None and tag in self._storedTags:
+            return lambda kernelName: self._db.kernel_stats(tag, kernelName)
+        statsColl = self.get_by_tag(tag)
+        if statsColl is None:
+            return lambda kernelName: {}
+        return lambda kernelName: dict(statsColl._store.get(kernelName, {}))
+
     def get_for_regression_test(self, testName=''):
-        result = self.get_by_filter('same_sku')
-        if len(result) == 0:
+        runs = self._indexed_runs('same_sku', micp_info.Info())
+        if len(runs) == 0:
             raise RuntimeError('Could not find reference file with same sku')
 
         thisVersion = micp_info.micperf_version()
-        result = [sc for sc in result if distutils.version.LooseVersion(sc.info.micperf_version()) <= thisVersion]
-        if len(result) == 0:
+        runs = [run for run in runs if run['version'] is not None and
+                distutils.version.LooseVersion(run['version']) <= thisVersion]
+        if len(runs) == 0:
             raise RuntimeError('Could not find reference file with same sku and lower or equal mpss version')
 
-        thatVersion = max([distutils.version.LooseVersion(sc.info.micperf_version()) for sc in result]).vstring
+        thatVersion = max([distutils.version.LooseVersion(run['version']) for run in runs]).vstring
 
-        result = [sc for sc in result if sc.info.micperf_version() == thatVersion and testName in sc.tag]
+        runs = [run for run in runs if run['version'] == thatVersion and testName in run['tag']]
 
-        if len(result) == 0:
+        if len(runs) == 0:
             raise RuntimeError('Could not find reference file with same sku and lower version and tag containing {0}'.format(testName))
-        if len(result) > 1:
+        if len(runs) > 1:
             raise RuntimeError('Found multiple reference files that match comparison criterion')
-        return result[0]
+        return self.get_by_tag(runs[0]['tag'])
 
     def get_all(self):
         return [self.get_by_tag(tag) for tag in self._storedTags]
@@ -860,16 +1029,24 @@ class StatsCollectionStore(object):
 
         result = []
         for tag in scalingTags:
-            statsColl = self.get_by_tag(tag)
-            name = statsColl.info.mic_sku()
+            # only the summarized kernels are read from the index
+            kernel_stats = self._kernel_stats_reader(tag)
+            kernelStore = {}
+            runHeader = self.get_header(tag)
+            if runHeader is not None and runHeader['sku'] is not None:
+                name = runHeader['sku']
+            else:
+                name = self.get_by_tag(tag).info.mic_sku()
             line = [name]
             pline = ['Parameters']
             for kernel, offload, parameter in zip(kernels, offloads, parameters):
+                if kernel not in kernelStore:
+                    kernelStore[kernel] = kernel_stats(kernel)
                 thisResult = []
                 thisParams = []
                 for thisOffload in offload:
-                    offloadTag = [oo for oo in statsColl._store[kernel] if oo.startswith(thisOffload)][0]
-                    stat = statsColl.get_optimal_stat(kernel, offloadTag)
+                    offloadTag = [oo for oo in kernelStore[kernel] if oo.startswith(thisOffload)][0]
+                    stat = optimal_stat(offload_stat_list(kernelStore[kernel], offloadTag))
                     if parameter == 'DESCRIPTION':
                         paramVal = str(int(stat.desc.split()[-1][:-2])/1024) + 'MB'
                     else:
@@ -913,6 +1090,37 @@ def is_exp_spacing(coordList):
     diff = [b - a for a, b in zip(logCoordList,logCoordList[1:])]
     return all([abs((dd - firstDiff)/firstDiff) < epsilon for dd in diff])
 
+def offload_stat_list(offloadStore, offloadName):
+    """
+    stats of offloadName in offloadStore, a dictionary mapping the
+    offload names to lists of Stats, an offload name without device
+    extension gives the stats of all the devices
+    """
+    if '__' in offloadName:
+        return offloadStore[offloadName]
+    extensions = set([split_offload(oo)[1] for oo in offloadStore.keys()])
+    extensions.discard(None)
+    extensions = list(extensions)
+    extensions.sort()
+    result = []
+    for ex in extensions:
+        try:
+            result.extend(offloadStore['__'.join((offloadName, ex))])
+        except KeyError:
+            pass
+    return result
+
+def optimal_stat(statList):
+    """the best performing Stats of statList, None if it is empty"""
+    if len(statList) == 0:
+        return None
+    optimalStat = statList[0]
+    for stat in statList:
+        dd = stat - optimalStat
+        if dd > 0:
+            optimalStat = stat
+    return optimalStat
+
 def split_offload(offloadName):
     splitPos = offloadName.find('__')
     if splitPos == -1:
@@ -922,3 +1130,95 @@ def split_offload(offloadName):
         off = offloadName[:splitPos]
         tag = offloadName[splitPos+2:]
     return off, tag
+
+# A pickle file holds two records: a small header dictionary with the
+# metadata of the run followed by the StatsCollection itself, so that
+# runs can be listed and selected without unpickling their Info and
+# stats.  Files written before the header only hold the StatsCollection.
+STATS_FILE_FORMAT = 2
+
+def _header_value(method):
+    """info methods may fail on pickles of older micperf versions"""
+    try:
+        return method()
+    except Exception:
+        return None
+
+def stats_header(statsColl):
+    """returns the header dictionary describing statsColl"""
+    info = statsColl.info
+    # micprun passes the reference run itself as compResult, it does not
+    # belong in the header
+    runArgs = dict((key, value) for (key, value) in statsColl.runArgs.items()
+                   if key != 'compResult' or type(value) is str)
+    return {'format': STATS_FILE_FORMAT,
+            'tag': statsColl.tag,
+            'runArgs': runArgs,
+            'sku': _header_value(info.mic_sku),
+            'version': _header_value(info.micperf_version),
+            'hwHash': _header_value(info.system_hw_hash)}
+
+def _is_stats_header(record):
+    return type(record) is dict and record.get('format') == STATS_FILE_FORMAT
+
+def dump_stats(statsColl, fileName):
+    """writes statsColl to fileName, header first"""
+    fid = open(fileName, 'wb')
+    try:
+        cPickle.dump(stats_header(statsColl), fid, cPickle.HIGHEST_PROTOCOL)
+        cPickle.dump(statsColl, fid, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        fid.close()
+
+def load_stats_header(fileName):
+    """
+    returns the header of a pickle file written by dump_stats() reading
+    only its first record, the header is built from the whole
+    StatsCollection for files of older micperf versions
+    """
+    fid = open(fileName, 'rb')
+    try:
+        record = cPickle.load(fid)
+    finally:
+        fid.close()
+    if _is_stats_header(record):
+        return record
+    return stats_header(record)
+
+def load_stats(fileName):
+    """returns the StatsCollection stored in fileName"""
+    fid = open(fileName, 'rb')
+    try:
+        record = cPickle.load(fid)
+        if _is_stats_header(record):
+            record = cPickle.load(fid)
+    finally:
+        fid.close()
+    return record
+
+def merge_repeats(runs):
+    """
+    runs lists the results of repeated executions of a kernel with the
+    same parameters, each a list of Stats.  Returns the Stats of the
+    first execution with the median of the numeric values of each perf
+    tag and the full sample of these values stored in Stats.samples.
+    """
+    runs = [run for run in runs if run]
+    if not runs:
+        return []
+    result = runs[0]
+    if len(runs) == 1:
+        return result
+    for (position, stat) in enumerate(result):
+        stat.samples = {}
+        for tag in stat.perf:
+            sample = []
+            for run in runs:
+                try:
+                    sample.append(float(run[position].perf[tag]['value']))
+                except (IndexError, KeyError, TypeError, ValueError):
+                    pass
+            if len(sample) == len(runs):
+                stat.perf[tag]['value'] = micp_regression.median(sample)
+                stat.samples[tag] = sample
+    return result
@@ -0,0 +1,94 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Module reading the thermal status published by the fan controller
+(fan_control.py) so that micprun does not silently measure a
+thermally throttled system.  When the fans are at their ceiling the
+only thing left is the throttling of the cores, micprun waits for
+the node to cool down before each kernel or marks the results as
+thermally throttled.
+"""
+
+import os
+import json
+import time
+
+from micp.common import mp_print, CAT_INFO, CAT_WARN
+
+# written by fan_control.py after each control cycle
+THERMAL_STATUS_FILE = '/run/fan_control/thermal_status.json'
+# the fan controller polls at least every 2 minutes, an older status
+# means that it is not running
+THERMAL_STATUS_MAX_AGE = 360
+DEFAULT_MIN_HEADROOM = 5.0
+COOLDOWN_POLL_INTERVAL = 5
+
+CONST_WAITING_COOLDOWN = \
+"""Thermal headroom {0:.1f}C ({1} at {2:.1f}C) is below {3:.1f}C, waiting
+for the node to cool down before running '{4}'."""
+
+CONST_THROTTLED = \
+"""Results of the '{0}' kernel are tagged as thermally throttled
+(thermal headroom {1:.1f}C, fans at ceiling: {2})."""
+
+
+def read_thermal_status(statusFile=THERMAL_STATUS_FILE):
+    """returns the last status published by the fan controller as a
+    dictionary, None if there is no recent status"""
+    try:
+        with open(statusFile) as fid:
+            status = json.load(fid)
+    except (IOError, OSError, ValueError):
+        return None
+    if time.time() - status.get('timestamp', 0) > THERMAL_STATUS_MAX_AGE:
+        return None
+    return status
+
+
+def is_hot(status, minHeadroom=DEFAULT_MIN_HEADROOM):
+    """the node is hot when the headroom is too small or when the fans
+    cannot do more"""
+    if status is None:
+        return False
+    return status['headroom'] < minHeadroom or status['fans_at_ceiling']
+
+
+def wait_for_cooldown(kernelName, maxWait=0, minHeadroom=DEFAULT_MIN_HEADROOM,
+                      statusFile=THERMAL_STATUS_FILE):
+    """waits at most maxWait seconds for the node to have minHeadroom
+    degrees of thermal headroom, returns the last status read (None if
+    the fan controller is not running)"""
+    status = read_thermal_status(statusFile)
+    deadline = time.time() + maxWait
+    if is_hot(status, minHeadroom) and maxWait > 0:
+        mp_print(CONST_WAITING_COOLDOWN.format(status['headroom'],
+            status['hottest_sensor'], status['max_temperature'], minHeadroom,
+            kernelName), CAT_INFO)
+    while is_hot(status, minHeadroom) and time.time() < deadline:
+        time.sleep(COOLDOWN_POLL_INTERVAL)
+        status = read_thermal_status(statusFile)
+    return status
+
+
+def tag_stats(statsList, kernelName, statusBefore, minHeadroom=DEFAULT_MIN_HEADROOM,
+              statusFile=THERMAL_STATUS_FILE):
+    """marks the stats of a kernel run as thermally throttled when the
+    node was hot before or after the run"""
+    statusAfter = read_thermal_status(statusFile)
+    hotStatus = [ss for ss in (statusBefore, statusAfter) if is_hot(ss, minHeadroom)]
+    if not hotStatus:
+        return False
+    worst = min(hotStatus, key=lambda ss: ss['headroom'])
+    for stats in statsList:
+        stats.thermal = {'throttled': True,
+                         'headroom': worst['headroom'],
+                         'max_temperature': worst['max_temperature'],
+                         'fans_at_ceiling': worst['fans_at_ceiling']}
+    mp_print(CONST_THROTTLED.format(kernelName, worst['headroom'],
+        worst['fans_at_ceiling']), CAT_WARN)
+    return True
@@ -99,7 +99,8 @@ scripts=['micprun',
          'micpinfo',
          'micpprint',
          'micpplot',
-         'micpcsv']
+         'micpcsv',
+         'micpmodel']
 
 # Add .py extensions for windows install and remove the .py extension otherwise
 if platform.platform().lower().startswith('windows'):
@@ -0,0 +1,12 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Unit tests of the micp package, run from the directory of setup.py:
+
+    python -m unittest discover -s test -t .
+"""
@@ -0,0 +1,167 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.connect: copy of several files with one tar stream and
+staging of the files left on a device, the device side commands run on
+this host.
+"""
+
+import os
+import sys
+import hashlib
+import shutil
+import tempfile
+import subprocess
+import unittest
+import StringIO
+
+import micp.connect as micp_connect
+
+
+class LocalTarConnect(micp_connect.SSLConnect):
+    """SSLConnect whose commands run on this host"""
+    def __init__(self):
+        self._connect = micp_connect.MPSSConnect('localhost')
+
+
+class CopyToTarTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempDir, 'source')
+        self.dest = os.path.join(self.tempDir, 'dest')
+        os.makedirs(os.path.join(self.source, 'libs', 'intel64'))
+        os.mkdir(self.dest)
+        self.write(os.path.join(self.source, 'kernel'), 'binary')
+        self.write(os.path.join(self.source, 'libs', 'intel64', 'libiomp5.so'), 'library')
+        os.chmod(os.path.join(self.source, 'kernel'), 0755)
+        self.environ = dict(os.environ)
+        self.connect = LocalTarConnect()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tempDir)
+
+    def write(self, fileName, text):
+        with open(fileName, 'w') as fid:
+            fid.write(text)
+
+    def read(self, *path):
+        with open(os.path.join(self.dest, *path)) as fid:
+            return fid.read()
+
+    def check_copy(self):
+        # members are named after the base name of their source, the
+        # trailing '/' of a directory is ignored
+        self.connect.copyto([os.path.join(self.source, 'kernel'),
+                             os.path.join(self.source, 'libs') + '/'], self.dest)
+        self.assertEqual(sorted(os.listdir(self.dest)), ['kernel', 'libs'])
+        self.assertEqual(self.read('kernel'), 'binary')
+        self.assertEqual(self.read('libs', 'intel64', 'libiomp5.so'), 'library')
+        self.assertTrue(os.access(os.path.join(self.dest, 'kernel'), os.X_OK))
+
+    def test_copy(self):
+        self.check_copy()
+
+    def test_compressed_copy(self):
+        os.environ['INTEL_MPSS_TAR_COMPRESS'] = '1'
+        self.check_copy()
+
+    def test_missing_destination(self):
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.assertRaises(subprocess.CalledProcessError, self.connect.copyto,
+                              [os.path.join(self.source, 'kernel'), os.path.join(self.source, 'libs')],
+                              os.path.join(self.tempDir, 'missing'))
+            # the error of the device side tar is reported
+            self.assertTrue('missing' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+
+class StagingConnect(object):
+    """connection to a device whose directories are local directories,
+    the sources of each copyto call are recorded"""
+    def __init__(self):
+        self.copies = []
+
+    def Popen(self, args, **kwargs):
+        return micp_connect.LocalConnect().Popen(args, **kwargs)
+
+    def copyto(self, source, dest):
+        self.copies.append([os.path.basename(src) for src in source])
+        for src in source:
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(dest, os.path.basename(src)))
+            else:
+                shutil.copy(src, dest)
+
+
+class StageFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempDir, 'source')
+        self.device = os.path.join(self.tempDir, 'device') + '/'
+        os.mkdir(self.source)
+        os.mkdir(self.device)
+        self.files = [self.write(os.path.join(self.source, name), name)
+                      for name in ('kernel', 'libiomp5.so')]
+        self.connect = StagingConnect()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def write(self, fileName, text, mtime=None):
+        with open(fileName, 'w') as fid:
+            fid.write(text)
+        if mtime is not None:
+            os.utime(fileName, (mtime, mtime))
+        return fileName
+
+    def stage(self, source=None):
+        return micp_connect.stage_files(self.connect, source or self.files, self.device)
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertEqual(self.stage(), self.files)
+        self.assertEqual(self.stage(), [])
+        self.assertEqual(self.connect.copies, [['kernel', 'libiomp5.so']])
+
+    def test_changed_file_is_copied_again(self):
+        self.stage()
+        # same size, the modification time tells the digest is out of date
+        mtime = os.path.getmtime(self.files[0]) + 10
+        self.write(self.files[0], 'KERNEL', mtime)
+        self.assertEqual(self.stage(), [self.files[0]])
+        with open(os.path.join(self.device, 'kernel')) as fid:
+            self.assertEqual(fid.read(), 'KERNEL')
+
+    def test_remote_digest_mismatch(self):
+        self.stage()
+        # the file on the device was replaced by another one
+        self.write(os.path.join(self.device, 'libiomp5.so'), 'other library')
+        self.assertEqual(self.stage(), [self.files[1]])
+        self.assertEqual(self.connect.copies[-1], ['libiomp5.so'])
+
+    def test_directories_are_always_copied(self):
+        libDir = os.path.join(self.source, 'lib')
+        os.mkdir(libDir)
+        self.write(os.path.join(libDir, 'libmkl.so'), 'mkl')
+        self.assertEqual(self.stage([libDir, self.files[0]]), [libDir, self.files[0]])
+        shutil.rmtree(os.path.join(self.device, 'lib'))
+        self.assertEqual(self.stage([libDir, self.files[0]]), [libDir])
+
+    def test_file_digest(self):
+        digest = micp_connect.file_digest(self.files[0])
+        self.assertEqual(digest, hashlib.sha1('kernel').hexdigest())
+        self.write(self.files[0], 'KERNEL', os.path.getmtime(self.files[0]) + 10)
+        self.assertEqual(micp_connect.file_digest(self.files[0]), hashlib.sha1('KERNEL').hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.info: the split of a full dmidecode dump into the outputs
+of 'dmidecode -t keyword', the SKU of another self-boot node and the
+system description cached until the next boot.
+"""
+
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+import micp.connect as micp_connect
+import micp.info as micp_info
+
+DMIDECODE_HEADER = """# dmidecode 3.0
+Getting SMBIOS data from sysfs.
+SMBIOS 3.0 present."""
+
+BIOS = """Handle 0x0000, DMI type 0, 24 bytes
+BIOS Information
+\tVendor: American Megatrends Inc.
+\tVersion: S72C610.86B.01.03.0006.040520171018"""
+
+SYSTEM = """Handle 0x0001, DMI type 1, 27 bytes
+System Information
+\tManufacturer: Intel Corporation
+\tProduct Name: S7200AP"""
+
+BASEBOARD = """Handle 0x0002, DMI type 2, 15 bytes
+Base Board Information
+\tManufacturer: Intel Corporation"""
+
+PROCESSOR = """Handle 0x0040, DMI type 4, 48 bytes
+Processor Information
+\tVersion: Intel(R) Xeon Phi(TM) CPU 7250 @ 1.40GHz
+\tCore Count: 68"""
+
+MEMORY_DEVICE_1 = """Handle 0x0051, DMI type 17, 40 bytes
+Memory Device
+\tSize: 16384 MB
+\tLocator: DIMM1"""
+
+MEMORY_DEVICE_2 = """Handle 0x0052, DMI type 17, 40 bytes
+Memory Device
+\tSize: No Module Installed
+\tLocator: DIMM2"""
+
+BIOS_LANGUAGE = """Handle 0x0060, DMI type 13, 22 bytes
+BIOS Language Information
+\tInstallable Languages: 1"""
+
+END_OF_TABLE = """Handle 0x0070, DMI type 127, 4 bytes
+End Of Table"""
+
+DUMP = '\n\n'.join([DMIDECODE_HEADER, BIOS, SYSTEM, BASEBOARD, PROCESSOR,
+                    MEMORY_DEVICE_1, MEMORY_DEVICE_2, BIOS_LANGUAGE,
+                    END_OF_TABLE]) + '\n\n'
+
+
+class SplitDmidecodeDumpTest(unittest.TestCase):
+    def test_single_type(self):
+        self.assertEqual(micp_info.split_dmidecode_dump(DUMP, 'processor'),
+                         DMIDECODE_HEADER + '\n\n' + PROCESSOR + '\n')
+
+    def test_several_structures_in_dump_order(self):
+        self.assertEqual(micp_info.split_dmidecode_dump(DUMP, 'memory'),
+                         '\n\n'.join([DMIDECODE_HEADER, MEMORY_DEVICE_1, MEMORY_DEVICE_2]) + '\n')
+
+    def test_several_types(self):
+        # bios selects the DMI types 0 and 13
+        self.assertEqual(micp_info.split_dmidecode_dump(DUMP, 'bios'),
+                         '\n\n'.join([DMIDECODE_HEADER, BIOS, BIOS_LANGUAGE]) + '\n')
+
+    def test_no_structure(self):
+        self.assertEqual(micp_info.split_dmidecode_dump(DUMP, 'slot'),
+                         DMIDECODE_HEADER + '\n')
+
+    def test_every_keyword_is_parsed(self):
+        for keyword in micp_info.DMIDECODE_KEYWORD_TYPES:
+            result = micp_info.split_dmidecode_dump(DUMP, keyword)
+            self.assertTrue(result.startswith(DMIDECODE_HEADER))
+            self.assertFalse('End Of Table' in result)
+
+    def test_unknown_keyword(self):
+        self.assertRaises(KeyError, micp_info.split_dmidecode_dump, DUMP, 'unknown')
+
+
+class CpuinfoConnect(object):
+    """MPSSConnect of a self-boot node printing cpuinfo"""
+    cpuinfo = ''
+
+    def __init__(self, host):
+        pass
+
+    def get_offload_index(self):
+        return -1
+
+    def Popen(self, args, **kwargs):
+        return subprocess.Popen(['printf', '%s', CpuinfoConnect.cpuinfo],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+class DeviceSkuTest(unittest.TestCase):
+    def setUp(self):
+        self.connect = micp_connect.MPSSConnect
+        micp_connect.MPSSConnect = CpuinfoConnect
+
+    def tearDown(self):
+        micp_connect.MPSSConnect = self.connect
+
+    def test_remote_node(self):
+        CpuinfoConnect.cpuinfo = ('processor\t: 0\nmodel\t\t: 87\n'
+                                  'model name\t: Intel(R) Xeon Phi(TM) CPU 7250 @ 1.40GHz\n')
+        self.assertEqual(micp_info.device_sku('node1'), '7250')
+
+    def test_not_a_xeon_phi(self):
+        CpuinfoConnect.cpuinfo = 'model name\t: Intel(R) Xeon(R) CPU E5-2699 v4 @ 2.20GHz\n'
+        self.assertEqual(micp_info.device_sku('node1'), 'NotAvailable')
+
+
+
+class CountingInfo(micp_info.InfoKNXSB):
+    """InfoKNXSB counting the times the system information is collected"""
+    collected = 0
+
+    def __init__(self):
+        CountingInfo.collected += 1
+        self._devIdx = -1
+        self._micinfoDict = {'selfboot': {'CPU Model Name': 'Intel(R) Xeon Phi(TM) CPU 7250'}}
+        self._commandDict = {'env': 'HOME=/old', 'dmidecode': 'dmi'}
+
+    def _run_info_command(self, cmd):
+        return (cmd, 'HOME=/new', None)
+
+
+class InfoCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.cacheFile = os.path.join(self.tempDir, 'cache', 'info_cache.pkl')
+        self.bootIdFile = micp_info.INFO_BOOT_ID_FILE
+        micp_info.INFO_BOOT_ID_FILE = os.path.join(self.tempDir, 'boot_id')
+        self.set_boot_id('4a1c0b5e-first-boot')
+        self.environ = dict(os.environ)
+        os.environ['MIC_PERF_INFO_CACHE'] = self.cacheFile
+        CountingInfo.collected = 0
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        micp_info.INFO_BOOT_ID_FILE = self.bootIdFile
+        shutil.rmtree(self.tempDir)
+
+    def set_boot_id(self, bootId):
+        with open(micp_info.INFO_BOOT_ID_FILE, 'w') as fid:
+            fid.write(bootId + '\n')
+
+    def test_save_and_load(self):
+        self.assertEqual(micp_info.load_info_cache(), None)
+        micp_info.save_info_cache({'a': 1})
+        self.assertEqual(micp_info.load_info_cache(), {'a': 1})
+        micp_info.clear_info_cache()
+        self.assertEqual(micp_info.load_info_cache(), None)
+
+    def test_cache_is_dropped_after_a_reboot(self):
+        micp_info.save_info_cache({'a': 1})
+        self.set_boot_id('9d2e7f31-second-boot')
+        self.assertEqual(micp_info.load_info_cache(), None)
+
+    def test_no_cache_without_boot_id(self):
+        os.remove(micp_info.INFO_BOOT_ID_FILE)
+        micp_info.save_info_cache({'a': 1})
+        self.assertFalse(os.path.exists(self.cacheFile))
+        self.assertEqual(micp_info.load_info_cache(), None)
+
+    def test_from_cache(self):
+        info = CountingInfo.from_cache()
+        self.assertEqual(CountingInfo.collected, 1)
+        cached = CountingInfo.from_cache()
+        self.assertEqual(CountingInfo.collected, 1)
+        self.assertEqual(cached.mic_sku(), '7250')
+        # the volatile commands are run again, the others are restored
+        self.assertEqual(cached._commandDict, {'env': 'HOME=/new', 'dmidecode': 'dmi'})
+        self.assertEqual(info._commandDict['env'], 'HOME=/old')
+
+    def test_information_collected_again_after_a_reboot(self):
+        CountingInfo.from_cache()
+        self.set_boot_id('9d2e7f31-second-boot')
+        CountingInfo.from_cache()
+        self.assertEqual(CountingInfo.collected, 2)
+        # the new description is cached for the new boot
+        CountingInfo.from_cache()
+        self.assertEqual(CountingInfo.collected, 2)
+
+    def test_corrupt_cache(self):
+        CountingInfo.from_cache()
+        for content in ('not a pickle', ''):
+            with open(self.cacheFile, 'w') as fid:
+                fid.write(content)
+            self.assertEqual(micp_info.load_info_cache(), None)
+            info = CountingInfo.from_cache()
+            self.assertEqual(info.mic_sku(), '7250')
+        self.assertEqual(CountingInfo.collected, 3)
+        CountingInfo.from_cache()
+        self.assertEqual(CountingInfo.collected, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
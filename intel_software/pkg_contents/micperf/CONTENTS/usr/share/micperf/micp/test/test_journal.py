@@ -0,0 +1,128 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.journal: records of completed kernel executions read back
+when an interrupted sweep is resumed.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import micp.journal as micp_journal
+import micp.stats as micp_stats
+
+RUN_ARGS = {'kernelNames': 'sgemm', 'offMethod': 'local', 'paramCat': 'scaling',
+            'kernelArgs': None, 'devIdx': 0, 'repeat': 1, 'warmup': 0,
+            'outDir': '/ignored/by/the/journal'}
+
+
+def make_stats(value, desc='sgemm'):
+    return micp_stats.Stats('--n {0}'.format(value), desc,
+                            {'Computation.Avg': {'value': value, 'units': 'GFlops'}})
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.fileName = micp_journal.journal_file_name(
+            os.path.join(self.tempDir, 'micp_run_stats_test.pkl'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_file_name(self):
+        self.assertEqual(os.path.basename(self.fileName), 'micp_run_stats_test.journal')
+
+    def test_resume(self):
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.record('mic0', 'sgemm', 'local', 'n', '--n 1', [make_stats(1.0)])
+        journal.record('mic0', 'sgemm', 'local', 'n', '--n 2', [make_stats(2.0)])
+        journal.close()
+
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        self.assertEqual(journal.num_completed(), 2)
+        self.assertTrue(journal.is_completed('mic0', 'sgemm', 'local', '--n 1'))
+        self.assertFalse(journal.is_completed('mic1', 'sgemm', 'local', '--n 1'))
+        self.assertFalse(journal.is_completed('mic0', 'sgemm', 'local', '--n 3'))
+        # in the order of the parameters given, not of the records
+        completed = journal.completed_stats('mic0', 'sgemm', 'local',
+                                            ['--n 2', '--n 3', '--n 1'])
+        self.assertEqual([ss.perf['Computation.Avg']['value'] for ss in completed], [2.0, 1.0])
+        journal.close()
+
+    def test_thermal_tag_is_restored(self):
+        stats = make_stats(1.0)
+        stats.thermal = {'throttled': True, 'headroom': 2.0,
+                         'max_temperature': 83.0, 'fans_at_ceiling': True}
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.record(None, 'sgemm', 'local', 'n', '--n 1', [stats])
+        journal.close()
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        restored = journal.completed_stats(None, 'sgemm', 'local', ['--n 1'])
+        self.assertTrue(restored[0].is_thermally_throttled())
+        journal.close()
+
+    def test_records_appended_after_resume(self):
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.record(None, 'sgemm', 'local', 'n', '--n 1', [make_stats(1.0)])
+        journal.close()
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        journal.record(None, 'sgemm', 'local', 'n', '--n 2', [make_stats(2.0)])
+        journal.close()
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        self.assertEqual(journal.num_completed(), 2)
+        journal.close()
+
+    def test_truncated_record_is_ignored(self):
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.record(None, 'sgemm', 'local', 'n', '--n 1', [make_stats(1.0)])
+        journal.record(None, 'sgemm', 'local', 'n', '--n 2', [make_stats(2.0)])
+        journal.close()
+        # a crash in the middle of the last record
+        with open(self.fileName, 'r+b') as fid:
+            fid.truncate(os.path.getsize(self.fileName) - 10)
+
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        self.assertTrue(journal.is_completed(None, 'sgemm', 'local', '--n 1'))
+        self.assertFalse(journal.is_completed(None, 'sgemm', 'local', '--n 2'))
+        journal.record(None, 'sgemm', 'local', 'n', '--n 2', [make_stats(2.5)])
+        journal.close()
+
+        # the partial record was dropped, the new one can be read back
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        completed = journal.completed_stats(None, 'sgemm', 'local', ['--n 1', '--n 2'])
+        self.assertEqual([ss.perf['Computation.Avg']['value'] for ss in completed], [1.0, 2.5])
+        journal.close()
+
+    def test_different_arguments(self):
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.close()
+        otherArgs = dict(RUN_ARGS, paramCat='optimal')
+        self.assertRaises(micp_journal.JournalMismatchError,
+                          micp_journal.Journal, self.fileName, otherArgs, True)
+        # arguments that do not change the sweep are not compared
+        journal = micp_journal.Journal(self.fileName, dict(RUN_ARGS, outDir='/tmp'), resume=True)
+        journal.close()
+
+    def test_without_resume_the_journal_is_discarded(self):
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        journal.record(None, 'sgemm', 'local', 'n', '--n 1', [make_stats(1.0)])
+        journal.close()
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS)
+        self.assertEqual(journal.num_completed(), 0)
+        journal.close()
+        journal = micp_journal.Journal(self.fileName, RUN_ARGS, resume=True)
+        self.assertEqual(journal.num_completed(), 0)
+        journal.remove()
+        self.assertFalse(os.path.exists(self.fileName))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.model: statistical models fitted to the reference runs
+shipped with micperf.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import micp.stats as micp_stats
+import micp.model as micp_model
+import micp.common as micp_common
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+RUN_FILES = ['micp_run_stats_mcdram_7250_redhat-7.3_micperf-1.6.0_local_optimal.pkl',
+             'micp_run_stats_mcdram_7250_SuSE-12_micperf-1.6.0_local_optimal.pkl']
+GROUP = '7250/mcdram/quadrant'
+
+
+class FitPointTest(unittest.TestCase):
+    def test_outlier_does_not_widen_the_model(self):
+        point = micp_model.fit_point([100.0, 101.0, 99.0, 100.0, 1000.0])
+        self.assertEqual(point['count'], 5)
+        self.assertEqual(point['median'], 100.0)
+        self.assertEqual(point['mad'], 1.0)
+        self.assertAlmostEqual(point['robust_stdev'], 1.4826)
+        self.assertTrue(point['stdev'] > 100)
+
+    def test_equal_values(self):
+        # more than half of the values are equal, the MAD is 0
+        point = micp_model.fit_point([100.0, 100.0, 100.0, 104.0])
+        self.assertEqual(point['mad'], 0.0)
+        self.assertEqual(point['robust_stdev'], point['stdev'])
+
+
+class BuildModelTest(unittest.TestCase):
+    def setUp(self):
+        self.runs = [micp_stats.load_stats(os.path.join(DATA_DIR, fileName))
+                     for fileName in RUN_FILES]
+
+    def sgemm_point(self, model):
+        points = model['groups'][GROUP]['model']['sgemm']['local']
+        self.assertEqual(len(points), 1)
+        return points.values()[0]
+
+    def test_groups(self):
+        model = micp_model.build_model(self.runs, 2)
+        self.assertEqual(model['format'], micp_model.MODEL_FORMAT)
+        self.assertEqual(sorted(model['groups']), [GROUP])
+        self.assertEqual(model['groups'][GROUP]['runs'], sorted(run.tag for run in self.runs))
+        self.assertEqual(self.sgemm_point(model)['count'], 2)
+
+    def test_points_measured_by_less_runs_are_left_out(self):
+        model = micp_model.build_model(self.runs, 3)
+        self.assertEqual(model['groups'][GROUP]['model'], {})
+
+    def test_throttled_values_are_left_out(self):
+        offload = self.runs[1]._store['sgemm'].keys()[0]
+        throttled = self.runs[1]._store['sgemm'][offload][0]
+        throttled.thermal = {'throttled': True, 'headroom': 1.0,
+                             'max_temperature': 84.0, 'fans_at_ceiling': True}
+        model = micp_model.build_model(self.runs, 1)
+        point = self.sgemm_point(model)
+        self.assertEqual(point['count'], 1)
+        kept = self.runs[0]._store['sgemm'][self.runs[0]._store['sgemm'].keys()[0]][0]
+        self.assertEqual(point['median'], float(kept.perf[kept.perf.keys()[0]]['value']))
+        model = micp_model.build_model(self.runs, 2)
+        self.assertFalse('sgemm' in model['groups'][GROUP]['model'])
+
+    def test_repeated_runs_contribute_their_sample(self):
+        offload = self.runs[0]._store['sgemm'].keys()[0]
+        stat = self.runs[0]._store['sgemm'][offload][0]
+        tag = stat.perf.keys()[0]
+        stat.samples = {tag: [1.0, 2.0, 3.0]}
+        model = micp_model.build_model(self.runs, 1)
+        self.assertEqual(self.sgemm_point(model)['count'], 4)
+
+    def test_save_and_load(self):
+        tempDir = tempfile.mkdtemp()
+        isSelfboot = micp_common.is_selfboot_platform
+        micp_common.is_selfboot_platform = lambda: True
+        try:
+            fileName = os.path.join(tempDir, 'model.json')
+            micp_model.save_model(micp_model.build_model(self.runs, 2), fileName)
+            loaded = micp_model.load_model(fileName, self.runs[0].info)
+            point = self.sgemm_point(micp_model.build_model(self.runs, 2))
+            self.assertEqual(loaded['sgemm']['local'].values()[0],
+                             (point['median'], point['robust_stdev']))
+        finally:
+            micp_common.is_selfboot_platform = isSelfboot
+            shutil.rmtree(tempDir)
+
+    def test_load_errors(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'model.json')
+            self.assertRaises(micp_model.ModelError, micp_model.load_model, fileName, self.runs[0].info)
+            with open(fileName, 'w') as fid:
+                fid.write('{"format": 0}')
+            self.assertRaises(micp_model.ModelError, micp_model.load_model, fileName, self.runs[0].info)
+        finally:
+            shutil.rmtree(tempDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
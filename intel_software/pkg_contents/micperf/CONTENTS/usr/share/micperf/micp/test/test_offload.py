@@ -0,0 +1,228 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.offload: system on which the host side of a kernel runs,
+with connections recording the commands they start, and the output and
+timeout of the kernel processes.
+"""
+
+import os
+import sys
+import time
+import subprocess
+import unittest
+import StringIO
+
+import micp.connect as micp_connect
+import micp.info as micp_info
+import micp.offload as micp_offload
+
+
+class RecordingConnect(object):
+    """MPSSConnect starting the commands on this host, the host targeted
+    and the arguments of each command are recorded"""
+    commands = []
+    processes = []
+
+    def __init__(self, host):
+        self.host = host
+
+    def get_offload_index(self):
+        if self.host in ('localhost', '-1'):
+            return -1
+        return int(self.host.replace('mic', ''))
+
+    def Popen(self, args, **kwargs):
+        if type(args) is str:
+            args = args.split()
+        RecordingConnect.commands.append((self.host, list(args)))
+        kwargs.pop('env', None)
+        proc = micp_connect.LocalConnect().Popen(args, **kwargs)
+        RecordingConnect.processes.append(proc)
+        return proc
+
+
+class FakeInfo(object):
+    def __init__(self, *args):
+        pass
+
+    def is_in_sub_numa_cluster_mode(self):
+        return False
+
+
+class FakeParams(object):
+    def __init__(self, args):
+        self._args = args
+
+    def value_list(self):
+        return list(self._args)
+
+    def get_named(self, name):
+        raise NameError(name)
+
+    def __str__(self):
+        return ' '.join(self._args)
+
+
+class FakeKernel(object):
+    """kernel running a command of this host"""
+    def __init__(self, execPath):
+        self.name = 'fake'
+        self._execPath = execPath
+
+    def path_host_exec(self, offloadName):
+        return self._execPath
+
+    def is_mpi_required(self):
+        return False
+
+    def is_optimized_for_snc_mode(self):
+        return True
+
+    def device_param_name(self):
+        return 'device'
+
+    def param_type(self):
+        return 'value'
+
+    def param_for_env(self):
+        return []
+
+    def environment_host(self):
+        return {}
+
+    def get_process_modifiers(self):
+        return []
+
+    def get_fixed_args(self):
+        return []
+
+    def requires_root_access(self):
+        return False
+
+    def get_working_directory(self):
+        return None
+
+    def clean_up(self, hostParamFile, devParamFile, connect):
+        pass
+
+    def internal_scaling(self):
+        return False
+
+    def parse_desc(self, block):
+        return 'fake'
+
+    def parse_perf(self, block):
+        return {'Computation.Avg': {'value': block.strip(), 'units': 'GFlops'}}
+
+    def _ordering_key(self, stat):
+        return None
+
+
+class OffloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connect = micp_connect.MPSSConnect
+        self.info = micp_info.Info
+        micp_connect.MPSSConnect = RecordingConnect
+        micp_info.Info = FakeInfo
+        RecordingConnect.commands = []
+        RecordingConnect.processes = []
+        self.environ = dict(os.environ)
+        # the kernel output is printed
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.environ.clear()
+        os.environ.update(self.environ)
+        micp_connect.MPSSConnect = self.connect
+        micp_info.Info = self.info
+
+    def run_offload(self, offloadName, device, args, timeout=None, execPath='/bin/echo'):
+        offload = micp_offload.OffloadFactory().create(offloadName)
+        offload.set_timeout(timeout)
+        return offload.run(FakeKernel(execPath), device, [FakeParams(args)])
+
+    def hosts(self):
+        return [host for (host, args) in RecordingConnect.commands]
+
+
+class HostSideTest(OffloadTestCase):
+    def test_coi_runs_on_this_host(self):
+        for device in ('0', 'mic0'):
+            RecordingConnect.commands = []
+            stats = self.run_offload('coi', device, ['42'])
+            self.assertEqual(stats[0].perf['Computation.Avg']['value'], '42')
+            self.assertEqual(RecordingConnect.commands, [('localhost', ['/bin/echo', '42'])])
+
+    def test_other_host_offloads_run_on_this_host(self):
+        for offloadName in ('auto', 'pragma'):
+            RecordingConnect.commands = []
+            self.run_offload(offloadName, '0', ['1'])
+            self.assertEqual(self.hosts(), ['localhost'])
+
+    def test_local_offload_runs_on_the_target_node(self):
+        self.run_offload('local', 'node1', ['1'])
+        self.assertEqual(RecordingConnect.commands, [('node1', ['/bin/echo', '1'])])
+        RecordingConnect.commands = []
+        self.run_offload('local', 'localhost', ['1'])
+        self.assertEqual(self.hosts(), ['localhost'])
+
+
+
+class StreamEngineTest(unittest.TestCase):
+    def popen(self, script):
+        return subprocess.Popen(['sh', '-c', script], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_output_of_all_the_processes(self):
+        lines = []
+        engine = micp_offload.StreamEngine()
+        engine.add_process('dev', self.popen('echo dev; echo error >&2'))
+        engine.add_process('host', self.popen('printf "one\\ntwo"'),
+                           micp_offload._LineSink(lines.append))
+        output = engine.run('fake')
+        self.assertEqual(output, {'dev': ('dev\n', 'error\n'), 'host': ('one\ntwo', '')})
+        # the last line without end of line is given when the pipe is closed
+        self.assertEqual(lines, ['one\n', 'two\n'])
+
+    def test_timeout(self):
+        proc = self.popen('sleep 10')
+        engine = micp_offload.StreamEngine(0.2)
+        engine.add_process('host', proc)
+        start = time.time()
+        try:
+            self.assertRaises(micp_offload.KernelTimeoutError, engine.run, 'fake')
+            self.assertTrue(time.time() - start < 5)
+            # the process is left to the caller
+            self.assertEqual(proc.poll(), None)
+        finally:
+            proc.kill()
+            proc.wait()
+
+    def test_timeout_exit_code(self):
+        err = micp_offload.KernelTimeoutError('')
+        self.assertEqual(err.micp_exit_code(), micp_offload.micp_common.E_TIMEOUT)
+
+
+class KernelTimeoutTest(OffloadTestCase):
+    def test_timed_out_kernel_is_reaped(self):
+        with self.assertRaises(micp_offload.KernelTimeoutError) as context:
+            self.run_offload('local', 'localhost', ['10'], 0.2, '/bin/sleep')
+        self.assertEqual(context.exception.partialResult, [])
+        self.assertEqual(len(RecordingConnect.processes), 1)
+        self.assertEqual(RecordingConnect.processes[0].returncode, -9)
+
+    def test_kernel_within_the_timeout(self):
+        stats = self.run_offload('local', 'localhost', ['7'], 10)
+        self.assertEqual(stats[0].perf['Computation.Avg']['value'], '7')
+
+
+if __name__ == '__main__':
+    unittest.main()
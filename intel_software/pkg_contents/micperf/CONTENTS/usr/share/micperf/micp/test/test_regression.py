@@ -0,0 +1,241 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.regression: grouping of the compared values by Stats and
+the bulk computations, with NumPy when it is installed and on lists.
+"""
+
+import math
+import unittest
+
+import micp.stats as micp_stats
+import micp.regression as micp_regression
+
+NAN = float('nan')
+INF = float('inf')
+
+
+def make_stats(desc, values, rollup=None):
+    """Stats with a perf tag per entry of values, tags listed in rollup
+    are not rolled up"""
+    perf = {}
+    for (tag, value) in values.items():
+        perf[tag] = {'value': value, 'units': 'GFlops'}
+        if rollup and tag in rollup:
+            perf[tag]['rollup'] = False
+    return micp_stats.Stats('--desc ' + desc, desc, perf)
+
+
+class ListComputationTest(unittest.TestCase):
+    """computations on lists, NumPy is hidden"""
+    useNumpy = False
+
+    def setUp(self):
+        self.numpy = micp_regression.numpy
+        if self.useNumpy and self.numpy is None:
+            self.skipTest('NumPy is not installed')
+        if not self.useNumpy:
+            micp_regression.numpy = None
+        self.actual = [make_stats('small', {'Computation.Avg': 110.0, 'Time': 2.0}),
+                       None,
+                       make_stats('hidden', {'Log': 1.0}, rollup=['Log']),
+                       make_stats('large', {'Computation.Avg': 90.0, 'Log': 1.0}, rollup=['Log'])]
+        self.refs = [[make_stats('small', {'Computation.Avg': 100.0, 'Time': 2.5}),
+                      None, None,
+                      make_stats('large', {'Computation.Avg': 100.0})],
+                     [make_stats('small', {'Computation.Avg': 100.0, 'Time': 1.5}),
+                      None, None,
+                      make_stats('large', {'Computation.Avg': 80.0})]]
+        self.comparison = micp_regression.PerfComparison(
+            [('sgemm', 'local')],
+            lambda kernel, offload: self.actual,
+            [lambda kernel, offload, ref=ref: ref for ref in self.refs])
+
+    def tearDown(self):
+        micp_regression.numpy = self.numpy
+
+    def assertListAlmostEqual(self, first, second):
+        first = list(first)
+        self.assertEqual(len(first), len(second))
+        for (aa, bb) in zip(first, second):
+            if bb is None or (type(bb) is float and math.isnan(bb)):
+                self.assertTrue(aa is None or math.isnan(aa), '{0} != {1}'.format(first, second))
+            else:
+                self.assertAlmostEqual(aa, bb)
+
+    def test_groups(self):
+        # None entries and Stats without rolled up values have no group
+        self.assertEqual(self.comparison.num_groups(), 2)
+        self.assertEqual(len(self.comparison), 3)
+        self.assertEqual(self.comparison.group_key(0), ('sgemm', 'local', 'small'))
+        self.assertEqual(self.comparison.group_key(1), ('sgemm', 'local', 'large'))
+        self.assertEqual([key[2:] for key in self.comparison.keys],
+                         [(0, tag) for tag in self.actual[0].perf] + [(3, 'Computation.Avg')])
+
+    def test_relative_errors(self):
+        expected = {'Computation.Avg': 0.1, 'Time': 0.0}
+        self.assertListAlmostEqual(self.comparison.relative_errors(),
+            [expected[tag] for tag in self.actual[0].perf] + [0.0])
+
+    def test_time_is_better_when_lower(self):
+        comparison = micp_regression.PerfComparison([('sgemm', 'local')],
+            lambda kernel, offload: [make_stats('a', {'Time': 1.5})],
+            [lambda kernel, offload: [make_stats('a', {'Time': 2.0})]])
+        self.assertListAlmostEqual(comparison.relative_errors(), [0.25])
+
+    def test_ref_stats(self):
+        mean, stdev, count = self.comparison.ref_stats()
+        last = len(self.comparison) - 1
+        self.assertAlmostEqual(mean[last], 90.0)
+        self.assertAlmostEqual(stdev[last], math.sqrt(200.0))
+        self.assertEqual(int(count[last]), 2)
+
+    def test_missing_reference(self):
+        comparison = micp_regression.PerfComparison([('sgemm', 'local')],
+            lambda kernel, offload: [make_stats('a', {'Computation.Avg': 1.0}),
+                                     make_stats('b', {'Computation.Avg': 2.0})],
+            [lambda kernel, offload: [make_stats('a', {'Computation.Avg': 1.0})]])
+        __, stdev, count = comparison.ref_stats()
+        self.assertEqual([int(nn) for nn in count], [1, 0])
+        self.assertListAlmostEqual(stdev, [NAN, NAN])
+        self.assertListAlmostEqual(comparison.relative_errors(), [0.0, NAN])
+        self.assertListAlmostEqual(comparison.z_scores(), [NAN, NAN])
+        self.assertListAlmostEqual(comparison.confidence_intervals(), [NAN, NAN])
+
+    def test_z_scores_and_confidence_intervals(self):
+        last = len(self.comparison) - 1
+        self.assertAlmostEqual(self.comparison.z_scores()[last], 0.0)
+        self.assertAlmostEqual(self.comparison.confidence_intervals()[last],
+            micp_regression.t_quantile_95(1) * math.sqrt(200.0) / math.sqrt(2))
+
+    def test_group_min(self):
+        values = [0.5, -0.25, 0.125]
+        first = min(values[:2])
+        self.assertListAlmostEqual(self.comparison.group_min(values), [first, 0.125])
+        self.assertEqual(self.comparison.group_argmin(values), [1, 2])
+
+    def test_group_min_skips_values_that_are_not_finite(self):
+        self.assertListAlmostEqual(self.comparison.group_min([NAN, -INF, 0.5]), [NAN, 0.5])
+        self.assertEqual(self.comparison.group_argmin([NAN, -INF, 0.5]), [None, 2])
+        self.assertListAlmostEqual(self.comparison.group_min([NAN, 1.0, INF]), [1.0, NAN])
+        self.assertEqual(self.comparison.group_argmin([NAN, 1.0, INF]), [1, None])
+
+    def test_empty_comparison(self):
+        comparison = micp_regression.PerfComparison([], None, [])
+        self.assertEqual(comparison.num_groups(), 0)
+        self.assertEqual(comparison.group_min([]), [])
+        self.assertEqual(comparison.group_argmin([]), [])
+
+
+class NumpyComputationTest(ListComputationTest):
+    """the same computations with NumPy"""
+    useNumpy = True
+
+
+class RobustStatisticsTest(unittest.TestCase):
+    def test_median(self):
+        self.assertEqual(micp_regression.median([3.0, 1.0, 2.0]), 2.0)
+        self.assertEqual(micp_regression.median([4.0, 1.0, 3.0, 2.0]), 2.5)
+        self.assertTrue(math.isnan(micp_regression.median([])))
+
+    def test_median_abs_deviation(self):
+        # deviations 1, 1, 0, 1, 97 from the median 2
+        self.assertEqual(micp_regression.median_abs_deviation([1.0, 3.0, 2.0, 1.0, 99.0]), 1.0)
+
+    def test_median_confidence_interval_ranks(self):
+        # ranks of the order statistics of the distribution free 95% interval
+        for (size, low, high) in ((10, 2, 9), (20, 6, 15), (100, 40, 61)):
+            values = [float(vv) for vv in range(size, 0, -1)]
+            self.assertEqual(micp_regression.median_confidence_interval(values),
+                             (float(low), float(high)))
+
+    def test_median_confidence_interval_small_samples(self):
+        # below 6 values the interval is the range of the values
+        self.assertEqual(micp_regression.median_confidence_interval([2.0, 1.0, 3.0]), (1.0, 3.0))
+        self.assertEqual(micp_regression.median_confidence_interval([2.0]), (2.0, 2.0))
+        low, high = micp_regression.median_confidence_interval([])
+        self.assertTrue(math.isnan(low) and math.isnan(high))
+
+    def test_median_confidence_interval_large_samples(self):
+        # normal approximation of the binomial distribution above 100 values
+        values = [float(vv) for vv in range(1, 402)]
+        # rank floor((401 - 1.96 * sqrt(401)) / 2) = 180
+        self.assertEqual(micp_regression.median_confidence_interval(values), (180.0, 222.0))
+
+    def test_t_quantile(self):
+        self.assertEqual(micp_regression.t_quantile_95(1), 12.706)
+        self.assertEqual(micp_regression.t_quantile_95(1000), 1.960)
+        self.assertTrue(math.isnan(micp_regression.t_quantile_95(0)))
+
+
+class SignificantErrorsTest(unittest.TestCase):
+    """relative errors of repeated runs given by the confidence interval
+    of their median, with NumPy when it is installed and on lists"""
+    def significant_errors(self, sample, refValue, tag='Computation.Avg'):
+        stats = make_stats('a', {tag: micp_regression.median(sample)})
+        stats.samples = {tag: sample}
+        comparison = micp_regression.PerfComparison([('sgemm', 'local')],
+            lambda kernel, offload: [stats],
+            [lambda kernel, offload: [make_stats('a', {tag: refValue})]])
+        result = list(comparison.significant_errors())
+        numpy = micp_regression.numpy
+        if numpy is not None:
+            micp_regression.numpy = None
+            try:
+                listComparison = micp_regression.PerfComparison([('sgemm', 'local')],
+                    lambda kernel, offload: [stats],
+                    [lambda kernel, offload: [make_stats('a', {tag: refValue})]])
+                self.assertAlmostEqual(listComparison.significant_errors()[0], result[0])
+            finally:
+                micp_regression.numpy = numpy
+        return result[0]
+
+    def test_reference_inside_the_interval(self):
+        self.assertEqual(self.significant_errors([90.0, 95.0, 100.0, 105.0, 110.0], 97.0), 0.0)
+
+    def test_regression_beyond_the_interval(self):
+        # the end of the interval closest to the reference
+        self.assertAlmostEqual(self.significant_errors([90.0, 92.0, 94.0, 96.0, 98.0], 100.0), -0.02)
+
+    def test_improvement_beyond_the_interval(self):
+        self.assertAlmostEqual(self.significant_errors([110.0, 112.0, 114.0], 100.0), 0.1)
+
+    def test_time_improvement(self):
+        self.assertAlmostEqual(self.significant_errors([1.0, 1.5, 1.8], 2.0, 'Time'), 0.1)
+
+    def test_single_run(self):
+        stats = make_stats('a', {'Computation.Avg': 90.0})
+        comparison = micp_regression.PerfComparison([('sgemm', 'local')],
+            lambda kernel, offload: [stats],
+            [lambda kernel, offload: [make_stats('a', {'Computation.Avg': 100.0})]])
+        self.assertAlmostEqual(list(comparison.significant_errors())[0], -0.1)
+
+
+class ModelComparisonTest(unittest.TestCase):
+    def test_band(self):
+        model = {'sgemm': {'local': {'a': (100.0, 5.0), 'b': (100.0, 5.0), 'c': (100.0, 5.0)}}}
+        stats = [make_stats('a', {'Computation.Avg': 100.0}),
+                 make_stats('b', {'Computation.Avg': 80.0}),
+                 make_stats('c', {'Computation.Avg': 230.0})]
+        result = micp_regression.model_comparison(stats, model, [('sgemm', 'local')] * 3)
+        self.assertEqual(result[0], None)
+        self.assertAlmostEqual(result[1], (80.0 - 85.0) / 85.0)
+        self.assertAlmostEqual(result[2], (230.0 - 115.0) / 115.0)
+
+    def test_missing_entry(self):
+        model = {'sgemm': {'local': {'a': (100.0, 5.0)}}}
+        self.assertTrue(micp_regression.has_model_entry(model, 'sgemm', 'local', 'a'))
+        self.assertFalse(micp_regression.has_model_entry(model, 'sgemm', 'local', 'b'))
+        self.assertFalse(micp_regression.has_model_entry(model, 'dgemm', 'local', 'a'))
+        self.assertFalse(micp_regression.has_model_entry({}, 'sgemm', 'local', 'a'))
+        self.assertRaises(KeyError, micp_regression.model_comparison,
+                          [make_stats('b', {'Computation.Avg': 1.0})], model, [('sgemm', 'local')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.resultsdb: indexing of the reference pickle files shipped
+with micperf, refresh after files are added, modified or removed, and
+the stats of a kernel read from the index.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import micp.stats as micp_stats
+import micp.resultsdb as micp_resultsdb
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+SCALING_TAG = 'mcdram_7250_redhat-7.3_micperf-1.6.0_local_scaling'
+OPTIMAL_TAG = 'mcdram_7290_redhat-7.3_micperf-1.6.0_local_optimal'
+
+
+def pickle_name(tag):
+    return 'micp_run_stats_' + tag + '.pkl'
+
+
+class ResultsDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        for tag in (SCALING_TAG, OPTIMAL_TAG):
+            shutil.copy2(os.path.join(DATA_DIR, pickle_name(tag)), self.tempDir)
+        self.database = micp_resultsdb.open_results_db(self.tempDir, self.pickle_files())
+        self.assertNotEqual(self.database, None)
+
+    def tearDown(self):
+        if self.database is not None:
+            self.database.close()
+        shutil.rmtree(self.tempDir)
+
+    def pickle_files(self):
+        return dict((fileName[15:-4], os.path.join(self.tempDir, fileName))
+                    for fileName in os.listdir(self.tempDir) if fileName.endswith('.pkl'))
+
+    def test_runs(self):
+        runs = self.database.runs()
+        self.assertEqual([run['tag'] for run in runs], [OPTIMAL_TAG, SCALING_TAG])
+        self.assertEqual(runs[1]['sku'], '7250')
+        self.assertEqual(runs[1]['param_cat'], 'scaling')
+        self.assertEqual([run['tag'] for run in self.database.runs(sku_key=runs[0]['sku_key'])],
+                         [OPTIMAL_TAG])
+        self.assertEqual(self.database.runs(kernel='no_such_kernel'), [])
+        self.assertRaises(NameError, self.database.runs, no_such_column='')
+
+    def test_kernel_stats(self):
+        statsColl = micp_stats.load_stats(os.path.join(self.tempDir, pickle_name(SCALING_TAG)))
+        for kernel in statsColl._store:
+            indexed = self.database.kernel_stats(SCALING_TAG, kernel)
+            self.assertEqual(sorted(indexed), sorted(statsColl._store[kernel]))
+            for offload in indexed:
+                for (stat, stored) in zip(indexed[offload], statsColl._store[kernel][offload]):
+                    self.assertEqual(stat.desc, stored.desc)
+                    self.assertEqual(stat.perf, stored.perf)
+                    self.assertEqual(str(stat.params), str(stored.params))
+                    self.assertEqual(stat.csv(), stored.csv())
+                self.assertEqual(len(indexed[offload]), len(statsColl._store[kernel][offload]))
+        self.assertEqual(self.database.kernel_stats(SCALING_TAG, 'no_such_kernel'), {})
+
+    def test_named_params(self):
+        statsColl = micp_stats.load_stats(os.path.join(self.tempDir, pickle_name(SCALING_TAG)))
+        offload = statsColl._store['sgemm'].keys()[0]
+        stored = statsColl._store['sgemm'][offload][0]
+        stat = self.database.kernel_stats(SCALING_TAG, 'sgemm')[offload][0]
+        self.assertEqual(stat.params.get_named('K_size'), stored.params.get_named('K_size'))
+        self.assertRaises(NameError, stat.params.get_named, 'no_such_param')
+
+    def test_refresh_removes_deleted_files(self):
+        os.remove(os.path.join(self.tempDir, pickle_name(OPTIMAL_TAG)))
+        self.database.refresh(self.pickle_files())
+        self.assertEqual([run['tag'] for run in self.database.runs()], [SCALING_TAG])
+        self.assertEqual(self.database.kernel_stats(OPTIMAL_TAG, 'sgemm'), {})
+
+    def test_refresh_indexes_modified_files(self):
+        # the optimal run replaced by the scaling run under the same tag
+        fileName = os.path.join(self.tempDir, pickle_name(OPTIMAL_TAG))
+        shutil.copy(os.path.join(self.tempDir, pickle_name(SCALING_TAG)), fileName)
+        mtime = os.path.getmtime(fileName) + 10
+        os.utime(fileName, (mtime, mtime))
+        self.database.refresh(self.pickle_files())
+        self.assertEqual(self.database.runs(tag=OPTIMAL_TAG)[0]['param_cat'], 'scaling')
+        self.assertEqual(
+            [ss.desc for ss in sum(self.database.kernel_stats(OPTIMAL_TAG, 'sgemm').values(), [])],
+            [ss.desc for ss in sum(self.database.kernel_stats(SCALING_TAG, 'sgemm').values(), [])])
+
+    def test_refresh_adds_new_and_unreadable_files(self):
+        with open(os.path.join(self.tempDir, pickle_name('broken')), 'w') as fid:
+            fid.write('not a pickle')
+        self.database.refresh(self.pickle_files())
+        broken = self.database.runs(tag='broken')
+        self.assertEqual(len(broken), 1)
+        self.assertEqual(broken[0]['sku'], None)
+        self.assertEqual(self.database.kernel_stats('broken', 'sgemm'), {})
+
+    def test_indexing_failure_disables_the_index(self):
+        def fail(*args):
+            raise TypeError('not JSON serializable')
+        add = micp_resultsdb.ResultsDatabase.add
+        micp_resultsdb.ResultsDatabase.add = fail
+        try:
+            # a new file has to be indexed
+            shutil.copy(os.path.join(DATA_DIR, pickle_name('mcdram_7210_redhat-7.3_micperf-1.6.0_local_optimal')),
+                        self.tempDir)
+            self.assertEqual(micp_resultsdb.open_results_db(self.tempDir, self.pickle_files()), None)
+        finally:
+            micp_resultsdb.ResultsDatabase.add = add
+
+
+class StoreKernelStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        shutil.copy2(os.path.join(DATA_DIR, pickle_name(SCALING_TAG)), self.tempDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_same_stats_with_and_without_index(self):
+        store = micp_stats.StatsCollectionStore(self.tempDir)
+        self.assertNotEqual(store._db, None)
+        indexed = store.get_kernel_stats(SCALING_TAG, 'sgemm')
+        store._db = None
+        loaded = store.get_kernel_stats(SCALING_TAG, 'sgemm')
+        self.assertEqual(sorted(indexed), sorted(loaded))
+        for offload in indexed:
+            self.assertEqual([ss.csv() for ss in indexed[offload]],
+                             [ss.csv() for ss in loaded[offload]])
+        self.assertEqual(store.get_kernel_stats('no_such_tag', 'sgemm'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
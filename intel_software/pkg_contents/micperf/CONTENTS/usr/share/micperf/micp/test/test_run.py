@@ -0,0 +1,62 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.run: list of devices of a multi-device run and the check
+of their SKU before the results are stored.
+"""
+
+import unittest
+
+import micp.info as micp_info
+import micp.run as micp_run
+
+
+class FakeInfo(object):
+    def __init__(self, sku):
+        self._sku = sku
+
+    def mic_sku(self):
+        return self._sku
+
+
+class DeviceListTest(unittest.TestCase):
+    def test_device_list(self):
+        self.assertEqual(micp_run.device_list('node1, node2,'), ['node1', 'node2'])
+        self.assertEqual(micp_run.device_list(0), ['0'])
+        self.assertEqual(micp_run.device_list([0, 'mic1']), ['0', 'mic1'])
+
+
+class CheckDeviceSkusTest(unittest.TestCase):
+    def setUp(self):
+        self.deviceSku = micp_info.device_sku
+        self.skus = {'node1': '7250', 'node2': '7250', 'node3': '7210'}
+        micp_info.device_sku = lambda device: self.skus[device]
+
+    def tearDown(self):
+        micp_info.device_sku = self.deviceSku
+
+    def test_same_sku(self):
+        micp_run.check_device_skus(['node1', 'node2'], FakeInfo('7250'))
+
+    def test_qs_parts_have_the_sku_of_the_production_parts(self):
+        micp_run.check_device_skus(['node1'], FakeInfo('7250QS'))
+
+    def test_mixed_skus(self):
+        with self.assertRaises(micp_run.MixedSkuError) as context:
+            micp_run.check_device_skus(['node1', 'node3'], FakeInfo('7250'))
+        self.assertTrue('node3 (7210)' in str(context.exception))
+        self.assertFalse('node1' in str(context.exception))
+
+    def test_sku_of_the_stored_system(self):
+        # the devices agree with each other but not with this system
+        self.assertRaises(micp_run.MixedSkuError, micp_run.check_device_skus,
+                          ['node1', 'node2'], FakeInfo('7210'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#  Copyright 2012-2017, Intel Corporation, All Rights Reserved.
+#
+# This software is supplied under the terms of a license
+# agreement or nondisclosure agreement with Intel Corp.
+# and may not be copied or disclosed except in accordance
+# with the terms of that agreement.
+#
+"""
+Tests of micp.stats: merge of the Stats of repeated kernel executions
+and the robust statistics of their samples.
+"""
+
+import unittest
+
+import micp.stats as micp_stats
+
+
+def make_run(*values):
+    """Stats of one kernel execution, one per value (GFlops, Time)"""
+    return [micp_stats.Stats('--n {0}'.format(position), 'point {0}'.format(position),
+                             {'Computation.Avg': {'value': str(gflops), 'units': 'GFlops'},
+                              'Time': {'value': time, 'units': 'sec', 'rollup': False}})
+            for (position, (gflops, time)) in enumerate(values)]
+
+
+class MergeRepeatsTest(unittest.TestCase):
+    def test_median_and_sample(self):
+        runs = [make_run((100.0, 3.0), (10.0, 1.0)),
+                make_run((120.0, 1.0), (30.0, 2.0)),
+                make_run((90.0, 2.0), (20.0, 9.0))]
+        merged = micp_stats.merge_repeats(runs)
+        self.assertEqual(len(merged), 2)
+        # the Stats of the first execution are kept
+        self.assertTrue(merged[0] is runs[0][0])
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], 100.0)
+        self.assertEqual(merged[0].perf['Time']['value'], 2.0)
+        self.assertEqual(merged[1].perf['Computation.Avg']['value'], 20.0)
+        self.assertEqual(merged[0].sample('Computation.Avg'), [100.0, 120.0, 90.0])
+        self.assertEqual(merged[1].sample('Time'), [1.0, 2.0, 9.0])
+        self.assertEqual(merged[0].perf['Time']['units'], 'sec')
+        self.assertFalse(merged[0].perf['Time']['rollup'])
+
+    def test_even_number_of_runs(self):
+        merged = micp_stats.merge_repeats([make_run((100.0, 1.0)), make_run((110.0, 2.0))])
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], 105.0)
+
+    def test_single_run_is_unchanged(self):
+        run = make_run((100.0, 1.0))
+        merged = micp_stats.merge_repeats([run])
+        self.assertTrue(merged is run)
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], '100.0')
+        self.assertEqual(merged[0].sample('Computation.Avg'), None)
+        self.assertEqual(merged[0].mad('Computation.Avg'), None)
+        self.assertEqual(merged[0].confidence_interval('Computation.Avg'), None)
+
+    def test_empty_runs_are_ignored(self):
+        self.assertEqual(micp_stats.merge_repeats([]), [])
+        self.assertEqual(micp_stats.merge_repeats([[], []]), [])
+        merged = micp_stats.merge_repeats([[], make_run((100.0, 1.0)), make_run((80.0, 2.0))])
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], 90.0)
+
+    def test_value_missing_in_a_run(self):
+        # a tag missing or not numeric in one of the runs is not merged
+        runs = [make_run((100.0, 1.0)), make_run((110.0, 'n/a')), make_run((120.0, 3.0))]
+        del runs[1][0].perf['Computation.Avg']
+        merged = micp_stats.merge_repeats(runs)
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], '100.0')
+        self.assertEqual(merged[0].perf['Time']['value'], 1.0)
+        self.assertEqual(merged[0].samples, {})
+
+    def test_shorter_run(self):
+        runs = [make_run((100.0, 1.0), (10.0, 1.0)), make_run((120.0, 1.0)), make_run((110.0, 1.0), (30.0, 1.0))]
+        merged = micp_stats.merge_repeats(runs)
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], 110.0)
+        self.assertEqual(merged[1].perf['Computation.Avg']['value'], '10.0')
+        self.assertEqual(merged[1].sample('Computation.Avg'), None)
+
+    def test_robust_statistics_of_the_sample(self):
+        values = [(vv, 1.0) for vv in (100.0, 101.0, 99.0, 100.0, 500.0, 98.0, 102.0)]
+        merged = micp_stats.merge_repeats([make_run(vv) for vv in values])
+        # the outlier does not move the median
+        self.assertEqual(merged[0].perf['Computation.Avg']['value'], 100.0)
+        self.assertEqual(merged[0].mad('Computation.Avg'), 1.0)
+        self.assertEqual(merged[0].confidence_interval('Computation.Avg'), (98.0, 500.0))
+
+
+if __name__ == '__main__':
+    unittest.main()